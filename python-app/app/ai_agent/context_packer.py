@@ -0,0 +1,130 @@
+"""Token-budgeted context assembly for RAG prompts.
+
+Retrieved chunks are packed best first into a fixed token budget counted with
+tiktoken. The splitter overlaps neighbouring chunks by up to CHUNK_OVERLAP
+characters, so text a chunk shares with one already packed is trimmed first,
+and a chunk with nothing new left is dropped.
+"""
+import logging
+import os
+import threading
+
+# Tokens of retrieved policy text allowed in one prompt
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+# Chunks retrieved per question for the packer to choose from
+RAG_CONTEXT_CANDIDATES = int(os.getenv("RAG_CONTEXT_CANDIDATES", "6"))
+# Tokens of form content sent to /check-form; longer forms are truncated
+CHECK_FORM_MAX_TOKENS = int(os.getenv("CHECK_FORM_MAX_TOKENS", "6000"))
+
+# Model whose tokenizer is used for counting
+TOKENIZER_MODEL = "gpt-3.5-turbo"
+# Shared text shorter than this is treated as coincidence rather than splitter overlap
+MIN_OVERLAP_CHARS = 20
+PASSAGE_SEPARATOR = "\n\n"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+class _ApproximateEncoding:
+    """Stand-in used when the tiktoken encoding cannot be loaded: about four characters per token."""
+
+    name = 'approximate'
+
+    def encode(self, text):
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens):
+        return ''.join(tokens)
+
+
+def get_encoding():
+    """The tiktoken encoding for TOKENIZER_MODEL, loaded once per process."""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+            except Exception as e:
+                # tiktoken downloads its BPE files on first use; offline hosts fall back to an estimate
+                logging.warning(f"[CONTEXT] Could not load the {TOKENIZER_MODEL} tokenizer ({e}); "
+                                f"estimating token counts from text length")
+                _encoding = _ApproximateEncoding()
+        return _encoding
+
+def count_tokens(text, encoding=None):
+    return len((encoding or get_encoding()).encode(text))
+
+def truncate_to_tokens(text, max_tokens, encoding=None):
+    """Return text cut down to at most max_tokens tokens."""
+    encoding = encoding or get_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max(0, max_tokens)])
+
+def _overlap(head, tail):
+    """Length of the longest suffix of head that is also a prefix of tail."""
+    for size in range(min(len(head), len(tail)), MIN_OVERLAP_CHARS - 1, -1):
+        if head.endswith(tail[:size]):
+            return size
+    return 0
+
+def remove_overlap(text, packed):
+    """Strip from text any span it shares with the already packed passages; may return ''."""
+    for other in packed:
+        if text in other:
+            return ''
+        size = _overlap(other, text)
+        if size:
+            text = text[size:]
+        size = _overlap(text, other)
+        if size:
+            text = text[:-size]
+    return text.strip()
+
+
+class PackedContext:
+    """Prompt context built by `pack_context`."""
+
+    def __init__(self, text, docs, tokens, dropped):
+        self.text = text
+        self.docs = docs          # source chunks that contributed, best first
+        self.tokens = tokens
+        self.dropped = dropped    # candidates left out (duplicate or over budget)
+
+    def __bool__(self):
+        return bool(self.docs)
+
+
+def pack_context(docs, budget=None, encoding=None):
+    """Pack ranked chunks (best first) into at most `budget` tokens.
+
+    Passages keep their rank order. A passage that does not fit is skipped
+    in favour of shorter, lower-ranked ones, except that the best passage is
+    truncated rather than dropped, so a non-empty input never gives an empty
+    context.
+    """
+    budget = RAG_CONTEXT_TOKENS if budget is None else budget
+    encoding = encoding or get_encoding()
+    separator_tokens = count_tokens(PASSAGE_SEPARATOR, encoding)
+    passages, used, used_tokens = [], [], 0
+    for doc in docs:
+        # Overlap only occurs between neighbouring chunks of the same document
+        same_source = [text for text, packed_doc in zip(passages, used)
+                       if packed_doc.metadata.get('source') == doc.metadata.get('source')]
+        text = remove_overlap(doc.page_content.strip(), same_source)
+        if not text:
+            continue
+        cost = count_tokens(text, encoding) + (separator_tokens if passages else 0)
+        if used_tokens + cost > budget:
+            if passages:
+                continue
+            text = truncate_to_tokens(text, budget, encoding)
+            cost = count_tokens(text, encoding)
+        passages.append(text)
+        used.append(doc)
+        used_tokens += cost
+    logging.info(f"[CONTEXT] Packed {len(used)} of {len(docs)} chunks into {used_tokens}/{budget} tokens")
+    return PackedContext(PASSAGE_SEPARATOR.join(passages), used, used_tokens, len(docs) - len(used))
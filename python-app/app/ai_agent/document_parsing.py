@@ -0,0 +1,158 @@
+"""Parallel document parsing for ingestion.
+
+PDF text extraction is CPU-bound and holds the GIL, so `parse_documents` fans
+files out across a process pool. Each file gets its own timeout: a worker that
+hangs on a corrupt document is killed and that file alone is reported as
+failed, while the remaining files carry on in a fresh pool.
+"""
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Parser processes; 0 parses in the calling process (no timeouts)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Seconds a single file may take to load and split before it is abandoned
+PARSE_TIMEOUT_SECONDS = float(os.getenv("PARSE_TIMEOUT_SECONDS", "120"))
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+class ParseTimeout(Exception):
+    """Raised (as a result, not thrown) for a file that exceeded its timeout."""
+
+
+def get_loader(p):
+    logging.info(f"Loading file: {p}")
+    try:
+        if p.endswith(".pdf"):
+            return PyPDFLoader(p)
+        elif p.endswith(".docx"):
+            return Docx2txtLoader(p)
+        elif p.endswith(".txt"):
+            return TextLoader(p)
+        return None
+    except Exception as e:
+        logging.error(f"Error creating loader for {p}: {e}")
+        return None
+
+def iter_document_chunks(file_path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Yield the chunks of one file, loading and splitting a page at a time."""
+    loader = get_loader(file_path)
+    if loader is None:
+        raise ValueError(f"Unsupported file type: {file_path}")
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for page in loader.lazy_load():
+        page.metadata.setdefault('source', file_path)
+        yield from splitter.split_documents([page])
+
+def parse_document(file_path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Load one file and split it into chunks. Runs inside a parser process."""
+    return list(iter_document_chunks(file_path, chunk_size, chunk_overlap))
+
+def pool_context():
+    """Multiprocessing context for parser worker processes (also used by evidence_text)."""
+    # Forking a process that runs Flask and embedding threads can copy held
+    # locks into the child, so never use plain fork for parser workers.
+    # Workers still re-import the parent's __main__, which is why the server
+    # starts from the side-effect-free server.py rather than main.py.
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    # Preload the parser modules, not __main__, in the fork server
+    context.set_forkserver_preload(['document_parsing', 'evidence_text'])
+    return context
+
+def _kill_pool(pool):
+    for process in list((getattr(pool, '_processes', None) or {}).values()):
+        if process.is_alive():
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_documents(file_paths, workers=None, timeout=None, parse=parse_document):
+    """Parse files in parallel, yielding (file_path, chunks, error) as each finishes.
+
+    Exactly one of `chunks` and `error` is None. Results arrive in completion
+    order. A file that raises, crashes its worker or exceeds `timeout` seconds
+    yields an error without affecting the others.
+    """
+    workers = PARSE_WORKERS if workers is None else workers
+    timeout = PARSE_TIMEOUT_SECONDS if timeout is None else timeout
+    file_paths = list(file_paths)
+
+    if workers <= 0 or not file_paths:
+        for file_path in file_paths:
+            try:
+                yield file_path, parse(file_path), None
+            except Exception as e:
+                yield file_path, None, e
+        return
+
+    workers = min(workers, len(file_paths))
+    queue = list(reversed(file_paths))
+    retried = set()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context())
+    running = {}  # future -> (file_path, started_at)
+    try:
+        while queue or running:
+            # Keep no more files in flight than there are workers, so a file's
+            # timeout starts roughly when a worker picks it up.
+            while queue and len(running) < workers:
+                file_path = queue.pop()
+                running[pool.submit(parse, file_path)] = (file_path, time.monotonic())
+
+            next_deadline = min(started for _, started in running.values()) + timeout
+            wait(running, timeout=max(0.0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+
+            results, broken = [], False
+            now = time.monotonic()
+            # Everything finished by now counts as done, however long it took
+            for future in [f for f in running if f.done()]:
+                file_path, _ = running.pop(future)
+                try:
+                    results.append((file_path, future.result(), None))
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. a crash in a native parser). We cannot tell
+                    # which file caused it, so give each affected file one more try.
+                    broken = True
+                    if file_path in retried:
+                        results.append((file_path, None, e))
+                    else:
+                        retried.add(file_path)
+                        queue.append(file_path)
+                except Exception as e:
+                    results.append((file_path, None, e))
+
+            expired = [f for f, (_, started) in running.items() if now - started >= timeout]
+            if expired or broken:
+                for future in expired:
+                    file_path, _ = running.pop(future)
+                    logging.error(f"[PARSE] Timed out after {timeout:.0f}s parsing {file_path}")
+                    results.append((file_path, None, ParseTimeout(f"Parsing took longer than {timeout:.0f}s")))
+                # The pool cannot cancel a running task, so replace it and requeue
+                # the files that were still in flight.
+                queue.extend(file_path for file_path, _ in running.values())
+                running.clear()
+                _kill_pool(pool)
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context())
+
+            for result in results:
+                suspended = time.monotonic()
+                yield result
+                # Time the caller spends on a result (e.g. embedding it) is not
+                # charged to the files still being parsed
+                paused = time.monotonic() - suspended
+                running = {future: (file_path, started + paused)
+                           for future, (file_path, started) in running.items()}
+    finally:
+        if running:
+            _kill_pool(pool)
+        else:
+            pool.shutdown(wait=True)
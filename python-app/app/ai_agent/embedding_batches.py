@@ -0,0 +1,136 @@
+"""Batched, concurrent embedding with rate-limit-aware scheduling.
+
+`BatchEmbedder` splits texts into provider-sized batches and keeps several
+embedding requests in flight. When the provider answers with a rate limit
+(HTTP 429) the batch is retried with backoff and the number of concurrent
+requests is halved; it grows back by one after a run of successful requests.
+One throttled batch therefore slows ingestion down instead of failing it.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Texts per embedding request; OpenAI accepts up to 2048 inputs per call
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+# Upper bound on embedding requests in flight at once
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+# Retries per batch after a rate-limit response
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+
+def is_rate_limit_error(exc):
+    """True if the exception looks like a provider rate-limit (429) response."""
+    if getattr(exc, 'status_code', None) == 429 or getattr(exc, 'http_status', None) == 429:
+        return True
+    if type(exc).__name__ == 'RateLimitError':
+        return True
+    message = str(exc).lower()
+    return '429' in message or 'rate limit' in message
+
+def retry_after_seconds(exc):
+    """Read a Retry-After header from the error's response, if it has one."""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that halves on rate limits and grows back on success."""
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, success):
+        with self._condition:
+            self.in_flight -= 1
+            if success:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def throttle(self):
+        with self._condition:
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+            logging.warning(f"[EMBED] Rate limited; reducing embedding concurrency to {self.limit}")
+
+
+class BatchEmbedder:
+    """Embeds texts in batches with bounded, adaptive concurrency."""
+
+    def __init__(self, embeddings, batch_size=None, max_concurrency=None, max_retries=None,
+                 base_delay=1.0, max_delay=60.0, sleep=time.sleep):
+        self.embeddings = embeddings
+        self.batch_size = batch_size or EMBED_BATCH_SIZE
+        self.max_concurrency = max_concurrency or EMBED_MAX_CONCURRENCY
+        self.max_retries = EMBED_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.limiter = AdaptiveLimiter(self.max_concurrency)
+
+    def embed_batches(self, texts):
+        """Yield (start_index, vectors) for each batch as soon as it is embedded.
+
+        Batches may complete out of order; `start_index` locates them in `texts`.
+        """
+        batches = [(start, texts[start:start + self.batch_size])
+                   for start in range(0, len(texts), self.batch_size)]
+        if not batches:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches)),
+                                thread_name_prefix='embed') as pool:
+            futures = {pool.submit(self._embed_with_retry, batch): start for start, batch in batches}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def embed(self, texts):
+        """Embed all texts and return the vectors in input order."""
+        vectors = [None] * len(texts)
+        for start, batch_vectors in self.embed_batches(texts):
+            vectors[start:start + len(batch_vectors)] = batch_vectors
+        return vectors
+
+    def _embed_with_retry(self, batch):
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                vectors = self.embeddings.embed_documents(batch)
+            except Exception as e:
+                self.limiter.release(success=False)
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                self.limiter.throttle()
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = min(self.max_delay, self.base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+                attempt += 1
+                logging.warning(f"[EMBED] Batch of {len(batch)} rate limited; retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                self.sleep(delay)
+                continue
+            self.limiter.release(success=True)
+            return vectors
@@ -0,0 +1,212 @@
+"""Persistent on-disk embedding cache shared by ingestion and queries.
+
+`CachedEmbeddings` wraps any LangChain embeddings object. Vectors are stored in
+SQLite, keyed by the model name plus a SHA-256 of the text, so re-embedding
+unchanged chunks during a rebuild, or a repeated query, makes no API call.
+The least recently used entries are evicted once the cache exceeds its size
+limit.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+EMBED_CACHE_PATH = os.getenv(
+    "EMBED_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3")
+)
+# Evict least recently used vectors once the stored vectors exceed this size
+EMBED_CACHE_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", "512"))
+
+
+def embedding_model_name(embeddings):
+    """Best-effort identifier of the model behind an embeddings object."""
+    for attr in ('model', 'model_name'):
+        value = getattr(embeddings, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return type(embeddings).__name__
+
+
+def embed_queries(embeddings, texts):
+    """Query vectors for several texts, in one request where the embeddings allow it.
+
+    A model may embed a query differently from a document, so this never falls
+    back to `embed_documents`: it uses the embeddings' own `embed_queries` if
+    they have one, and `embed_query` per text otherwise.
+    """
+    texts = list(texts)
+    if hasattr(embeddings, 'embed_queries'):
+        return embeddings.embed_queries(texts)
+    return [embeddings.embed_query(text) for text in texts]
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper backed by a size-bounded SQLite cache."""
+
+    def __init__(self, embeddings, cache_path=None, model_name=None, max_bytes=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or embedding_model_name(embeddings)
+        self.cache_path = cache_path or EMBED_CACHE_PATH
+        self.max_bytes = int(max_bytes if max_bytes is not None else EMBED_CACHE_MAX_MB * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    # --- Embeddings interface ---
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(set(keys))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._store(fresh)
+            cached.update(fresh)
+        return [list(cached[key]) for key in keys]
+
+    def embed_query(self, text):
+        key = self._key(text)
+        cached = self._lookup({key})
+        if key in cached:
+            with self._lock:
+                self.hits += 1
+            return list(cached[key])
+        with self._lock:
+            self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+    def embed_queries(self, texts):
+        """Query vectors for several texts, embedding every uncached one through embed_queries()."""
+        texts = list(texts)
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(set(keys))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            fresh = dict(zip(missing.keys(), embed_queries(self.embeddings, missing.values())))
+            self._store(fresh)
+            cached.update(fresh)
+        return [list(cached[key]) for key in keys]
+
+    # --- Cache management ---
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                'model': self.model_name,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'entries': entries,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, keys):
+        if not keys:
+            return {}
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array('f', blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def _store(self, vectors):
+        now = time.time()
+        rows = []
+        for key, vector in vectors.items():
+            blob = array('f', vector).tobytes()
+            rows.append((key, self.model_name, blob, len(blob), now))
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.commit()
+                self._total_bytes += sum(row[3] for row in rows)
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+            except sqlite3.Error as e:
+                # The cache is an optimisation; never fail an embedding call because of it
+                logging.error(f"[EMBED-CACHE] Error writing to embedding cache: {e}", exc_info=True)
+
+    def _evict(self):
+        """Drop least recently used vectors until the cache is at 90% of its limit."""
+        target = int(self.max_bytes * 0.9)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._conn.commit()
+        self._total_bytes = total
+        self.evictions += evicted
+        logging.info(f"[EMBED-CACHE] Evicted {evicted} vectors; cache now {total} bytes")
@@ -0,0 +1,92 @@
+"""Configurable embedding backends.
+
+EMBEDDING_PROVIDER selects where vectors come from:
+
+    openai   OpenAIEmbeddings (the default)
+    local    a sentence-transformers model run on the CPU in this process
+
+The local backend has no network round trip and no provider rate limits.
+Whichever model is used is recorded in the index manifest by `Ingestor`, and
+an index built with a different model is refused.
+"""
+import logging
+import os
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
+# Model name for the selected provider; empty uses the provider's default
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")
+
+DEFAULT_OPENAI_MODEL = "text-embedding-ada-002"
+DEFAULT_LOCAL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Local backend tuning
+EMBED_LOCAL_BATCH_SIZE = int(os.getenv("EMBED_LOCAL_BATCH_SIZE", "64"))
+# CPU threads used by the local model (0 leaves the library default)
+EMBED_LOCAL_THREADS = int(os.getenv("EMBED_LOCAL_THREADS", "4"))
+# "torch", or "onnx" / "openvino" for optimised inference
+EMBED_LOCAL_BACKEND = os.getenv("EMBED_LOCAL_BACKEND", "torch")
+# ONNX file to load, e.g. onnx/model_qint8_avx512_vnni.onnx for a quantized model
+EMBED_LOCAL_ONNX_FILE = os.getenv("EMBED_LOCAL_ONNX_FILE", "")
+
+
+class LocalEmbeddings(Embeddings):
+    """sentence-transformers embeddings computed on the local CPU.
+
+    The model is loaded on first use. Encoding is serialised with a lock: the
+    model already spreads each batch over `threads` CPU threads, so running
+    batches side by side would only oversubscribe the CPU.
+    """
+
+    def __init__(self, model_name=None, batch_size=None, threads=None, backend=None,
+                 onnx_file=None, client=None):
+        self.model = model_name or DEFAULT_LOCAL_MODEL
+        self.batch_size = batch_size or EMBED_LOCAL_BATCH_SIZE
+        self.threads = EMBED_LOCAL_THREADS if threads is None else threads
+        self.backend = backend or EMBED_LOCAL_BACKEND
+        self.onnx_file = EMBED_LOCAL_ONNX_FILE if onnx_file is None else onnx_file
+        self._client = client
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._client is None:
+            from sentence_transformers import SentenceTransformer
+
+            if self.threads > 0:
+                import torch
+                torch.set_num_threads(self.threads)
+            model_kwargs = {'file_name': self.onnx_file} if self.onnx_file else None
+            logging.info(f"[EMBED] Loading local embedding model {self.model} ({self.backend} backend)")
+            self._client = SentenceTransformer(self.model, device='cpu', backend=self.backend,
+                                               model_kwargs=model_kwargs)
+        return self._client
+
+    def _encode(self, texts):
+        with self._lock:
+            vectors = self._load().encode(list(texts), batch_size=self.batch_size,
+                                          normalize_embeddings=True, convert_to_numpy=True,
+                                          show_progress_bar=False)
+        return [vector.tolist() for vector in vectors]
+
+    def embed_documents(self, texts):
+        return self._encode(texts)
+
+    def embed_query(self, text):
+        return self._encode([text])[0]
+
+    def embed_queries(self, texts):
+        return self._encode(texts)
+
+
+def create_embeddings(provider=None, model=None, openai_api_key=None):
+    """Build the embeddings object for the configured provider."""
+    provider = (provider or EMBEDDING_PROVIDER).lower()
+    model = model or EMBEDDING_MODEL
+    if provider == 'local':
+        return LocalEmbeddings(model_name=model or None)
+    if provider == 'openai':
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=model or DEFAULT_OPENAI_MODEL, openai_api_key=openai_api_key)
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER '{provider}'; expected 'openai' or 'local'")
@@ -0,0 +1,333 @@
+"""Evidence extraction for funeral expenses claims.
+
+Each evidence file is read to text (see `evidence_text`) and sent to the LLM
+with the application schema; the LLM returns the claim fields it found.
+Files are independent, so `iter_extractions` runs them on a bounded thread
+pool: a claim's wall-clock time is about that of its slowest file rather
+than the sum of all of them. Given an `ExtractionCache`, files whose bytes,
+schema, prompt and model were seen before are answered from the cache
+without parsing or an LLM call. `iter_claim_extractions` limits the work of
+a request to one claim's files that still need it, answering the rest from
+the results kept in the manifest, and `extraction_records` turns either
+kind of run into a stream of per-file records for clients that want results
+as they arrive.
+"""
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from evidence_manifest import CACHED, EXTRACTED, FAILED
+from evidence_text import get_reader
+from ingest_docs import file_sha256
+
+EVIDENCE_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+# Evidence files extracted at once per request
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "5"))
+# Seconds one file may take (parsing + LLM call) before it is reported as timed out
+EXTRACT_TIMEOUT_SECONDS = float(os.getenv("EXTRACT_TIMEOUT_SECONDS", "120"))
+
+# Application schema summary (field: description)
+EXTRACTION_SCHEMA = '''
+firstName: Applicant's first name
+lastName: Applicant's last name
+dateOfBirth: Applicant's date of birth
+nationalInsuranceNumber: Applicant's National Insurance number
+addressLine1: Address line 1
+addressLine2: Address line 2
+town: Town or city
+county: County
+postcode: Postcode
+phoneNumber: Phone number
+email: Email address
+partnerFirstName: Partner's first name
+partnerLastName: Partner's last name
+partnerDateOfBirth: Partner's date of birth
+partnerNationalInsuranceNumber: Partner's National Insurance number
+partnerBenefitsReceived: Benefits the partner receives
+partnerSavings: Partner's savings
+deceasedFirstName: Deceased's first name
+deceasedLastName: Deceased's last name
+deceasedDateOfBirth: Deceased's date of birth
+deceasedDateOfDeath: Deceased's date of death
+deceasedPlaceOfDeath: Place of death
+deceasedCauseOfDeath: Cause of death
+deceasedCertifyingDoctor: Certifying doctor
+deceasedCertificateIssued: Certificate issued
+relationshipToDeceased: Relationship to deceased
+supportingEvidence: Supporting evidence
+responsibilityStatement: Responsibility statement
+responsibilityDate: Responsibility date
+benefitType: Type of benefit
+benefitReferenceNumber: Benefit reference number
+benefitLetterDate: Date on benefit letter
+householdBenefits: Household benefits (array)
+incomeSupportDetails: Details about Income Support
+disabilityBenefits: Disability benefits (array)
+carersAllowance: Carer's Allowance
+carersAllowanceDetails: Carer's Allowance details
+funeralDirector: Funeral director
+funeralEstimateNumber: Funeral estimate number
+funeralDateIssued: Date funeral estimate issued
+funeralTotalEstimatedCost: Total estimated funeral cost
+funeralDescription: Funeral description
+funeralContact: Funeral contact
+evidence: Evidence documents (array)
+'''
+
+EXTRACTION_PROMPT = '''
+You are an expert assistant helping to process evidence for a funeral expenses claim. The following is the application schema:
+{schema}
+
+Read the following evidence and extract all information relevant to the claim. For each field you extract, provide:
+- The field name (from the schema above)
+- The value
+- A short explanation of your reasoning or the evidence source (e.g. "Found in death certificate under 'Date of death'")
+If a field is not directly mentioned but can be inferred, include it and explain your inference.
+Return your answer as a JSON object where each key is a field name, and each value is an object with 'value' and 'reasoning'.
+
+Evidence:
+{content}
+'''
+
+
+def find_evidence(evidence_dir):
+    """Names of the supported evidence files in evidence_dir, sorted."""
+    return sorted(name for name in os.listdir(evidence_dir)
+                  if name.lower().endswith(EVIDENCE_EXTENSIONS)
+                  and os.path.isfile(os.path.join(evidence_dir, name)))
+
+def is_plain_file_name(name):
+    """True if name is a bare file name: no directory part, separator or '..'."""
+    return (isinstance(name, str) and name not in ('', '.', '..') and os.path.basename(name) == name
+            and not any(sep in name for sep in ('/', '\\', '\0')))
+
+def check_evidence_names(evidence_dir, names):
+    """Split requested names into (invalid, missing): not bare file names, or not files in evidence_dir."""
+    invalid = [name for name in names if not is_plain_file_name(name)]
+    missing = [name for name in names if is_plain_file_name(name)
+               and not os.path.isfile(os.path.join(evidence_dir, name))]
+    return invalid, missing
+
+def read_evidence_text(file_path, file_hash=None):
+    """Return the text of a .txt, .docx or .pdf evidence file, parsed off-thread and cached by content hash."""
+    return get_reader().read(file_path, file_hash)
+
+def extraction_prompt(content):
+    return EXTRACTION_PROMPT.format(schema=EXTRACTION_SCHEMA, content=content)
+
+def extraction_version(llm=None):
+    """Short hash of the schema, prompt template and model an extraction result depends on."""
+    model = getattr(llm, 'model_name', None) or getattr(llm, 'model', None) or type(llm).__name__
+    digest = hashlib.sha256("\0".join([EXTRACTION_SCHEMA, EXTRACTION_PROMPT, str(model)]).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def extract_file(llm, file_path):
+    """Extract claim fields from one evidence file; returns the LLM's answer as text."""
+    logging.info(f"[EXTRACT] Processing file: {file_path}")
+    return extract_text(llm, os.path.basename(file_path), read_evidence_text(file_path))
+
+def extract_text(llm, fname, content):
+    """Extract claim fields from the text of evidence file fname."""
+    if llm is None:
+        logging.error(f"[EXTRACT ERROR] {fname}: LLM not initialized properly")
+        return "Error: AI model not available. Check OpenAI API key configuration."
+    response = llm.invoke(extraction_prompt(content))
+    result = str(response.content) if hasattr(response, 'content') else str(response)
+    logging.info(f"[EXTRACT] Extraction result for {fname}: {result}")
+    return result
+
+
+def is_error(result):
+    """True for the error messages extraction returns in place of an LLM answer."""
+    return result.startswith('Error')
+
+def _cached_lookups(cache, version, file_paths, file_hashes):
+    """Split file_paths into cache hits and files to extract; returns (hits, [(path, file hash)])."""
+    hits, pending = [], []
+    for file_path in file_paths:
+        file_hash = file_hashes.get(file_path)
+        if cache is not None and file_hash is None:
+            try:
+                file_hash = file_sha256(file_path)
+            except OSError as e:
+                # Let the extraction itself report the unreadable file
+                logging.warning(f"[EXTRACT] Could not hash {file_path}: {e}")
+        if cache is not None and file_hash is not None:
+            result = cache.get(file_hash, version)
+            if result is not None:
+                logging.info(f"[EXTRACT] Cache hit for {os.path.basename(file_path)}")
+                hits.append((os.path.basename(file_path), result))
+                continue
+        pending.append((file_path, file_hash))
+    return hits, pending
+
+def iter_extractions(llm, file_paths, workers=None, timeout=None, extract=extract_file, cache=None,
+                     file_hashes=None):
+    """Extract files concurrently, yielding (file name, result) as each one finishes.
+
+    At most `workers` files are in flight. A file that raises or runs past
+    `timeout` seconds yields an error string instead, and the others are
+    unaffected. A timed-out call cannot be interrupted, so it finishes in the
+    background and its result is dropped. With a `cache`, cached files are
+    yielded first and successful new results are stored; errors never are.
+    `file_hashes` ({path: sha256}) saves re-hashing files the caller has hashed.
+    """
+    workers = max(1, EXTRACT_WORKERS if workers is None else workers)
+    timeout = EXTRACT_TIMEOUT_SECONDS if timeout is None else timeout
+    version = extraction_version(llm)
+    hits, pending = _cached_lookups(cache, version, file_paths, file_hashes or {})
+    yield from hits
+    queue = list(reversed(pending))
+    if not queue:
+        return
+    # One thread per file at most, so an abandoned call never holds up the files behind it
+    pool = ThreadPoolExecutor(max_workers=len(queue), thread_name_prefix='extract')
+    running = {}  # future -> (file name, file hash, started_at)
+    try:
+        while queue or running:
+            while queue and len(running) < workers:
+                file_path, file_hash = queue.pop()
+                running[pool.submit(extract, llm, file_path)] = (os.path.basename(file_path), file_hash,
+                                                                 time.monotonic())
+
+            next_deadline = min(started for _, _, started in running.values()) + timeout
+            done, _ = wait(running, timeout=max(0.0, next_deadline - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                fname, file_hash, _ = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"[EXTRACT ERROR] {fname}: {e}", exc_info=True)
+                    yield fname, f"Error extracting: {e}"
+                    continue
+                # Error messages (e.g. no LLM configured) are retried next time, never cached
+                if cache is not None and file_hash is not None and not is_error(result):
+                    cache.put(file_hash, version, result, file_name=fname)
+                yield fname, result
+
+            now = time.monotonic()
+            for future in [f for f, (_, _, started) in running.items() if now - started >= timeout]:
+                fname, _, _ = running.pop(future)
+                logging.error(f"[EXTRACT ERROR] {fname}: timed out after {timeout:.0f}s")
+                yield fname, f"Error extracting: timed out after {timeout:.0f}s"
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _register_claim_files(manifest, claim_id, evidence_dir, file_names):
+    """Record the named files for the claim, hashing only files whose size or mtime changed."""
+    for name in file_names:
+        file_path = os.path.join(evidence_dir, name)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            logging.warning(f"[EVIDENCE] {name} for claim {claim_id} not found in {evidence_dir}")
+            continue
+        known = manifest.get(claim_id, name)
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+            file_hash = known['file_sha256']
+        else:
+            file_hash = file_sha256(file_path)
+        manifest.register(claim_id, name, file_hash, size=stat.st_size, mtime=stat.st_mtime)
+
+def forget_claim_files(manifest, claim_id, file_names=None):
+    """Forget the named files of a claim, or the whole claim; returns the count removed.
+
+    The cached text of files no other claim holds is deleted with them.
+    """
+    rows = [row for row in manifest.files(claim_id) if file_names is None or row['file_name'] in file_names]
+    removed = manifest.remove(claim_id, file_names)
+    get_reader().discard(manifest.unreferenced(row['file_sha256'] for row in rows))
+    return removed
+
+def iter_claim_extractions(llm, manifest, claim_id, evidence_dir, file_names=None, cache=None, workers=None,
+                           timeout=None):
+    """Yield (file name, result, reprocessed) for every evidence file of the claim.
+
+    `file_names` (in evidence_dir) are added to the claim first; without
+    them the files already recorded for the claim are used. Files extracted
+    before, unchanged since and with the current extraction version come
+    first, from the result kept in the `EvidenceManifest`, with reprocessed
+    False. New, changed and previously
+    failed files follow as they finish, with reprocessed True; their parse
+    and extraction status are recorded, so a file that failed is retried
+    next time and one that succeeded is not touched again until its content
+    changes.
+    """
+    if file_names:
+        _register_claim_files(manifest, claim_id, evidence_dir, file_names)
+    version = extraction_version(llm)
+    stored, rows, deleted = [], {}, []
+    for row in manifest.files(claim_id):
+        file_path = os.path.join(evidence_dir, row['file_name'])
+        if not os.path.isfile(file_path):
+            deleted.append(row['file_name'])
+            continue
+        # A result from another schema, prompt or model is extracted again
+        if row['extraction_status'] == EXTRACTED and row['result'] is not None and row['version'] == version:
+            stored.append((row['file_name'], row['result']))
+        else:
+            rows[file_path] = row
+    if deleted:
+        # Evidence removed from the shared folder is forgotten, with its cached text
+        logging.info(f"[EVIDENCE] Claim {claim_id}: forgetting deleted file(s) {', '.join(deleted)}")
+        forget_claim_files(manifest, claim_id, deleted)
+    logging.info(f"[EVIDENCE] Claim {claim_id}: {len(stored)} file(s) already extracted, {len(rows)} to extract")
+    for fname, result in stored:
+        yield fname, result, False
+    parsed = set()
+
+    def extract(llm, file_path):
+        row = rows[file_path]
+        try:
+            content = read_evidence_text(file_path, row['file_sha256'])
+        except Exception as e:
+            manifest.mark_parsed(claim_id, row['file_name'], row['file_sha256'], FAILED, str(e))
+            raise
+        parsed.add(file_path)
+        manifest.mark_parsed(claim_id, row['file_name'], row['file_sha256'])
+        return extract_text(llm, row['file_name'], content)
+
+    file_hashes = {path: row['file_sha256'] for path, row in rows.items()}
+    for fname, result in iter_extractions(llm, list(rows), workers, timeout, extract, cache, file_hashes):
+        file_path = os.path.join(evidence_dir, fname)
+        file_hash = rows[file_path]['file_sha256']
+        if is_error(result):
+            manifest.mark_extracted(claim_id, fname, file_hash, FAILED, result)
+        else:
+            if file_path not in parsed:
+                manifest.mark_parsed(claim_id, fname, file_hash, CACHED)
+            manifest.mark_extracted(claim_id, fname, file_hash, EXTRACTED, result=result, version=version)
+        yield fname, result, True
+
+
+def extraction_records(extractions):
+    """Turn (file name, result) pairs into stream records, ending with a summary.
+
+    Each file gives {'type': 'file', 'file', 'result', 'error', 'elapsed_ms'}
+    as soon as it is available; the last record is {'type': 'summary',
+    'files', 'errors', 'elapsed_ms'}. For the (file name, result,
+    reprocessed) triples of a claim, file records also carry 'reprocessed'
+    and the summary counts them.
+    """
+    started = time.monotonic()
+    files = errors = 0
+    reprocessed = None
+    for fname, result, *flag in extractions:
+        error = is_error(result)
+        files += 1
+        errors += error
+        record = {'type': 'file', 'file': fname, 'result': result, 'error': error}
+        if flag:
+            record['reprocessed'] = flag[0]
+            reprocessed = (reprocessed or 0) + flag[0]
+        record['elapsed_ms'] = round((time.monotonic() - started) * 1000)
+        yield record
+    summary = {'type': 'summary', 'files': files, 'errors': errors}
+    if reprocessed is not None:
+        summary['reprocessed'] = reprocessed
+    summary['elapsed_ms'] = round((time.monotonic() - started) * 1000)
+    yield summary
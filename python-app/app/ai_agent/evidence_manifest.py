@@ -0,0 +1,161 @@
+"""Per-claim manifest of evidence files and their processing state.
+
+The evidence volume is shared by every claim. `EvidenceManifest` records,
+per claim, which files belong to it, their content hash and whether each has
+been parsed and extracted, so a claim's extraction request only touches that
+claim's files that have not been extracted yet. The result of each successful
+extraction is kept with the file, together with the extraction version that
+produced it, so the claim's unchanged files can be answered without
+re-extraction for as long as the schema, prompt and model stay the same. A
+file whose bytes change is reset to pending, and so is every file whose
+cached extraction is invalidated.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+EVIDENCE_MANIFEST_PATH = os.getenv(
+    "EVIDENCE_MANIFEST_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "evidence_manifest.sqlite3")
+)
+
+PENDING = 'pending'
+PARSED = 'parsed'
+CACHED = 'cached'        # parse_status when the result came from the extraction cache
+EXTRACTED = 'extracted'
+FAILED = 'failed'
+
+_COLUMNS = ('claim_id', 'file_name', 'file_sha256', 'size', 'mtime',
+            'parse_status', 'extraction_status', 'error', 'result', 'version', 'updated_at')
+
+
+class EvidenceManifest:
+    """SQLite-backed record of (claim, evidence file) -> hash and processing status."""
+
+    def __init__(self, manifest_path=None):
+        self.manifest_path = manifest_path or EVIDENCE_MANIFEST_PATH
+        self._lock = threading.Lock()
+
+        manifest_dir = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(manifest_dir, exist_ok=True)
+        self._conn = sqlite3.connect(self.manifest_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS evidence ("
+            " claim_id TEXT NOT NULL, file_name TEXT NOT NULL, file_sha256 TEXT NOT NULL,"
+            " size INTEGER, mtime REAL, parse_status TEXT NOT NULL, extraction_status TEXT NOT NULL,"
+            " error TEXT, result TEXT, version TEXT, updated_at REAL NOT NULL, PRIMARY KEY (claim_id, file_name))"
+        )
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(evidence)")}
+        # Manifests written before results (and the version that produced them) were kept
+        for column in ('result', 'version'):
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE evidence ADD COLUMN {column} TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS evidence_file_sha256 ON evidence (file_sha256)")
+        self._conn.commit()
+
+    def _rows(self, sql, params):
+        return [dict(zip(_COLUMNS, row)) for row in self._conn.execute(sql, params).fetchall()]
+
+    def get(self, claim_id, file_name):
+        with self._lock:
+            rows = self._rows(f"SELECT {', '.join(_COLUMNS)} FROM evidence WHERE claim_id = ? AND file_name = ?",
+                              (claim_id, file_name))
+        return rows[0] if rows else None
+
+    def files(self, claim_id):
+        """Every file recorded for the claim, by name."""
+        with self._lock:
+            return self._rows(f"SELECT {', '.join(_COLUMNS)} FROM evidence WHERE claim_id = ? ORDER BY file_name",
+                              (claim_id,))
+
+    def register(self, claim_id, file_name, file_sha256, size=None, mtime=None):
+        """Record a file for the claim; returns True if it is new or its content changed."""
+        with self._lock:
+            row = self._conn.execute("SELECT file_sha256 FROM evidence WHERE claim_id = ? AND file_name = ?",
+                                     (claim_id, file_name)).fetchone()
+            if row is not None and row[0] == file_sha256:
+                self._conn.execute("UPDATE evidence SET size = ?, mtime = ? WHERE claim_id = ? AND file_name = ?",
+                                   (size, mtime, claim_id, file_name))
+                self._conn.commit()
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO evidence (claim_id, file_name, file_sha256, size, mtime, parse_status,"
+                " extraction_status, error, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                (claim_id, file_name, file_sha256, size, mtime, PENDING, PENDING, time.time())
+            )
+            self._conn.commit()
+        logging.info(f"[EVIDENCE] Registered {file_name} for claim {claim_id}")
+        return True
+
+    def pending(self, claim_id):
+        """The claim's files that have not been extracted yet (new, changed or failed)."""
+        with self._lock:
+            return self._rows(f"SELECT {', '.join(_COLUMNS)} FROM evidence WHERE claim_id = ?"
+                              f" AND extraction_status != ? ORDER BY file_name", (claim_id, EXTRACTED))
+
+    def _mark(self, claim_id, file_name, file_sha256, updates):
+        # The hash guard stops a late result for old content overwriting a re-registered file
+        updates = dict(updates, updated_at=time.time())
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE evidence SET {', '.join(f'{column} = ?' for column in updates)}"
+                f" WHERE claim_id = ? AND file_name = ? AND file_sha256 = ?",
+                (*updates.values(), claim_id, file_name, file_sha256)
+            )
+            self._conn.commit()
+
+    def mark_parsed(self, claim_id, file_name, file_sha256, status=PARSED, error=None):
+        self._mark(claim_id, file_name, file_sha256, {'parse_status': status, 'error': error})
+
+    def mark_extracted(self, claim_id, file_name, file_sha256, status=EXTRACTED, error=None, result=None,
+                       version=None):
+        """Record the extraction outcome; `result` and its extraction `version` are kept only for a success."""
+        extracted = status == EXTRACTED
+        self._mark(claim_id, file_name, file_sha256, {'extraction_status': status, 'error': error,
+                                                      'result': result if extracted else None,
+                                                      'version': version if extracted else None})
+
+    def reset(self, file_hashes=None):
+        """Set extracted files with the given hashes (in any claim), or all files, back to pending.
+
+        Used when cached extractions are invalidated, so the stored results
+        are not served in their place. Returns the number of files reset.
+        """
+        sql = "UPDATE evidence SET extraction_status = ?, result = NULL, version = NULL, updated_at = ?"
+        with self._lock:
+            if file_hashes is None:
+                reset = self._conn.execute(sql + " WHERE extraction_status = ?",
+                                           (PENDING, time.time(), EXTRACTED)).rowcount
+            else:
+                reset = sum(self._conn.execute(sql + " WHERE extraction_status = ? AND file_sha256 = ?",
+                                               (PENDING, time.time(), EXTRACTED, file_hash)).rowcount
+                            for file_hash in set(file_hashes))
+            self._conn.commit()
+        return reset
+
+    def remove(self, claim_id, file_names=None):
+        """Forget the named files of a claim, or the whole claim; returns the count removed."""
+        with self._lock:
+            if file_names is None:
+                removed = self._conn.execute("DELETE FROM evidence WHERE claim_id = ?", (claim_id,)).rowcount
+            else:
+                removed = sum(self._conn.execute("DELETE FROM evidence WHERE claim_id = ? AND file_name = ?",
+                                                 (claim_id, name)).rowcount for name in set(file_names))
+            self._conn.commit()
+        return removed
+
+    def unreferenced(self, file_hashes):
+        """The given file hashes that no claim has a file with."""
+        with self._lock:
+            return {file_hash for file_hash in set(file_hashes) if self._conn.execute(
+                "SELECT 1 FROM evidence WHERE file_sha256 = ? LIMIT 1", (file_hash,)).fetchone() is None}
+
+    def stats(self):
+        with self._lock:
+            claims, files = self._conn.execute("SELECT COUNT(DISTINCT claim_id), COUNT(*) FROM evidence").fetchone()
+            by_status = dict(self._conn.execute(
+                "SELECT extraction_status, COUNT(*) FROM evidence GROUP BY extraction_status").fetchall())
+        return {'claims': claims, 'files': files, 'extraction_status': by_status}
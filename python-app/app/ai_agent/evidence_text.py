@@ -0,0 +1,339 @@
+"""Evidence file text extraction with an on-disk cache.
+
+Decoding a PDF or .docx is CPU-bound and holds the GIL, which stalls every
+other Flask thread while it runs. `EvidenceTextReader` parses files in a set
+of long-lived parser processes and keeps the normalised text of each one in
+a sidecar file named after its SHA-256, so a file is only ever decoded once,
+whichever claim or request asks for it.
+
+Each read holds one parser process for as long as its file takes. A file's
+timeout therefore starts when a process picks it up, not while it waits for
+one. A file that hangs or crashes its parser costs only that process,
+which is replaced; files other requests are parsing carry on.
+
+Sidecars hold claimants' personal data, so they do not outlive their use:
+one unread for EVIDENCE_TEXT_CACHE_MAX_AGE_DAYS is deleted, the least
+recently read go first once the cache passes EVIDENCE_TEXT_CACHE_MAX_MB, and
+callers discard the sidecars of evidence that is deleted or invalidated.
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+from document_parsing import PARSE_TIMEOUT_SECONDS, ParseTimeout, pool_context
+from ingest_docs import file_sha256
+
+EVIDENCE_TEXT_CACHE_DIR = os.getenv(
+    "EVIDENCE_TEXT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "evidence_text_cache")
+)
+# Parser processes for evidence files; 0 parses in the calling thread
+EVIDENCE_PARSE_WORKERS = int(os.getenv("EVIDENCE_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Delete the least recently read sidecars once they exceed this size (0 = no limit)
+EVIDENCE_TEXT_CACHE_MAX_MB = float(os.getenv("EVIDENCE_TEXT_CACHE_MAX_MB", "256"))
+# Delete sidecars not read for this many days (0 = keep them)
+EVIDENCE_TEXT_CACHE_MAX_AGE_DAYS = float(os.getenv("EVIDENCE_TEXT_CACHE_MAX_AGE_DAYS", "30"))
+# Seconds between size and age checks while only cached text is being read
+PRUNE_INTERVAL_SECONDS = 3600
+
+# Bump when parsing or normalisation changes so old sidecars are ignored
+TEXT_FORMAT_VERSION = 1
+
+_reader = None
+_reader_lock = threading.Lock()
+
+
+def normalise_text(text):
+    """Drop NULs and trailing spaces, and collapse runs of blank lines."""
+    lines = [line.rstrip() for line in text.replace('\x00', '').replace('\r\n', '\n').split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+def parse_evidence_text(file_path):
+    """Return the normalised text of a .txt, .docx or .pdf file. Runs inside a parser process."""
+    name = file_path.lower()
+    if name.endswith('.txt'):
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            return normalise_text(f.read())
+    if name.endswith('.docx'):
+        from docx import Document
+        return normalise_text('\n'.join(para.text for para in Document(file_path).paragraphs))
+    if name.endswith('.pdf'):
+        import PyPDF2
+        with open(file_path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            return normalise_text('\n'.join(page.extract_text() or '' for page in reader.pages))
+    raise ValueError(f"Unsupported file type: {file_path}")
+
+
+def _serve_parse_requests(conn, parse):
+    """Parser process loop: parse each file path received on conn until None arrives."""
+    conn.send('ready')
+    while True:
+        try:
+            file_path = conn.recv()
+        except EOFError:
+            return
+        if file_path is None:
+            return
+        try:
+            conn.send((True, parse(file_path)))
+        except Exception as e:
+            try:
+                conn.send((False, e))
+            except Exception:
+                # The exception itself could not be pickled
+                conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class ParserDied(Exception):
+    """Raised when a parser process exits (e.g. a crash in a native parser) while parsing a file."""
+
+
+class _ParserProcess:
+    """One parser process and the pipe to it; it parses one file at a time."""
+
+    def __init__(self, parse):
+        context = pool_context()
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve_parse_requests, args=(child_conn, parse), daemon=True)
+        self.process.start()
+        child_conn.close()
+        try:
+            # Wait for its imports, so start-up never counts against a file's timeout
+            self.conn.recv()
+        except EOFError:
+            self.kill()
+            raise RuntimeError("Evidence parser process failed to start")
+
+    def parse(self, file_path, timeout):
+        try:
+            self.conn.send(file_path)
+            if not self.conn.poll(timeout):
+                raise ParseTimeout(f"Parsing took longer than {timeout:.0f}s")
+            ok, value = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise ParserDied(f"Parser process exited while parsing {os.path.basename(file_path)}") from e
+        if not ok:
+            raise value
+        return value
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class EvidenceTextReader:
+    """Parses evidence files off-thread and caches their text by content hash."""
+
+    def __init__(self, cache_dir=None, workers=None, timeout=None, parse=None, max_bytes=None,
+                 max_age_seconds=None):
+        self.cache_dir = cache_dir or EVIDENCE_TEXT_CACHE_DIR
+        self.workers = EVIDENCE_PARSE_WORKERS if workers is None else workers
+        self.timeout = PARSE_TIMEOUT_SECONDS if timeout is None else timeout
+        self.max_bytes = int(max_bytes if max_bytes is not None else EVIDENCE_TEXT_CACHE_MAX_MB * 1024 * 1024)
+        self.max_age_seconds = (max_age_seconds if max_age_seconds is not None
+                                else EVIDENCE_TEXT_CACHE_MAX_AGE_DAYS * 86400)
+        # Runs in the parser processes, so it must be a module-level function
+        self.parse = parse or parse_evidence_text
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.evictions = 0
+        self._last_prune = 0.0
+        self._idle = []          # parser processes waiting for a file
+        self._processes = set()  # every live parser process, idle or busy
+        self._slots = threading.BoundedSemaphore(max(1, self.workers))
+        self._closed = False
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.prune()
+
+    def _sidecar(self, file_hash):
+        return os.path.join(self.cache_dir, f"{file_hash}.v{TEXT_FORMAT_VERSION}.txt")
+
+    def read(self, file_path, file_hash=None):
+        """Normalised text of file_path, from the sidecar cache when possible."""
+        file_hash = file_hash or file_sha256(file_path)
+        sidecar = self._sidecar(file_hash)
+        try:
+            with open(sidecar, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            text = None
+        if text is not None:
+            with self._lock:
+                self.hits += 1
+            try:
+                # The modification time records the last read, for the age and size limits
+                os.utime(sidecar)
+            except OSError:
+                pass
+            if time.time() - self._last_prune > PRUNE_INTERVAL_SECONDS:
+                self.prune()
+            return text
+        with self._lock:
+            self.misses += 1
+
+        text = self._parse(file_path)
+        tmp_path = f"{sidecar}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, sidecar)
+        except OSError as e:
+            # The sidecar is an optimisation; never fail a read because of it
+            logging.error(f"[EVIDENCE-TEXT] Error writing {sidecar}: {e}", exc_info=True)
+        self.prune()
+        return text
+
+    def _acquire(self):
+        """Wait for a free slot and return an idle parser process, starting one if needed."""
+        self._slots.acquire()
+        with self._lock:
+            parser = self._idle.pop() if self._idle else None
+        if parser is None:
+            try:
+                parser = _ParserProcess(self.parse)
+            except BaseException:
+                self._slots.release()
+                raise
+            with self._lock:
+                self._processes.add(parser)
+        return parser
+
+    def _release(self, parser, healthy):
+        with self._lock:
+            keep = healthy and not self._closed
+            if keep:
+                self._idle.append(parser)
+            else:
+                self._processes.discard(parser)
+        if not healthy:
+            # Killing a hung or crashed parser leaves every other one running
+            parser.kill()
+        elif not keep:
+            parser.stop()
+        self._slots.release()
+
+    def _parse(self, file_path):
+        if self.workers <= 0:
+            return self.parse(file_path)
+        parser = self._acquire()
+        healthy = False
+        try:
+            text = parser.parse(file_path, self.timeout)
+            healthy = True
+            return text
+        except ParseTimeout:
+            logging.error(f"[EVIDENCE-TEXT] Timed out after {self.timeout:.0f}s parsing {file_path}")
+            with self._lock:
+                self.timeouts += 1
+            raise
+        except ParserDied:
+            logging.error(f"[EVIDENCE-TEXT] Parser process died parsing {file_path}")
+            raise
+        except Exception:
+            # An ordinary parse error; the process is still usable
+            healthy = True
+            raise
+        finally:
+            self._release(parser, healthy)
+
+    def _sidecars(self):
+        """(name, stat) of every sidecar, whichever text format version wrote it."""
+        sidecars = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.txt'):
+                try:
+                    sidecars.append((name, os.stat(os.path.join(self.cache_dir, name))))
+                except FileNotFoundError:
+                    pass
+        return sidecars
+
+    def _delete(self, names):
+        removed = 0
+        for name in names:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def prune(self):
+        """Delete sidecars past the age limit, then the least recently read over the size limit.
+
+        Returns the count removed.
+        """
+        now = time.time()
+        self._last_prune = now
+        sidecars = sorted(self._sidecars(), key=lambda sidecar: sidecar[1].st_mtime)
+        total = sum(stat.st_size for _, stat in sidecars)
+        expired = []
+        for name, stat in sidecars:
+            too_old = self.max_age_seconds and now - stat.st_mtime > self.max_age_seconds
+            if not too_old and not (self.max_bytes and total > self.max_bytes):
+                break
+            expired.append(name)
+            total -= stat.st_size
+        removed = self._delete(expired)
+        if removed:
+            with self._lock:
+                self.evictions += removed
+            logging.info(f"[EVIDENCE-TEXT] Removed {removed} old sidecar(s)")
+        return removed
+
+    def discard(self, file_hashes):
+        """Delete the sidecars of the given file hashes; returns the count removed."""
+        prefixes = tuple(f"{file_hash}." for file_hash in file_hashes)
+        if not prefixes:
+            return 0
+        return self._delete([name for name, _ in self._sidecars() if name.startswith(prefixes)])
+
+    def clear(self):
+        """Delete every sidecar; returns the count removed."""
+        return self._delete([name for name, _ in self._sidecars()])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'workers': self.workers,
+                'processes': len(self._processes),
+                'timeouts': self.timeouts,
+                'evictions': self.evictions,
+                'max_bytes': self.max_bytes
+            }
+
+    def close(self):
+        """Stop the idle parser processes; busy ones stop when their file is done."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._processes.difference_update(idle)
+        for parser in idle:
+            parser.stop()
+
+
+def get_reader():
+    """The process-wide EvidenceTextReader, created on first use."""
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            _reader = EvidenceTextReader()
+        return _reader
@@ -0,0 +1,98 @@
+"""Persistent cache of evidence extraction results.
+
+An extraction depends only on the evidence file's bytes, the schema and
+prompt it was sent with, and the LLM that answered. `ExtractionCache` stores
+the LLM's answer in SQLite keyed by the file's SHA-256 plus an extraction
+version (a hash of schema, prompt template and model), so extracting
+unchanged evidence again costs neither parsing nor an LLM call. Changing the
+schema or the prompt changes the version, and older entries are simply
+never hit again.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+EXTRACT_CACHE_PATH = os.getenv(
+    "EXTRACT_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "extraction_cache.sqlite3")
+)
+
+
+class ExtractionCache:
+    """SQLite-backed map of (file sha256, extraction version) -> extraction result."""
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path or EXTRACT_CACHE_PATH
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            " file_sha256 TEXT NOT NULL, version TEXT NOT NULL, file_name TEXT, result TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (file_sha256, version))"
+        )
+        self._conn.commit()
+
+    def get(self, file_hash, version):
+        """Cached result for the file and version, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM extractions WHERE file_sha256 = ? AND version = ?", (file_hash, version)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE extractions SET last_used = ? WHERE file_sha256 = ? AND version = ?",
+                               (time.time(), file_hash, version))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, file_hash, version, result, file_name=None):
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO extractions (file_sha256, version, file_name, result, created_at, last_used)"
+                    " VALUES (?, ?, ?, ?, ?, ?)", (file_hash, version, file_name, result, now, now)
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                # The cache is an optimisation; never fail an extraction because of it
+                logging.error(f"[EXTRACT-CACHE] Error writing to extraction cache: {e}", exc_info=True)
+
+    def invalidate(self, file_hashes=None):
+        """Drop cached results for the given file hashes (all versions), or everything; returns the count."""
+        with self._lock:
+            if file_hashes is None:
+                removed = self._conn.execute("DELETE FROM extractions").rowcount
+            else:
+                removed = sum(self._conn.execute("DELETE FROM extractions WHERE file_sha256 = ?",
+                                                 (file_hash,)).rowcount for file_hash in set(file_hashes))
+            self._conn.commit()
+            self.invalidations += removed
+        logging.info(f"[EXTRACT-CACHE] Invalidated {removed} cached extraction(s)")
+        return removed
+
+    def clear(self):
+        return self.invalidate()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'entries': entries,
+                'invalidations': self.invalidations
+            }
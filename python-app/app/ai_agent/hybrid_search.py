@@ -0,0 +1,158 @@
+"""Hybrid lexical + vector retrieval over the policy index.
+
+`BM25Index` is an in-memory inverted index over the same chunks as the vector
+index. `HybridRetriever` fuses BM25 and vector rankings with reciprocal
+rank fusion (RRF). Questions that hinge on exact terms (amounts, distances,
+quoted phrases, benefit names) are answered from the lexical index alone
+when it finds chunks containing every such term, so no query embedding is
+needed.
+"""
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+from langchain_core.documents import Document
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Reciprocal rank fusion constant; 60 is the value from the original RRF paper
+RRF_K = 60
+# Candidates fetched from each retriever per result returned
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "4"))
+
+_TOKEN = re.compile(r"£?\d[\d,]*(?:\.\d+)?%?|[a-z]+(?:'[a-z]+)?")
+_QUOTED = re.compile(r"[\"“”']([^\"“”']{2,})[\"“”']")
+_CAPITALISED = re.compile(r"\b[A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)+\b")
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from has have how i if in is it its me my
+not of on or our so that the their them then there these they this to was we were what when
+where which who why will with would you your
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased word and number tokens; "£1,000" yields both "£1000" and "1000"."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token[0].isdigit() or token[0] == '£':
+            token = token.replace(',', '')
+            tokens.append(token)
+            if token[0] == '£':
+                tokens.append(token[1:])
+        elif token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+def exact_terms(query):
+    """Tokens the answer must contain verbatim: numbers, quoted phrases and proper names."""
+    terms = {token for token in tokenize(query) if token[0].isdigit() or token[0] == '£'}
+    for phrase in _QUOTED.findall(query) + _CAPITALISED.findall(query):
+        terms.update(tokenize(phrase))
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunks."""
+
+    def __init__(self, ids, texts, metadatas=None):
+        self.ids = list(ids)
+        self.texts = list(texts)
+        self.metadatas = list(metadatas) if metadatas is not None else [{} for _ in self.ids]
+        self.positions = {doc_id: index for index, doc_id in enumerate(self.ids)}
+        self.postings = defaultdict(list)  # term -> [(doc index, term frequency)]
+        self.doc_terms = []
+        self.doc_lengths = []
+        for index, text in enumerate(self.texts):
+            counts = Counter(tokenize(text))
+            self.doc_terms.append(frozenset(counts))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((index, tf))
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.ids) - df + 0.5) / (df + 0.5))
+
+    def search(self, query, k):
+        """Return up to k (doc index, score) pairs, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for index, tf in postings:
+                norm = 1 - BM25_B + BM25_B * self.doc_lengths[index] / (self.avg_length or 1)
+                scores[index] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def contains_all(self, index, terms):
+        return terms <= self.doc_terms[index]
+
+    def document(self, index):
+        return Document(page_content=self.texts[index], metadata=dict(self.metadatas[index] or {}),
+                        id=self.ids[index])
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse several ranked lists of ids into one, best first."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+
+class HybridRetriever:
+    """Retrieves policy chunks by fusing BM25 and vector search results."""
+
+    def __init__(self, ingestor, embeddings):
+        self.ingestor = ingestor
+        self.embeddings = embeddings
+
+    def exact_term_search(self, query, k):
+        """Lexical-only results if the query hinges on exact terms the index can satisfy, else None."""
+        terms = exact_terms(query)
+        if not terms:
+            return None
+        index = self.ingestor.lexical_index()
+        hits = [i for i, _ in index.search(query, k * HYBRID_CANDIDATE_FACTOR) if index.contains_all(i, terms)]
+        if not hits:
+            return None
+        logging.info(f"[RETRIEVE] Answering from the lexical index for exact terms {sorted(terms)}")
+        return [index.document(i) for i in hits[:k]]
+
+    def search(self, query, k, query_vector=None):
+        """Return the k best chunks for the query.
+
+        Without a precomputed `query_vector`, exact-term queries are served
+        from the lexical index alone; otherwise BM25 and vector rankings are fused.
+        """
+        if query_vector is None:
+            docs = self.exact_term_search(query, k)
+            if docs is not None:
+                return docs
+            query_vector = self.embeddings.embed_query(query)
+
+        return self.search_many([query], k, [query_vector])[0]
+
+    def search_many(self, queries, k, query_vectors):
+        """Fused results for several queries, with one vector search for all of them."""
+        candidates = k * HYBRID_CANDIDATE_FACTOR
+        index = self.ingestor.lexical_index()
+        dense_results = self.ingestor.vectorstore().query_by_vectors(query_vectors, candidates)
+        results = []
+        for query, dense_result in zip(queries, dense_results):
+            lexical = [index.ids[i] for i, _ in index.search(query, candidates)]
+            by_id = {doc.id: doc for doc, _ in dense_result}
+            fused = reciprocal_rank_fusion([lexical, list(by_id)])[:k]
+            results.append([by_id[doc_id] if doc_id in by_id else index.document(index.positions[doc_id])
+                            for doc_id in fused])
+        return results
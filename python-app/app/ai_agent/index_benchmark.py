@@ -0,0 +1,149 @@
+"""Benchmark compact flat-index formats against exact float32 search.
+
+Embeds the policy corpus (through the shared embedding cache, so chunks that
+were already ingested cost nothing) and a set of policy questions. Each
+format is built in a scratch directory, and the script reports recall@k
+against exact float32 search, the bytes every query scans, the bytes of full
+vectors kept for re-ranking, the bytes on disk and the per-query latency.
+The memory saved counts both, since the re-rank vectors stay mapped too:
+
+    python index_benchmark.py                       # policy corpus, k=5
+    python index_benchmark.py --k 10 --queries questions.txt --json
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from vector_stores import FLAT_CHUNKS_NAME, FlatIndex
+
+# (name, FlatIndex options); the first entry is the exact baseline
+DEFAULT_CONFIGS = [
+    ('float32', {}),
+    ('int8', {'dtype': 'int8'}),
+    ('int8 + rerank', {'dtype': 'int8', 'rerank': 50}),
+    ('float32 512d truncate', {'dimensions': 512}),
+    ('float32 256d project', {'dimensions': 256, 'reduction': 'project'}),
+    ('int8 256d project + rerank', {'dtype': 'int8', 'dimensions': 256, 'reduction': 'project', 'rerank': 50}),
+]
+# Timed passes over the query set per format
+LATENCY_ROUNDS = 20
+
+
+def recall_at_k(expected, found):
+    """Mean fraction of each expected top-k list that was also found."""
+    if not expected:
+        return 1.0
+    return float(np.mean([len(set(e) & set(f)) / len(e) if e else 1.0 for e, f in zip(expected, found)]))
+
+def _disk_bytes(index_dir):
+    return sum(os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir)
+               if name != FLAT_CHUNKS_NAME)
+
+def run_benchmark(vectors, queries, k=5, configs=None, rounds=LATENCY_ROUNDS):
+    """Build each format over `vectors` and measure it on `queries`; returns one dict per format."""
+    configs = configs or DEFAULT_CONFIGS
+    ids = [str(i) for i in range(len(vectors))]
+    expected = None
+    results = []
+    workdir = tempfile.mkdtemp(prefix="index-benchmark-")
+    try:
+        for name, options in configs:
+            index_dir = os.path.join(workdir, str(len(results)))
+            index = FlatIndex(index_dir, None, **options)
+            index.upsert(ids, vectors, [''] * len(ids), [{} for _ in ids])
+            index.flush()
+
+            found = [[doc.id for doc, _ in hits] for hits in index.query_by_vectors(queries, k)]
+            expected = found if expected is None else expected
+            timings = []
+            for _ in range(rounds):
+                for query in queries:
+                    started = time.perf_counter()
+                    index.query_by_vector(query, k)
+                    timings.append(time.perf_counter() - started)
+            results.append({
+                'name': name,
+                'format': index.format,
+                'recall_at_k': round(recall_at_k(expected, found), 4),
+                'memory_bytes': index.memory_bytes(),
+                'rerank_bytes': index.rerank_bytes(),
+                'disk_bytes': _disk_bytes(index_dir),
+                'p50_ms': round(float(np.percentile(timings, 50)) * 1000, 3),
+                'p95_ms': round(float(np.percentile(timings, 95)) * 1000, 3)
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def format_table(results, k):
+    baseline = results[0]
+    baseline_bytes = baseline['memory_bytes'] + baseline['rerank_bytes']
+    lines = [f"{'format':<30} {'recall@' + str(k):>9} {'memory':>10} {'rerank':>10} {'saved':>7} {'disk':>10} "
+             f"{'p50 ms':>8} {'p95 ms':>8}"]
+    for row in results:
+        saved = 1 - (row['memory_bytes'] + row['rerank_bytes']) / baseline_bytes if baseline_bytes else 0.0
+        lines.append(f"{row['name']:<30} {row['recall_at_k']:>9.3f} {row['memory_bytes']:>10,} "
+                     f"{row['rerank_bytes']:>10,} {saved:>7.0%} {row['disk_bytes']:>10,} "
+                     f"{row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Command-line entry point: benchmark the formats on the policy corpus."""
+    from dotenv import load_dotenv
+    from document_parsing import parse_documents
+    from embedding_cache import CachedEmbeddings
+    from embedding_providers import EMBEDDING_PROVIDER, create_embeddings
+    from ingest_docs import find_documents, policy_docs_path
+    from query_router import DEFAULT_EXAMPLES, ROUTE_POLICY
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--k', type=int, default=5, help="results per query (default 5)")
+    parser.add_argument('--queries', help="file with one question per line (default: built-in policy questions)")
+    parser.add_argument('--docs', default=policy_docs_path, help="documents folder (default: policy_docs)")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(message)s')
+    load_dotenv()
+
+    openai_key = os.getenv("OPENAI_API_KEY")
+    if EMBEDDING_PROVIDER == 'openai' and not openai_key:
+        print("ERROR: OPENAI_API_KEY is not set in the environment.")
+        return 1
+    embeddings = CachedEmbeddings(create_embeddings(openai_api_key=openai_key))
+
+    texts = []
+    for file_path, chunks, error in parse_documents(find_documents(args.docs)):
+        if error is not None:
+            print(f"WARNING: skipped {file_path}: {error}")
+            continue
+        texts.extend(chunk.page_content for chunk in chunks)
+    if not texts:
+        print(f"ERROR: no documents found in {args.docs}")
+        return 1
+    if args.queries:
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = DEFAULT_EXAMPLES[ROUTE_POLICY]
+
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    queries = np.asarray([embeddings.embed_query(q) for q in questions], dtype=np.float32)
+    results = run_benchmark(vectors, queries, k=args.k)
+    if args.json:
+        print(json.dumps({'chunks': len(texts), 'queries': len(questions), 'k': args.k, 'results': results}, indent=2))
+    else:
+        print(f"{len(texts)} chunks, {len(questions)} queries, {vectors.shape[1]} dimensions\n")
+        print(format_table(results, args.k))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,196 +1,749 @@
+"""Policy document ingestion for the RAG knowledge base.
+
+`Ingestor` keeps the vector index in step with the policy documents folder.
+It can be used in process (main.py shares its embeddings and vector store with
+it) or run from the command line:
+
+    python ingest_docs.py          # incremental sync
+    python ingest_docs.py --full   # re-embed every document into a new index generation
+"""
 import os
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader, Docx2txtLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
-from dotenv import load_dotenv
+import hashlib
+import json
 import logging
 import shutil
+import threading
 import time
 import sys
+from document_parsing import parse_documents
+from embedding_batches import BatchEmbedder
+from embedding_cache import embedding_model_name
+from hybrid_search import BM25Index
+from vector_stores import INDEX_ENGINE, detect_engine, open_index
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s %(levelname)s %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent.log"))
-    ]
-)
-
-load_dotenv()
 # Get directory path relative to the script location
 script_dir = os.path.dirname(os.path.abspath(__file__))
 policy_docs_path = os.path.join(script_dir, "policy_docs")
 persist_dir = os.path.join(script_dir, "chroma_db")
 
-logging.info(f"Ingesting documents from: {policy_docs_path}")
-logging.info(f"Persisting to: {persist_dir}")
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
 
-# Ensure the docs directory exists
-os.makedirs(policy_docs_path, exist_ok=True)
+# The manifest records, per source file, the content hash and the chunk IDs it
+# produced so that later runs only re-embed files that were added or changed.
+MANIFEST_NAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
 
-# Check if there are any documents to process
-doc_files = []
-for root, _, files in os.walk(policy_docs_path):
-    for file in files:
-        if file.endswith(('.pdf', '.docx', '.txt')):
-            doc_files.append(os.path.join(root, file))
+# Full rebuilds are written to a new generation directory (persist_dir/gen-N)
+# and published by atomically replacing the CURRENT pointer file.
+CURRENT_POINTER = "CURRENT"
+GENERATION_PREFIX = "gen-"
+# Generations kept on disk, including the live one
+INDEX_RETENTION = int(os.getenv("INDEX_RETENTION", "2"))
 
-if not doc_files:
-    logging.warning(f"No documents found in {policy_docs_path}. Ingestion aborted.")
-    
-    # If there are no documents but the vector DB exists, we should clear it
-    if os.path.exists(persist_dir):
-        try:
-            # Create a backup just in case
-            backup_dir = persist_dir + "_backup_empty"
-            if os.path.exists(backup_dir):
-                shutil.rmtree(backup_dir)
-            shutil.copytree(persist_dir, backup_dir)
-            
-            # Remove the database
-            shutil.rmtree(persist_dir)
-            logging.info(f"No documents found, cleared existing vector database at {persist_dir}")
-        except Exception as e:
-            logging.error(f"Error clearing vector database: {e}")
-    
-    exit(0)
+# Chunks held in memory between parsing and embedding (0 = batch size x concurrency)
+INGEST_WINDOW = int(os.getenv("INGEST_WINDOW", "0"))
+
+
+class IngestionError(Exception):
+    """Raised when ingestion cannot produce a usable index."""
+
+
+class EmbeddingModelMismatch(IngestionError):
+    """Raised when the index was built with a different embedding model."""
+
+
+class IndexStats:
+    """Summary of the published index, cheap enough to consult on every request.
+
+    `sources` maps a document path, relative to the documents folder, to the
+    number of chunks it contributed. `catalogue` maps the same paths to what
+    ingestion recorded about each file (sha256, chunk_count, ingested_at, size,
+    mtime); fields an older manifest did not record are None.
+    """
+
+    def __init__(self, chunk_count, sources, built_at, embedding_model, index_dir, catalogue=None):
+        self.chunk_count = chunk_count
+        self.sources = sources
+        self.built_at = built_at
+        self.embedding_model = embedding_model
+        self.index_dir = index_dir
+        self.catalogue = catalogue if catalogue is not None else {
+            source: _catalogue_entry({}, count) for source, count in sources.items()}
+
+    @property
+    def is_empty(self):
+        return self.chunk_count == 0
+
+    @property
+    def generation(self):
+        """Token that changes whenever the published index changes."""
+        return f"{os.path.basename(self.index_dir)}@{self.built_at}"
+
+    def chunks_for(self, source):
+        return self.sources.get(source, 0)
+
+    def source_info(self, source):
+        """Catalogue entry for one document plus the index generation, or None if it is not indexed."""
+        entry = self.catalogue.get(source)
+        if entry is None:
+            return None
+        return dict(entry, source=source, generation=self.generation)
+
+    def source_status(self, source, size, mtime):
+        """'indexed', 'stale' (changed on disk since it was ingested) or 'pending' (not indexed)."""
+        entry = self.catalogue.get(source)
+        if entry is None:
+            return 'pending'
+        if entry['size'] is None or (entry['size'] == size and entry['mtime'] == mtime):
+            return 'indexed'
+        return 'stale'
+
+    def to_dict(self):
+        return {
+            'chunk_count': self.chunk_count,
+            'document_count': len(self.sources),
+            'sources': dict(self.sources),
+            'built_at': self.built_at,
+            'embedding_model': self.embedding_model,
+            'index_dir': self.index_dir,
+            'generation': self.generation
+        }
+
+
+class IndexSnapshot:
+    """The published index as queries see it: its stats and vector store.
+
+    Never modified once taken; the ingestor swaps in a new one when it commits
+    a change, so readers need no lock. `store` is None while there is no index
+    on disk; `model_mismatch` is the EmbeddingModelMismatch message, if any.
+    """
+
+    def __init__(self, key, stats, store, model_mismatch):
+        self.key = key
+        self.stats = stats
+        self.store = store
+        self.model_mismatch = model_mismatch
+
+
+def _catalogue_entry(entry, chunk_count):
+    return {
+        'sha256': entry.get('sha256'),
+        'chunk_count': chunk_count,
+        'ingested_at': entry.get('ingested_at'),
+        'size': entry.get('size'),
+        'mtime': entry.get('mtime')
+    }
+
+def find_documents(docs_dir):
+    """Return the paths of all supported documents under docs_dir."""
+    doc_files = []
+    for root, _, files in os.walk(docs_dir):
+        for file in files:
+            if file.endswith(SUPPORTED_EXTENSIONS):
+                doc_files.append(os.path.join(root, file))
+    return sorted(doc_files)
+
+def file_sha256(path):
+    """Return the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_ids_for(rel_path, file_hash, count):
+    """Deterministic chunk IDs, so re-adding an unchanged file upserts in place.
+
+    The path is part of the ID: two files with identical bytes must not
+    share (and overwrite, or delete) each other's chunks.
+    """
+    prefix = hashlib.sha256(f"{rel_path}\0{file_hash}".encode('utf-8')).hexdigest()[:16]
+    return [f"{prefix}-{i}" for i in range(count)]
 
-# Load all docs
-def get_loader(p):
-    logging.info(f"Loading file: {p}")
+def list_generations(root):
+    """Return (number, path) for each generation directory under root, oldest first."""
+    generations = []
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            number = name[len(GENERATION_PREFIX):]
+            if name.startswith(GENERATION_PREFIX) and number.isdigit():
+                generations.append((int(number), os.path.join(root, name)))
+    return sorted(generations)
+
+def current_generation_dir(root):
+    """Directory of the published generation, or root itself for a legacy index."""
     try:
-        if p.endswith(".pdf"):
-            return PyPDFLoader(p)
-        elif p.endswith(".docx"):
-            return Docx2txtLoader(p)
+        with open(os.path.join(root, CURRENT_POINTER), 'r', encoding='utf-8') as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return root
+    path = os.path.join(root, name)
+    if not os.path.isdir(path):
+        logging.error(f"Index pointer names missing generation {path}; using {root}")
+        return root
+    return path
+
+def _has_index(index_dir):
+    return detect_engine(index_dir) is not None
+
+def _has_legacy_index(root):
+    return _has_index(root) or os.path.exists(os.path.join(root, MANIFEST_NAME))
+
+def _remove_legacy_index(root):
+    """Delete an index written directly into root, leaving generations in place."""
+    for name in os.listdir(root):
+        if name == CURRENT_POINTER or name.startswith(GENERATION_PREFIX):
+            continue
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
         else:
-            return TextLoader(p)
-    except Exception as e:
-        logging.error(f"Error creating loader for {p}: {e}")
-        return None    # If old chroma_db exists, create a backup before recreating
-if os.path.exists(persist_dir):
-    try:
-        backup_dir = persist_dir + "_backup_" + str(int(time.time()))
-        if os.path.exists(backup_dir):
-            shutil.rmtree(backup_dir)
-        shutil.copytree(persist_dir, backup_dir)
-        logging.info(f"Created backup of existing vector database at {backup_dir}")
-        
-        # Remove the existing DB to ensure clean state
-        shutil.rmtree(persist_dir)
-        logging.info(f"Removed existing database for clean rebuild")
-    except Exception as e:
-        logging.error(f"Error managing vector database: {e}", exc_info=True)
-
-# Process documents
-try:
-    logging.info(f"Found {len(doc_files)} document(s) to process")
-    
-    # Process files individually to handle errors better
-    all_docs = []
-    for file_path in doc_files:
+            os.remove(path)
+
+
+class Ingestor:
+    """Incrementally maintains a vector index built from a documents folder.
+
+    Incremental syncs update the live generation in place. Full rebuilds and
+    clears build a new generation beside it and publish it atomically, so
+    readers never see a missing or half-built index.
+
+    `progress`, if given, is called with keyword counters (files_total,
+    files_parsed, chunks_total, chunks_embedded) as work proceeds.
+
+    New generations use `engine` (INDEX_ENGINE by default); an existing
+    generation is always opened with the engine that wrote it.
+    """
+
+    def __init__(self, docs_dir, persist_dir, embeddings, vectorstore=None,
+                 batch_size=None, max_concurrency=None, progress=None,
+                 parse_workers=None, parse_timeout=None, window=None, retention=None,
+                 engine=None):
+        # Absolute, so paths from find_documents() and callers resolve the same way whatever the cwd
+        self.docs_dir = os.path.abspath(docs_dir)
+        self.persist_dir = persist_dir
+        self.embeddings = embeddings
+        self.embedding_model = embedding_model_name(embeddings)
+        self.embedder = BatchEmbedder(embeddings, batch_size=batch_size, max_concurrency=max_concurrency)
+        self.progress = progress or (lambda **counts: None)
+        self.parse_workers = parse_workers
+        self.parse_timeout = parse_timeout
+        # Chunks buffered before they are embedded and written; enough to keep
+        # every concurrent embedding request busy, small enough to bound memory.
+        self.window = window or INGEST_WINDOW or self.embedder.batch_size * self.embedder.max_concurrency
+        self.retention = max(1, retention or INDEX_RETENTION)
+        self.engine = engine or INDEX_ENGINE
+        self._db = vectorstore
+        self._db_dir = current_generation_dir(persist_dir) if vectorstore is not None else None
+        self._highest_generation = 0
+        # Readers use these without the lock, which writers hold for a whole ingestion
+        self._snapshot = None
+        self._lexical = None  # (snapshot it was built from, BM25Index)
+        self._lock = threading.RLock()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.index_dir(), MANIFEST_NAME)
+
+    def index_dir(self):
+        """Directory of the published generation (persist_dir itself for a legacy index)."""
+        return current_generation_dir(self.persist_dir)
+
+    def vectorstore(self):
+        """Return the vector store of the published generation, opening it on first use.
+
+        If another process (e.g. the CLI) has published a newer generation, the
+        new one is opened. Raises EmbeddingModelMismatch if the index was built
+        with a different embedding model, since its vectors are not comparable.
+        """
+        snapshot = self._current_snapshot()
+        if snapshot.model_mismatch:
+            raise EmbeddingModelMismatch(snapshot.model_mismatch)
+        if snapshot.store is not None:
+            return snapshot.store
+        with self._lock:
+            # Nothing indexed yet: open (and so create) the store for the first write
+            self.check_embedding_model()
+            store = self._live_store()
+            # Written to outside ingestion (no manifest): take stats afresh next time
+            self._snapshot = None
+            return store
+
+    def stats(self):
+        """Return IndexStats for the published index.
+
+        Comes from the current snapshot, so it is recomputed only after this
+        ingestor commits a change, or when the live generation or its manifest
+        changes on disk (e.g. after a CLI run).
+        """
+        return self._current_snapshot().stats
+
+    def lexical_index(self):
+        """Return a BM25 index over the live generation's chunks.
+
+        Built once per index change (the same rule as stats()), so queries
+        never pay for it. While an ingestion is running the last one built is
+        served rather than waiting for it.
+        """
+        lexical = self._lexical
+        if lexical is not None and lexical[0] is self._current_snapshot():
+            return lexical[1]
+        if not self._lock.acquire(blocking=lexical is None):
+            return lexical[1]
         try:
-            if file_path.endswith(".pdf"):
-                loader = PyPDFLoader(file_path)
-            elif file_path.endswith(".docx"):
-                loader = Docx2txtLoader(file_path)
-            elif file_path.endswith(".txt"):
-                loader = TextLoader(file_path)
+            snapshot = self._current_snapshot()
+            if _has_index(snapshot.key[0]):
+                data = self._live_store().get(include=['documents', 'metadatas'])
+                index = BM25Index(data['ids'], data['documents'], data['metadatas'])
             else:
-                logging.warning(f"Unsupported file type: {file_path}, skipping")
-                continue
-                
-            file_docs = loader.load()
-            logging.info(f"Successfully loaded {len(file_docs)} page(s) from {os.path.basename(file_path)}")
-            all_docs.extend(file_docs)
-        except Exception as file_error:
-            logging.error(f"Error loading {file_path}: {file_error}", exc_info=True)
-            # Continue with other files
-
-    if len(all_docs) == 0:
-        logging.warning("No documents were successfully loaded. Check file formats and permissions.")
-        print("ERROR: No documents were successfully loaded. Check file formats and permissions.")
-        exit(1)
-    
-    logging.info(f"Successfully loaded {len(all_docs)} total document page(s)")
-        
-except Exception as e:
-    logging.error(f"Error loading documents: {e}", exc_info=True)
-    print(f"ERROR: Failed to load documents: {e}")
-    exit(1)
-
-# Split
-try:
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    splits = splitter.split_documents(all_docs)
-    logging.info(f"Split into {len(splits)} chunks")
-except Exception as e:
-    logging.error(f"Error splitting documents: {e}", exc_info=True)
-    exit(1)    # Embed and store
-openai_key = os.getenv("OPENAI_API_KEY")
-if not openai_key:
-    logging.error("OPENAI_API_KEY is not set in the environment.")
-    raise ValueError("OPENAI_API_KEY is not set in the environment.")
-
-try:
-    # Create a new vector database
-    embeddings = OpenAIEmbeddings(openai_api_key=openai_key)
-    
-    # If directory exists, remove it to prevent partial updates
-    if os.path.exists(persist_dir):
+                index = BM25Index([], [])
+            self._lexical = (snapshot, index)
+            logging.info(f"Built lexical index over {len(index)} chunks")
+            return index
+        finally:
+            self._lock.release()
+
+    def _current_snapshot(self):
+        """The snapshot of the published index, without waiting for a running ingestion.
+
+        If another process changed the index since the snapshot was taken, a
+        new one is taken, unless this ingestor is busy writing: the last one is
+        then served until that write commits its own.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.key == self._index_key():
+            return snapshot
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
         try:
-            shutil.rmtree(persist_dir)
-            logging.info(f"Removed existing vector database at {persist_dir}")
-        except Exception as rm_err:
-            logging.error(f"Error removing existing vector database: {rm_err}", exc_info=True)
-    
-    # Create new database from documents
-    logging.info("Creating new Chroma database from documents...")
-    db = Chroma.from_documents(splits, embeddings, persist_directory=persist_dir)
-    db.persist()
-    logging.info(f"Successfully created and persisted Chroma database with {len(splits)} chunks")
-    
-    # Verify the database was created successfully
-    try:
-        # Check that we can read from the database
-        db_data = db.get()
-        if db_data and 'documents' in db_data:
-            doc_count = len(db_data['documents'])
-            logging.info(f"Successfully verified database contains {doc_count} chunks")
+            self._snapshot = self._take_snapshot()
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def _take_snapshot(self):
+        key = self._index_key()
+        stats = self._compute_stats(key[0])
+        store = self._live_store() if _has_index(key[0]) or self._db_dir == key[0] else None
+        return IndexSnapshot(key, stats, store, self._model_mismatch(stats.embedding_model, key[0]))
+
+    def _commit(self):
+        """Publish what this ingestor just wrote to readers."""
+        self._snapshot = self._take_snapshot()
+
+    def _index_key(self):
+        index_dir = self.index_dir()
+        manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+        return (index_dir, os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else None)
+
+    def _compute_stats(self, index_dir):
+        manifest = self.load_manifest(index_dir)
+        db = self._live_store() if _has_index(index_dir) else None
+        chunk_count = db.count() if db is not None else 0
+        if manifest is not None:
+            sources = {rel_path: len(entry['chunk_ids']) for rel_path, entry in manifest['files'].items()}
+            catalogue = {rel_path: _catalogue_entry(entry, sources[rel_path])
+                         for rel_path, entry in manifest['files'].items()}
+            built_at = manifest.get('updated_at')
+            model = manifest.get('embedding_model')
         else:
-            logging.warning("Database created but may be empty")
-    except Exception as verify_err:
-        logging.error(f"Error verifying database content: {verify_err}", exc_info=True)
-    
-    # Print message to standard output for subprocess capture
-    print(f"SUCCESS: Ingestion complete. Indexed {len(splits)} chunks into vector database.")
-except Exception as e:
-    logging.error(f"Error during embedding or storage: {e}", exc_info=True)
-    # Restore from backup if available
-    most_recent_backup = None
-    max_time = 0
-    
-    # Find the most recent backup
-    for dir_name in os.listdir(script_dir):
-        if dir_name.startswith("chroma_db_backup_"):
+            # No manifest (an index from before ingestion kept one): count chunks per source once
+            sources = {}
+            if chunk_count:
+                for metadata in db.get(include=['metadatas'])['metadatas']:
+                    source = self._source_key((metadata or {}).get('source', ''))
+                    sources[source] = sources.get(source, 0) + 1
+            built_at = os.path.getmtime(index_dir) if os.path.exists(index_dir) else None
+            model = None
+            catalogue = None
+        logging.info(f"Index stats: {chunk_count} chunks from {len(sources)} document(s) in {index_dir}")
+        return IndexStats(chunk_count, sources, built_at, model, index_dir, catalogue)
+
+    def _source_key(self, source):
+        docs_dir = os.path.abspath(self.docs_dir)
+        if os.path.abspath(source).startswith(docs_dir + os.sep):
+            return os.path.relpath(source, docs_dir)
+        return os.path.basename(source)
+
+    def check_embedding_model(self, index_dir=None):
+        """Raise EmbeddingModelMismatch unless the index was built with our model."""
+        manifest = self.load_manifest(index_dir)
+        mismatch = self._model_mismatch(manifest.get('embedding_model') if manifest else None, index_dir)
+        if mismatch:
+            raise EmbeddingModelMismatch(mismatch)
+
+    def _model_mismatch(self, recorded, index_dir=None):
+        # Indexes from before the model was recorded are assumed compatible
+        if recorded and recorded != self.embedding_model:
+            return (f"Index at {index_dir or self.index_dir()} was built with embedding model '{recorded}' "
+                    f"but the configured model is '{self.embedding_model}'. Run a full rebuild.")
+        return None
+
+    def _live_store(self):
+        with self._lock:
+            index_dir = self.index_dir()
+            if self._db is None or self._db_dir != index_dir:
+                self._db = self._open(index_dir)
+                self._db_dir = index_dir
+            return self._db
+
+    def _new_manifest(self):
+        return {'version': MANIFEST_VERSION, 'embedding_model': self.embedding_model, 'files': {}}
+
+    def _open(self, index_dir):
+        return open_index(index_dir, self.embeddings, detect_engine(index_dir) or self.engine)
+
+    # --- Manifest ---
+
+    def load_manifest(self, index_dir=None):
+        """Load the ingestion manifest, or None if it is missing or unreadable."""
+        manifest_path = os.path.join(index_dir or self.index_dir(), MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') != MANIFEST_VERSION or 'files' not in manifest:
+                logging.warning(f"Ignoring manifest with unexpected format at {manifest_path}")
+                return None
+            return manifest
+        except Exception as e:
+            logging.error(f"Error reading ingestion manifest: {e}", exc_info=True)
+            return None
+
+    def save_manifest(self, manifest, index_dir=None):
+        """Write the manifest atomically so a crash never leaves it half-written."""
+        index_dir = index_dir or self.index_dir()
+        os.makedirs(index_dir, exist_ok=True)
+        manifest['updated_at'] = time.time()
+        manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+
+    def _relpath(self, path):
+        """`path` (absolute, or relative to the documents folder) relative to the documents folder."""
+        return os.path.relpath(os.path.normpath(os.path.join(self.docs_dir, path)), self.docs_dir)
+
+    # --- Public API ---
+
+    def ingest(self, paths, force=False, progress=None):
+        """Embed the given files into the live generation, replacing the chunks they produced before.
+
+        Files whose content hash matches the manifest are skipped unless `force`.
+        Paths may be absolute or relative to the documents folder.
+        """
+        with self._lock:
+            manifest = self.load_manifest() or self._new_manifest()
+            db = self.vectorstore()
+            manifest.setdefault('embedding_model', self.embedding_model)
+            summary = self._ingest_into(db, manifest, paths, force, progress or self.progress)
+            db.flush()
+            self.save_manifest(manifest)
+            self._commit()
+            return summary
+
+    def remove(self, paths):
+        """Delete the chunks of the given files from the index.
+
+        Chunks are found by their `source` metadata, so this touches only the
+        removed files' vectors and also catches chunks the manifest does not
+        know about (e.g. from an index built before the manifest existed).
+        """
+        with self._lock:
+            manifest = self.load_manifest()
+            files = manifest['files'] if manifest else {}
+            # Deleting needs no embeddings, so this works whatever model built the index
+            db = self._live_store()
+            files_removed = chunks_removed = 0
+            for path in paths:
+                rel_path = self._relpath(path)
+                entry = files.pop(rel_path, None)
+                source = os.path.join(self.docs_dir, rel_path)
+                ids = set(db.get(where={'source': source}, include=[])['ids'])
+                ids.update(entry['chunk_ids'] if entry else [])
+                if ids:
+                    db.delete(ids=list(ids))
+                if entry or ids:
+                    files_removed += 1
+                    chunks_removed += len(ids)
+                    logging.info(f"Deleted {len(ids)} chunks for removed file {rel_path}")
+            db.flush()
+            if manifest is not None:
+                self.save_manifest(manifest)
+            self._commit()
+            return {'files_removed': files_removed, 'chunks_removed': chunks_removed}
+
+    def sync(self, full=False, progress=None):
+        """Bring the index in line with the documents folder.
+
+        Removed files are dropped, new and changed files are embedded. With
+        `full`, or when there is no manifest yet, every file is re-embedded into
+        a new generation.
+        """
+        with self._lock:
+            doc_files = find_documents(self.docs_dir)
+            manifest = self.load_manifest()
+            if not doc_files:
+                logging.warning(f"No documents found in {self.docs_dir}. Clearing the index.")
+                return self.clear()
+            if full or manifest is None:
+                return self.rebuild(doc_files, progress=progress)
             try:
-                timestamp = int(dir_name.split("_")[-1])
-                if timestamp > max_time:
-                    max_time = timestamp
-                    most_recent_backup = os.path.join(script_dir, dir_name)
-            except (ValueError, IndexError):
+                self.check_embedding_model()
+            except EmbeddingModelMismatch as e:
+                logging.warning(f"{e} Rebuilding with the configured model.")
+                return self.rebuild(doc_files, progress=progress)
+            live_engine = detect_engine(self.index_dir())
+            if live_engine not in (None, self.engine):
+                logging.warning(f"Index was built with the '{live_engine}' engine but INDEX_ENGINE is "
+                                f"'{self.engine}'. Rebuilding with the configured engine.")
+                return self.rebuild(doc_files, progress=progress)
+
+            removed = [p for p in manifest['files'] if not os.path.exists(os.path.join(self.docs_dir, p))]
+            summary = self.remove(removed)
+            removed_chunks = summary['chunks_removed']
+            summary.update(self.ingest(doc_files, progress=progress))
+            summary['chunks_removed'] += removed_chunks
+            return summary
+
+    def rebuild(self, doc_files=None, progress=None):
+        """Re-embed every document into a new generation and publish it.
+
+        The live index keeps serving queries until the new generation is
+        complete; a failed rebuild leaves it untouched.
+        """
+        with self._lock:
+            doc_files = find_documents(self.docs_dir) if doc_files is None else doc_files
+            staging_dir = self._new_generation_dir()
+            try:
+                manifest = self._new_manifest()
+                db = self._open(staging_dir)
+                summary = self._ingest_into(db, manifest, doc_files, True, progress or self.progress)
+                if summary['files_ingested'] == 0:
+                    raise IngestionError("No documents were successfully loaded. Check file formats and permissions.")
+                db.flush()
+                self.save_manifest(manifest, staging_dir)
+            except BaseException:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise
+
+            keep = {chunk_id for entry in manifest['files'].values() for chunk_id in entry['chunk_ids']}
+            summary['chunks_removed'] = len([chunk_id for chunk_id in self._live_ids() if chunk_id not in keep])
+            self._publish(staging_dir, db)
+            return summary
+
+    def clear(self):
+        """Publish an empty generation, dropping every chunk from the live index."""
+        with self._lock:
+            removed = len(self._live_ids())
+            staging_dir = self._new_generation_dir()
+            self.save_manifest(self._new_manifest(), staging_dir)
+            self._publish(staging_dir, self._open(staging_dir))
+            logging.info(f"Cleared {removed} chunks from the vector database")
+            return {'files_ingested': 0, 'chunks_added': 0, 'chunks_removed': removed}
+
+    def generations(self):
+        """Generation directories on disk, oldest first."""
+        return [path for _, path in list_generations(self.persist_dir)]
+
+    def collect_garbage(self):
+        """Delete generations beyond the retention count; the live one is always kept."""
+        with self._lock:
+            live = self.index_dir()
+            generations = list_generations(self.persist_dir)
+            keep = {path for _, path in generations[-self.retention:]} | {live}
+            removed = []
+            for _, path in generations:
+                if path not in keep:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed.append(path)
+            if live != self.persist_dir and len(generations) >= self.retention and _has_legacy_index(self.persist_dir):
+                # An index from before generations existed counts as the oldest one
+                _remove_legacy_index(self.persist_dir)
+                removed.append(self.persist_dir)
+            if removed:
+                logging.info(f"Removed {len(removed)} old index generation(s)")
+            return removed
+
+    # --- Internals ---
+
+    def _ingest_into(self, db, manifest, paths, force, report):
+        """Embed changed files into `db`, updating `manifest` in memory; returns a summary."""
+        previous = manifest['files']
+        file_hashes = {}
+        file_stats = {}
+        for path in paths:
+            rel_path = self._relpath(path)
+            try:
+                # Stat before hashing: a file modified meanwhile then shows as changed, never as current
+                stat = os.stat(os.path.join(self.docs_dir, rel_path))
+                file_hashes[rel_path] = file_sha256(os.path.join(self.docs_dir, rel_path))
+                file_stats[rel_path] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+            except Exception as hash_err:
+                logging.error(f"Error hashing {path}: {hash_err}", exc_info=True)
+
+        todo = [p for p in file_hashes
+                if force or previous.get(p, {}).get('sha256') != file_hashes[p]]
+        logging.info(f"Ingesting {len(todo)} of {len(file_hashes)} file(s); "
+                     f"{len(file_hashes) - len(todo)} unchanged")
+
+        stale_ids = [chunk_id for p in todo for chunk_id in previous.get(p, {}).get('chunk_ids', [])]
+        # Upsert first, then drop old chunks that no longer exist, so readers
+        # never see the file disappear while it is being re-embedded.
+        entries, chunks_added = self._stream_into(db, todo, file_hashes, report)
+        new_ids = {chunk_id for entry in entries.values() for chunk_id in entry['chunk_ids']}
+        stale_ids = [chunk_id for chunk_id in stale_ids if chunk_id not in new_ids]
+        if stale_ids:
+            db.delete(ids=stale_ids)
+            logging.info(f"Deleted {len(stale_ids)} stale chunks from the vector database")
+
+        for p in todo:
+            previous.pop(p, None)
+        previous.update(entries)
+        # Size and mtime let readers tell whether a file changed since ingestion without hashing it
+        for p, stats in file_stats.items():
+            if p in previous:
+                previous[p].update(stats)
+        return {
+            'files_ingested': len(entries),
+            'files_failed': len(todo) - len(entries),
+            'files_unchanged': len(file_hashes) - len(todo),
+            'chunks_added': chunks_added,
+            'chunks_removed': len(stale_ids)
+        }
+
+    def _new_generation_dir(self):
+        # Never reuse a generation number in this process: Chroma caches clients by path
+        numbers = [number for number, _ in list_generations(self.persist_dir)]
+        self._highest_generation = max(numbers + [self._highest_generation]) + 1
+        path = os.path.join(self.persist_dir, f"{GENERATION_PREFIX}{self._highest_generation}")
+        os.makedirs(path)
+        return path
+
+    def _live_ids(self):
+        if not _has_index(self.index_dir()):
+            return []
+        return self._live_store().get(include=[])['ids']
+
+    def _publish(self, generation_dir, db):
+        """Atomically point readers at `generation_dir`, then collect old generations."""
+        pointer_path = os.path.join(self.persist_dir, CURRENT_POINTER)
+        tmp_path = pointer_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(os.path.basename(generation_dir))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, pointer_path)
+        self._db, self._db_dir = db, generation_dir
+        self._commit()
+        logging.info(f"Published index generation {generation_dir}")
+        self.collect_garbage()
+
+    def _stream_into(self, db, rel_paths, file_hashes, report):
+        """Parse, split, embed and write files as a stream; returns (manifest entries, chunk count).
+
+        Chunks flow through a window of at most `self.window` chunks, so memory
+        stays flat however large the corpus is, and the first vectors are
+        written while later files are still being parsed.
+        """
+        entries = {}
+        window_docs, window_ids = [], []
+        chunks_total = 0
+        embedded = 0
+        report(files_total=len(rel_paths), files_parsed=0, chunks_total=0, chunks_embedded=0)
+        file_paths = {os.path.join(self.docs_dir, rel_path): rel_path for rel_path in rel_paths}
+        results = parse_documents(file_paths, workers=self.parse_workers, timeout=self.parse_timeout)
+        for files_parsed, (file_path, file_chunks, error) in enumerate(results, start=1):
+            if error is not None:
+                # One bad file must not stop the others
+                logging.error(f"Error loading {file_path}: {error}")
+                report(files_parsed=files_parsed)
                 continue
-    
-    if most_recent_backup:
-        try:
-            logging.info(f"Attempting to restore from most recent backup: {most_recent_backup}")
-            if os.path.exists(persist_dir):
-                shutil.rmtree(persist_dir)
-            shutil.copytree(most_recent_backup, persist_dir)
-            logging.info(f"Restored vector database from backup")
-        except Exception as restore_err:
-            logging.error(f"Error restoring from backup: {restore_err}")
-    exit(1)
+            rel_path = file_paths[file_path]
+            logging.info(f"Split {os.path.basename(file_path)} into {len(file_chunks)} chunks")
+            file_ids = chunk_ids_for(rel_path, file_hashes[rel_path], len(file_chunks))
+            entries[rel_path] = {
+                'sha256': file_hashes[rel_path],
+                'chunk_ids': file_ids,
+                'ingested_at': time.time()
+            }
+            chunks_total += len(file_chunks)
+            report(files_parsed=files_parsed, chunks_total=chunks_total)
+
+            window_docs.extend(file_chunks)
+            window_ids.extend(file_ids)
+            del file_chunks
+            while len(window_docs) >= self.window:
+                embedded = self._embed_and_store(db, window_docs[:self.window], window_ids[:self.window],
+                                                 report, embedded)
+                del window_docs[:self.window], window_ids[:self.window]
+        if window_docs:
+            self._embed_and_store(db, window_docs, window_ids, report, embedded)
+        return entries, chunks_total
+
+    def _embed_and_store(self, db, splits, ids, report, embedded=0):
+        """Embed chunks concurrently in batches and write each batch as soon as it is ready.
+
+        `embedded` is the running count reported as chunks_embedded; the new count is returned.
+        """
+        texts = [doc.page_content for doc in splits]
+        for start, vectors in self.embedder.embed_batches(texts):
+            end = start + len(vectors)
+            db.upsert(
+                ids=ids[start:end],
+                embeddings=vectors,
+                documents=texts[start:end],
+                metadatas=[doc.metadata for doc in splits[start:end]]
+            )
+            embedded += len(vectors)
+            report(chunks_embedded=embedded)
+        return embedded
+
+def main(argv=None):
+    """Command-line entry point: sync the default policy folder into chroma_db."""
+    from dotenv import load_dotenv
+    from embedding_cache import CachedEmbeddings
+    from embedding_providers import EMBEDDING_PROVIDER, create_embeddings
+
+    argv = sys.argv[1:] if argv is None else argv
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(levelname)s %(message)s',
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler(os.path.join(script_dir, "agent.log"))
+        ]
+    )
+    load_dotenv()
+
+    # Force a clean rebuild with `--full` or INGEST_FULL_REBUILD=1
+    full_rebuild = "--full" in argv or os.getenv("INGEST_FULL_REBUILD", "").lower() in ("1", "true", "yes")
+
+    openai_key = os.getenv("OPENAI_API_KEY")
+    if EMBEDDING_PROVIDER == 'openai' and not openai_key:
+        logging.error("OPENAI_API_KEY is not set in the environment.")
+        print("ERROR: OPENAI_API_KEY is not set in the environment.")
+        return 1
+
+    logging.info(f"Ingesting documents from: {policy_docs_path}")
+    logging.info(f"Persisting to: {persist_dir}")
+    os.makedirs(policy_docs_path, exist_ok=True)
+
+    embeddings = CachedEmbeddings(create_embeddings(openai_api_key=openai_key))
+    ingestor = Ingestor(policy_docs_path, persist_dir, embeddings)
+    try:
+        summary = ingestor.sync(full=full_rebuild)
+    except Exception as e:
+        logging.error(f"Error during ingestion: {e}", exc_info=True)
+        print(f"ERROR: Ingestion failed: {e}")
+        return 1
+
+    logging.info(f"Embedding cache: {embeddings.stats()}")
+    print(f"SUCCESS: Ingestion complete. {json.dumps(summary, sort_keys=True)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
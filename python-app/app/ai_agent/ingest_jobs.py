@@ -0,0 +1,202 @@
+"""Background ingestion queue for the AI agent.
+
+Uploads and deletions submit a job here instead of running ingestion inside the
+HTTP request. A job that is still waiting to start absorbs any further
+submissions, and the worker waits for a short debounce window before starting
+it, so a burst of uploads results in a single ingestion run.
+"""
+import logging
+import threading
+import time
+import uuid
+
+
+class IngestJob:
+    """State and progress of one (possibly coalesced) ingestion run."""
+
+    def __init__(self, reason):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.reasons = [reason]
+        self.files = []
+        # Files to re-embed even if unchanged (re-ingest requests)
+        self.forced_files = []
+        # Whether any submission asked for an incremental sync of the whole folder
+        self.scan_folder = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.message = None
+        self.error = None
+        self.progress = {
+            'files_total': 0,
+            'files_parsed': 0,
+            'chunks_total': 0,
+            'chunks_embedded': 0
+        }
+        self._lock = threading.Lock()
+
+    def add_files(self, files, reason, force=False):
+        with self._lock:
+            for name in files or []:
+                if name not in self.files:
+                    self.files.append(name)
+                if force and name not in self.forced_files:
+                    self.forced_files.append(name)
+            if not force:
+                self.scan_folder = True
+            if reason not in self.reasons:
+                self.reasons.append(reason)
+
+    def update_progress(self, **counts):
+        """Record progress counters reported by the ingestion runner."""
+        with self._lock:
+            for key, value in counts.items():
+                if key in self.progress and value is not None:
+                    self.progress[key] = int(value)
+
+    def eta_seconds(self):
+        """Estimate remaining time from the embedding (or parsing) rate so far."""
+        if self.status != 'running' or not self.started_at:
+            return None
+        elapsed = time.time() - self.started_at
+        progress = self.progress
+        # Chunks are embedded while later files are still being parsed, so the
+        # chunk total is only final once every file has been parsed.
+        keys = [('files_parsed', 'files_total')]
+        if progress['files_parsed'] >= progress['files_total']:
+            keys.insert(0, ('chunks_embedded', 'chunks_total'))
+        for done_key, total_key in keys:
+            done, total = progress[done_key], progress[total_key]
+            if total and done:
+                return round(elapsed / done * max(total - done, 0), 1)
+        return None
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'status': self.status,
+                'reasons': list(self.reasons),
+                'files': list(self.files),
+                'forced_files': list(self.forced_files),
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'progress': dict(self.progress),
+                'eta_seconds': self.eta_seconds(),
+                'message': self.message,
+                'error': self.error
+            }
+
+
+def run_ingestion_job(ingestor, job):
+    """Run a job against an `Ingestor`; returns the combined summary.
+
+    Forced files (re-ingest requests) are re-embedded whatever their hash,
+    and the job fails if any of them could not be loaded. Other submissions
+    are served by one incremental sync of the folder afterwards, which
+    leaves the just re-embedded files alone.
+    """
+    summary = {}
+    # Without a manifest the sync below rebuilds everything anyway
+    rebuilding = ingestor.load_manifest() is None
+    if job.forced_files and not rebuilding:
+        summary = ingestor.ingest(job.forced_files, force=True, progress=job.update_progress)
+        if summary.get('files_failed'):
+            raise RuntimeError(f"{summary['files_failed']} of {len(job.forced_files)} file(s) "
+                               f"could not be re-ingested")
+    if job.scan_folder or rebuilding:
+        for key, value in ingestor.sync(progress=job.update_progress).items():
+            summary[key] = summary.get(key, 0) + value
+    return summary
+
+
+class IngestionQueue:
+    """Single-worker queue that debounces and merges ingestion requests.
+
+    `runner(job)` does the actual ingestion and may call `job.update_progress`.
+    It should raise on failure. `on_success(job)` runs after a successful job,
+    e.g. to reload the vector store.
+    """
+
+    def __init__(self, runner, debounce_seconds=2.0, max_history=50, on_success=None):
+        self.runner = runner
+        self.debounce_seconds = debounce_seconds
+        self.max_history = max_history
+        self.on_success = on_success
+        self._jobs = {}
+        self._history = []
+        self._pending = None
+        self._deadline = 0
+        self._condition = threading.Condition()
+        self._worker = None
+
+    def submit(self, files=None, reason='upload', force=False):
+        """Queue an ingestion run, merging into the waiting job if there is one.
+
+        With `force` the files are re-embedded even if their content is
+        unchanged; otherwise the job syncs the whole documents folder.
+        """
+        with self._condition:
+            if self._pending is not None:
+                job = self._pending
+                job.add_files(files, reason, force)
+                logging.info(f"[INGEST-QUEUE] Coalesced {reason} request into pending job {job.id}")
+            else:
+                job = IngestJob(reason)
+                job.add_files(files, reason, force)
+                self._pending = job
+                self._remember(job)
+                logging.info(f"[INGEST-QUEUE] Queued ingestion job {job.id} ({reason})")
+            self._deadline = time.time() + self.debounce_seconds
+            self._ensure_worker()
+            self._condition.notify_all()
+            return job
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def _remember(self, job):
+        self._jobs[job.id] = job
+        self._history.append(job.id)
+        while len(self._history) > self.max_history:
+            self._jobs.pop(self._history.pop(0), None)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='ingestion-worker', daemon=True)
+            self._worker.start()
+
+    def _next_job(self):
+        with self._condition:
+            while True:
+                if self._pending is None:
+                    self._condition.wait()
+                    continue
+                remaining = self._deadline - time.time()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                job, self._pending = self._pending, None
+                return job
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            job.status = 'running'
+            job.started_at = time.time()
+            logging.info(f"[INGEST-QUEUE] Starting ingestion job {job.id} for files: {job.files}")
+            try:
+                self.runner(job)
+                if self.on_success:
+                    self.on_success(job)
+                job.status = 'succeeded'
+                logging.info(f"[INGEST-QUEUE] Ingestion job {job.id} succeeded")
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                logging.error(f"[INGEST-QUEUE] Ingestion job {job.id} failed: {e}", exc_info=True)
+            finally:
+                job.finished_at = time.time()
@@ -2,17 +2,34 @@ from datetime import datetime
 # ...existing code...
 
 from dotenv import load_dotenv
+import json
 import os
 import logging
 import sys
-from flask import Flask, request, jsonify, render_template
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+# This module builds the app; serve it with `python server.py`
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, render_template
+from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 # from langgraph import State
 from langchain_community.tools.tavily_search import TavilySearchResults
 from typing_extensions import TypedDict
-from langchain_community.vectorstores import Chroma
 from werkzeug.utils import secure_filename
+from embedding_cache import CachedEmbeddings
+from embedding_providers import create_embeddings
+from ingest_docs import EmbeddingModelMismatch, Ingestor, file_sha256
+from ingest_jobs import IngestionQueue, run_ingestion_job
+from hybrid_search import HybridRetriever
+from query_cache import AnswerCache, QueryEmbeddingCache
+from query_router import ROUTE_GENERAL, ROUTE_POLICY, ROUTE_WEB, QueryRouter, llm_route
+from evidence_extraction import (check_evidence_names, extraction_records, find_evidence, forget_claim_files,
+                                 iter_claim_extractions, iter_extractions)
+from evidence_manifest import EvidenceManifest
+from evidence_text import get_reader as evidence_text_reader
+from extraction_cache import ExtractionCache
+from context_packer import CHECK_FORM_MAX_TOKENS, RAG_CONTEXT_CANDIDATES, pack_context, truncate_to_tokens
 
 # Configure logging
 logging.basicConfig(
@@ -68,7 +85,28 @@ logging.info(f"[CONFIG] AI agent policy folder set to {app.config['POLICY_UPLOAD
 persist_dir = os.path.join(os.path.dirname(__file__), 'chroma_db')
 if not openai_key:
     raise ValueError("OPENAI_API_KEY is not set in the environment.")
-embeddings = OpenAIEmbeddings(openai_api_key=openai_key)
+# Embeddings come from EMBEDDING_PROVIDER (OpenAI or a local model) through a
+# persistent on-disk cache shared with ingestion
+embeddings = CachedEmbeddings(create_embeddings(openai_api_key=openai_key))
+# Repeated questions on /chat, /rag and /check-form are embedded once and kept in memory
+query_embeddings = QueryEmbeddingCache(embeddings)
+# Answers to near-identical policy questions, valid until the index changes
+answer_cache = AnswerCache()
+
+# Evidence extraction results keyed by file content, schema, prompt and model
+extraction_cache = ExtractionCache()
+# Which evidence files belong to each claim and how far each has been processed
+evidence_manifest = EvidenceManifest()
+
+# In-process ingestion engine; shares the embeddings and vector store with the query path
+ingestor = Ingestor(app.config['POLICY_UPLOAD_FOLDER'], persist_dir, query_embeddings)
+
+# BM25 + vector retrieval with reciprocal rank fusion, used by /rag, /chat and /check-form
+retriever = HybridRetriever(ingestor, query_embeddings)
+
+# Routes /chat questions to RAG, web search or the LLM alone by embedding
+# similarity; the LLM is only asked when the router is unsure
+router = QueryRouter(query_embeddings, fallback=lambda question: llm_route(llm, question))
 
 # Define a function to load or reload the RAG database
 def load_rag_database():
@@ -77,23 +115,29 @@ def load_rag_database():
         if os.path.exists(persist_dir):
             logging.info(f"[INIT] Loading RAG database from {persist_dir}")
             
-            # Re-initialize embeddings to ensure they match what was used during ingestion
-            local_embeddings = OpenAIEmbeddings(openai_api_key=openai_key)
-            rag_db = Chroma(persist_directory=persist_dir, embedding_function=local_embeddings)
+            # Share the ingestor's store so ingestion updates are visible immediately
+            rag_db = ingestor.vectorstore()
             
             # Verify DB has documents
-            db_data = rag_db.get()
-            if db_data and 'documents' in db_data:
-                doc_count = len(db_data['documents'])
-                logging.info(f"[INIT] Successfully loaded RAG database with {doc_count} chunks")
+            stats = ingestor.stats()
+            if not stats.is_empty:
+                logging.info(f"[INIT] Successfully loaded RAG database with {stats.chunk_count} chunks "
+                             f"from {len(stats.sources)} document(s)")
             else:
                 logging.warning("[INIT] RAG database exists but contains no documents")
+            # Build the lexical index now rather than on the first question
+            ingestor.lexical_index()
             
             return True
         else:
             logging.info("[INIT] No RAG database found at {persist_dir}")
             rag_db = None
             return False
+    except EmbeddingModelMismatch as e:
+        # Querying with a different model would return meaningless matches
+        logging.error(f"[INIT] Refusing to load RAG database: {e}")
+        rag_db = None
+        return False
     except Exception as e:
         logging.error(f"[RAG_DEBUG] Exception in RAG endpoint: {e}", exc_info=True)
         logging.error(f"[RAG_DEBUG] RAG DB type: {type(rag_db)}")
@@ -105,6 +149,25 @@ def load_rag_database():
 rag_db = None
 load_rag_database()
 
+# Background ingestion: uploads and deletions queue a job instead of blocking the request
+INGEST_DEBOUNCE_SECONDS = float(os.getenv("INGEST_DEBOUNCE_SECONDS", "2"))
+
+def run_ingestion(job):
+    """Re-embed the job's re-ingested files and sync the policy folder into the RAG database."""
+    logging.info(f"[INGEST] Running ingestion for job {job.id}")
+    summary = run_ingestion_job(ingestor, job)
+    job.message = (f"Indexed {summary.get('chunks_added', 0)} chunks from {summary.get('files_ingested', 0)} "
+                   f"changed file(s) and removed {summary.get('chunks_removed', 0)} stale chunks")
+    logging.info(f"[INGEST] Ingestion completed: {job.message}")
+
+def reload_after_ingestion(job):
+    answer_cache.invalidate()
+    if not load_rag_database() and os.path.exists(persist_dir):
+        raise RuntimeError('Ingestion finished but the RAG database could not be loaded')
+
+ingestion_queue = IngestionQueue(run_ingestion, debounce_seconds=INGEST_DEBOUNCE_SECONDS,
+                                 on_success=reload_after_ingestion)
+
 # Initialize LLM globally
 llm = ChatOpenAI(model="gpt-3.5-turbo", openai_api_key=openai_key) if openai_key else None
 if llm:
@@ -122,106 +185,102 @@ def test_cors():
     return jsonify({'success': True, 'message': 'CORS is working properly'})
 
 # Serve static files
-from docx import Document
-import PyPDF2
 ai_agent_bp = Blueprint('ai_agent', __name__, url_prefix='/ai-agent')
 
-@ai_agent_bp.route('/extract-form-data', methods=['POST'])
-def extract_form_data():
+def evidence_name_error(docs_dir, names):
+    """Error response for requested evidence names that are not bare file names or not in docs_dir, or None."""
+    if not isinstance(names, list):
+        return jsonify({'success': False, 'error': '"files" must be a list of file names'}), 400
+    invalid, missing = check_evidence_names(docs_dir, names)
+    if invalid:
+        return jsonify({'success': False, 'error': 'Invalid file names', 'invalid': invalid}), 400
+    if missing:
+        return jsonify({'success': False, 'error': 'Unknown evidence files', 'missing': missing}), 404
+    return None
+
+def requested_extractions():
+    """Return (extractions, error response or None) for an extraction request.
+
+    `extractions` yields (file name, result) pairs in completion order. With
+    a claim_id only that claim's files that have not been extracted yet are
+    processed, and it yields (file name, result, reprocessed) for all of the
+    claim's files; otherwise every file in the evidence folder is processed.
+    """
     docs_dir = app.config['UPLOAD_FOLDER']
+    data = request.get_json(silent=True) or {}
+    claim_id = data.get('claim_id') or request.args.get('claim_id')
+    if claim_id:
+        file_names = data.get('files') or []
+        error = evidence_name_error(docs_dir, file_names)
+        if error is not None:
+            return None, error
+        return iter_claim_extractions(llm, evidence_manifest, str(claim_id), docs_dir, file_names,
+                                      cache=extraction_cache), None
     logging.info(f"[EXTRACT] Scanning evidence directory: {docs_dir}")
+    file_paths = [os.path.join(docs_dir, fname) for fname in find_evidence(docs_dir)]
+    return iter_extractions(llm, file_paths, cache=extraction_cache), None
+
+@ai_agent_bp.route('/extract-form-data', methods=['POST'])
+def extract_form_data():
+    # Files are parsed and sent to the LLM concurrently; results come back in file-name order
+    extractions, error = requested_extractions()
+    if error is not None:
+        return error
     extracted = {}
-    for fname in os.listdir(docs_dir):
-        if fname.lower().endswith(('.pdf', '.docx', '.txt')):
-            file_path = os.path.join(docs_dir, fname)
-            logging.info(f"[EXTRACT] Processing file: {file_path}")
-            try:
-                if fname.lower().endswith('.txt'):
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                elif fname.lower().endswith('.docx'):
-                    doc = Document(file_path)
-                    content = '\n'.join([para.text for para in doc.paragraphs])
-                elif fname.lower().endswith('.pdf'):
-                    content = ""
-                    with open(file_path, 'rb') as f:
-                        reader = PyPDF2.PdfReader(f)
-                        for page in reader.pages:
-                            content += page.extract_text() or ""
-                else:
-                    content = f"File {fname} is not a supported type."
-                # Application schema summary (field: description)
-                schema = '''
-firstName: Applicant's first name
-lastName: Applicant's last name
-dateOfBirth: Applicant's date of birth
-nationalInsuranceNumber: Applicant's National Insurance number
-addressLine1: Address line 1
-addressLine2: Address line 2
-town: Town or city
-county: County
-postcode: Postcode
-phoneNumber: Phone number
-email: Email address
-partnerFirstName: Partner's first name
-partnerLastName: Partner's last name
-partnerDateOfBirth: Partner's date of birth
-partnerNationalInsuranceNumber: Partner's National Insurance number
-partnerBenefitsReceived: Benefits the partner receives
-partnerSavings: Partner's savings
-deceasedFirstName: Deceased's first name
-deceasedLastName: Deceased's last name
-deceasedDateOfBirth: Deceased's date of birth
-deceasedDateOfDeath: Deceased's date of death
-deceasedPlaceOfDeath: Place of death
-deceasedCauseOfDeath: Cause of death
-deceasedCertifyingDoctor: Certifying doctor
-deceasedCertificateIssued: Certificate issued
-relationshipToDeceased: Relationship to deceased
-supportingEvidence: Supporting evidence
-responsibilityStatement: Responsibility statement
-responsibilityDate: Responsibility date
-benefitType: Type of benefit
-benefitReferenceNumber: Benefit reference number
-benefitLetterDate: Date on benefit letter
-householdBenefits: Household benefits (array)
-incomeSupportDetails: Details about Income Support
-disabilityBenefits: Disability benefits (array)
-carersAllowance: Carer's Allowance
-carersAllowanceDetails: Carer's Allowance details
-funeralDirector: Funeral director
-funeralEstimateNumber: Funeral estimate number
-funeralDateIssued: Date funeral estimate issued
-funeralTotalEstimatedCost: Total estimated funeral cost
-funeralDescription: Funeral description
-funeralContact: Funeral contact
-evidence: Evidence documents (array)
-'''
-                prompt = f'''
-You are an expert assistant helping to process evidence for a funeral expenses claim. The following is the application schema:
-{schema}
-
-Read the following evidence and extract all information relevant to the claim. For each field you extract, provide:
-- The field name (from the schema above)
-- The value
-- A short explanation of your reasoning or the evidence source (e.g. "Found in death certificate under 'Date of death'")
-If a field is not directly mentioned but can be inferred, include it and explain your inference.
-Return your answer as a JSON object where each key is a field name, and each value is an object with 'value' and 'reasoning'.
-
-Evidence:
-{content}
-'''
-                if llm is None:
-                    logging.error(f"[EXTRACT ERROR] {fname}: LLM not initialized properly")
-                    extracted[fname] = "Error: AI model not available. Check OpenAI API key configuration."
-                else:
-                    response = llm.invoke(prompt)
-                    extracted[fname] = str(response.content) if hasattr(response, 'content') else str(response)
-                    logging.info(f"[EXTRACT] Extraction result for {fname}: {extracted[fname]}")
-            except Exception as e:
-                logging.error(f"[EXTRACT ERROR] {fname}: {e}", exc_info=True)
-                extracted[fname] = f"Error extracting: {e}"
-    return jsonify(extracted)
+    for fname, result, *reprocessed in extractions:
+        # Claim requests also say which files this request extracted
+        extracted[fname] = {'result': result, 'reprocessed': reprocessed[0]} if reprocessed else result
+    return jsonify({fname: extracted[fname] for fname in sorted(extracted)})
+
+@ai_agent_bp.route('/extract-form-data/stream', methods=['POST'])
+def extract_form_data_stream():
+    """Stream one record per evidence file as it finishes, then a summary record.
+
+    Newline-delimited JSON by default; Server-Sent Events when the client
+    sends `Accept: text/event-stream`.
+    """
+    extractions, error = requested_extractions()
+    if error is not None:
+        return error
+    records = extraction_records(extractions)
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        events = (f"event: {record['type']}\ndata: {json.dumps(record)}\n\n" for record in records)
+        return Response(events, mimetype='text/event-stream', headers=headers)
+    lines = (json.dumps(record) + "\n" for record in records)
+    return Response(lines, mimetype='application/x-ndjson', headers=headers)
+
+@ai_agent_bp.route('/evidence-manifest/<claim_id>', methods=['GET', 'DELETE'])
+def claim_evidence(claim_id):
+    """Parse and extraction status of a claim's evidence files; DELETE forgets the claim and its cached text."""
+    if request.method == 'DELETE':
+        return jsonify({'success': True, 'removed': forget_claim_files(evidence_manifest, claim_id)})
+    return jsonify({'claim_id': claim_id, 'files': evidence_manifest.files(claim_id)})
+
+@ai_agent_bp.route('/extraction-cache', methods=['DELETE'])
+def invalidate_extraction_cache():
+    """Drop cached extractions for the named evidence files ({"files": [...]}), or all of them.
+
+    Claims holding those files have them reset to pending, so their next
+    request extracts them again instead of returning the stored result, and
+    the files' cached text is deleted.
+    """
+    data = request.get_json(silent=True) or {}
+    names = data.get('files')
+    if names is None:
+        removed = extraction_cache.invalidate()
+        reset = evidence_manifest.reset()
+        evidence_text_reader().clear()
+        return jsonify({'success': True, 'removed': removed, 'reset': reset})
+    docs_dir = app.config['UPLOAD_FOLDER']
+    error = evidence_name_error(docs_dir, names)
+    if error is not None:
+        return error
+    file_hashes = [file_sha256(os.path.join(docs_dir, name)) for name in names]
+    removed = extraction_cache.invalidate(file_hashes)
+    reset = evidence_manifest.reset(file_hashes)
+    evidence_text_reader().discard(file_hashes)
+    return jsonify({'success': True, 'removed': removed, 'reset': reset})
 
 # --- List policy documents in RAG ---
 @ai_agent_bp.route('/docs', methods=['GET'])
@@ -234,16 +293,27 @@ def list_docs():
         # Ensure the directory exists
         os.makedirs(docs_dir, exist_ok=True)
         
+        # Index catalogue kept by ingestion: one lookup per file, no collection scan
+        stats = None
+        if rag_db is not None:
+            try:
+                stats = ingestor.stats()
+            except Exception as rag_err:
+                logging.error(f"[DOCS] Error reading the index catalogue: {rag_err}", exc_info=True)
+        
         # Get all files with details
         files = []
         for filename in os.listdir(docs_dir):
             if filename.lower().endswith(('.pdf', '.docx', '.txt')):
                 file_path = os.path.join(docs_dir, filename)
                 if os.path.isfile(file_path):
+                    stat = os.stat(file_path)
                     file_info = {
                         'name': filename,
-                        'size': os.path.getsize(file_path),
-                        'last_modified': os.path.getmtime(file_path)
+                        'size': stat.st_size,
+                        'last_modified': stat.st_mtime,
+                        'rag_status': stats.source_status(filename, stat.st_size, stat.st_mtime) if stats else 'pending',
+                        'index': stats.source_info(filename) if stats else None
                     }
                     files.append(file_info)
         
@@ -253,17 +323,14 @@ def list_docs():
         # Get RAG database status
         rag_status = {'initialized': False, 'document_count': 0}
         
-        if rag_db is not None:
-            try:
-                db_data = rag_db.get()
-                if db_data and 'documents' in db_data:
-                    rag_status = {
-                        'initialized': True,
-                        'document_count': len(db_data['documents'])
-                    }
-                logging.info(f"[DOCS] RAG status: {rag_status}")
-            except Exception as rag_err:
-                logging.error(f"[DOCS] Error getting RAG status: {rag_err}", exc_info=True)
+        if stats is not None:
+            rag_status = {
+                'initialized': True,
+                'document_count': stats.chunk_count,
+                'indexed_files': len(stats.catalogue),
+                'generation': stats.generation
+            }
+            logging.info(f"[DOCS] RAG status: {rag_status}")
         
         logging.info(f"[DOCS] Found {len(files)} documents")
         
@@ -301,81 +368,29 @@ def delete_doc(filename):
             # Delete the file
             os.remove(file_path)
             logging.info(f"[DELETE] Removed file: {file_path}")
-        else:
-            # Re-ingestion mode - make a backup but don't delete
-            logging.info(f"[DELETE] Re-ingestion mode for file: {file_path}")
-            # We'll proceed with re-ingestion without deleting the original
-        
-        # Re-ingest all docs to update RAG DB
-        import subprocess
-        logging.info("[DELETE] Starting re-ingestion after file deletion")
+
+            # Its chunks are dropped in the background by the next folder sync,
+            # so the request does not wait behind a running ingestion
+            job = ingestion_queue.submit([filename], reason='delete')
+            return jsonify({
+                'success': True,
+                'job_id': job.id,
+                'status_url': f'/ai-agent/ingest-jobs/{job.id}'
+            }), 202
+
+        # Re-ingestion mode - keep the file and re-index it in the background
+        logging.info(f"[DELETE] Re-ingestion mode for file: {file_path}")
         try:
-            # Check if there are any documents left
-            remaining_docs = [f for f in os.listdir(docs_dir) 
-                             if os.path.isfile(os.path.join(docs_dir, f)) and 
-                             f.lower().endswith(('.pdf', '.docx', '.txt'))]
-            
-            global rag_db
-            if not remaining_docs and not re_ingest_mode:
-                logging.info("[DELETE] No documents left, clearing the vector database")
-                # If no documents left, we should clear the vector database
-                persist_dir = os.path.join(os.path.dirname(__file__), 'chroma_db')
-                if os.path.exists(persist_dir):
-                    import shutil
-                    try:
-                        # Backup the database first
-                        backup_dir = persist_dir + "_backup_delete"
-                        if os.path.exists(backup_dir):
-                            shutil.rmtree(backup_dir)
-                        shutil.copytree(persist_dir, backup_dir)
-                        
-                        # Remove the database
-                        shutil.rmtree(persist_dir)
-                        logging.info("[DELETE] Successfully cleared vector database")
-                        
-                        # Set rag_db to None since there's no database anymore
-                        rag_db = None
-                    except Exception as rm_err:
-                        logging.error(f"[DELETE] Error clearing vector database: {rm_err}", exc_info=True)
-                        return jsonify({'success': False, 'error': f'File deleted but database clearing failed: {str(rm_err)}'}), 500
-            else:
-                # Run the ingestion script to rebuild the database
-                result = subprocess.run([
-                    'python', os.path.join(os.path.dirname(__file__), 'ingest_docs.py')
-                ], check=True, capture_output=True, text=True)
-                
-                if result.stderr:
-                    logging.warning(f"[DELETE] Re-ingestion warnings: {result.stderr}")
-                
-                logging.info("[DELETE] Re-ingestion completed successfully")
-                
-                # Reload the RAG database
-                try:
-                    persist_dir = os.path.join(os.path.dirname(__file__), 'chroma_db')
-                    if not os.path.exists(persist_dir):
-                        logging.error(f"[DELETE] Vector database directory not found at {persist_dir}")
-                        return jsonify({'success': False, 'error': 'File deleted but database directory not found'}), 500
-                        
-                    # Reload the database
-                    rag_db = Chroma(persist_directory=persist_dir, embedding_function=embeddings)
-                    
-                    # Verify the database has documents
-                    db_data = rag_db.get()
-                    if not db_data or 'documents' not in db_data or not db_data['documents']:
-                        logging.warning("[DELETE] Reloaded RAG database has no documents")
-                    else:
-                        logging.info(f"[DELETE] Successfully reloaded RAG database with {len(db_data['documents'])} chunks")
-                except Exception as reload_err:
-                    logging.error(f"[DELETE] Failed to reload RAG database: {reload_err}", exc_info=True)
-                    return jsonify({'success': False, 'error': f'File deleted but database reload failed: {str(reload_err)}'}), 500
-        except subprocess.CalledProcessError as e:
-            logging.error(f"[DELETE] Re-ingestion failed: {e.stderr}")
-            return jsonify({'success': False, 'error': f'File deleted but re-ingestion failed: {e.stderr}'}), 500
+            job = ingestion_queue.submit([filename], reason='reingest', force=True)
         except Exception as e:
-            logging.error(f"[DELETE] Error during re-ingestion: {e}", exc_info=True)
-            return jsonify({'success': False, 'error': f'File deleted but re-ingestion failed: {str(e)}'}), 500
+            logging.error(f"[DELETE] Error queueing re-ingestion: {e}", exc_info=True)
+            return jsonify({'success': False, 'error': f'Re-ingestion failed: {str(e)}'}), 500
             
-        return jsonify({'success': True})
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status_url': f'/ai-agent/ingest-jobs/{job.id}'
+        }), 202
     except Exception as e:
         logging.error(f"[RAG_DEBUG] Exception in RAG endpoint: {e}", exc_info=True)
         logging.error(f"[RAG_DEBUG] RAG DB type: {type(rag_db)}")
@@ -387,6 +402,17 @@ def delete_doc(filename):
 def health():
     return jsonify({'status': 'ok'}), 200
 
+@ai_agent_bp.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Report hit/miss counters for the agent's caches."""
+    return jsonify({
+        'embeddings': embeddings.stats(),
+        'query_embeddings': query_embeddings.stats(),
+        'answers': answer_cache.stats(),
+        'extractions': extraction_cache.stats(),
+        'evidence_text': evidence_text_reader().stats()
+    })
+
 @ai_agent_bp.route('/upload', methods=['POST'])
 def upload():
     if 'file' not in request.files:
@@ -419,80 +445,50 @@ def upload():
         logging.error(f"[UPLOAD] Error saving file: {save_error}", exc_info=True)
         return jsonify({'success': False, 'error': f'Error saving file: {str(save_error)}'}), 500
     
-    # Automatically ingest after upload
+    # Queue ingestion in the background; the client polls the job for progress
     try:
-        logging.info("[UPLOAD] Running document ingestion...")
-        import subprocess
-        script_path = os.path.join(os.path.dirname(__file__), 'ingest_docs.py')
-        
-        # Run ingestion script with additional logging
-        logging.info(f"[UPLOAD] Running ingestion script at {script_path}")
-        
-        # Run with full environment
-        env = os.environ.copy()
-        result = subprocess.run([
-            'python', script_path
-        ], check=True, capture_output=True, text=True, env=env)
-        
-        logging.info(f"[UPLOAD] Ingestion completed with output: {result.stdout}")
-        if result.stderr:
-            logging.warning(f"[UPLOAD] Ingestion warnings: {result.stderr}")
-        
-        # Reload the vector database - make this a global variable change
-        global rag_db
-        persist_dir = os.path.join(os.path.dirname(__file__), 'chroma_db')
-        try:
-            # Check if the database exists first
-            if not os.path.exists(persist_dir):
-                logging.error(f"[UPLOAD] Vector database directory not found at {persist_dir}")
-                return jsonify({
-                    'success': False, 
-                    'error': f'Document saved but RAG database directory not found'
-                }), 500
-                
-            # Try to reload the database
-            logging.info(f"[UPLOAD] Reloading RAG database from {persist_dir}")
-            
-            # Re-initialize embeddings to ensure they match what was used during ingestion
-            local_embeddings = OpenAIEmbeddings(openai_api_key=openai_key)
-            rag_db = Chroma(persist_directory=persist_dir, embedding_function=local_embeddings)
-            
-            # Verify the database has documents
-            db_data = rag_db.get()
-            if not db_data or 'documents' not in db_data or not db_data['documents']:
-                logging.warning("[UPLOAD] Reloaded RAG database has no documents")
-            else:
-                logging.info(f"[UPLOAD] Successfully reloaded RAG database with {len(db_data['documents'])} chunks")
-        except Exception as reload_err:
-            logging.error(f"[UPLOAD] Failed to reload RAG database: {reload_err}", exc_info=True)
-            return jsonify({
-                'success': False, 
-                'error': f'Document saved but RAG database reload failed: {str(reload_err)}'
-            }), 500
-        
+        job = ingestion_queue.submit([filename], reason='upload')
+        logging.info(f"[UPLOAD] Queued ingestion job {job.id} for {filename}")
         return jsonify({
             'success': True, 
-            'message': f'Document {filename} uploaded and processed successfully',
+            'message': f'Document {filename} uploaded; processing has started',
             'fileSize': file_size,
-            'filename': filename  # Return the secure filename for frontend verification
-        })
-    except subprocess.CalledProcessError as proc_err:
-        logging.error(f"[UPLOAD] Ingestion process error: {proc_err}", exc_info=True)
-        if proc_err.stderr:
-            logging.error(f"[UPLOAD] Ingestion stderr: {proc_err.stderr}")
-        return jsonify({
-            'success': False, 
-            'error': f'Upload succeeded but ingestion failed. Process error: {proc_err.stderr or str(proc_err)}'
-        })
+            'filename': filename,  # Return the secure filename for frontend verification
+            'job_id': job.id,
+            'status_url': f'/ai-agent/ingest-jobs/{job.id}'
+        }), 202
     except Exception as e:
-        logging.error(f"[RAG_DEBUG] Exception in RAG endpoint: {e}", exc_info=True)
-        logging.error(f"[RAG_DEBUG] RAG DB type: {type(rag_db)}")
-        logging.error(f"[UPLOAD] Error during ingestion: {e}", exc_info=True)
+        logging.error(f"[UPLOAD] Error queueing ingestion: {e}", exc_info=True)
         return jsonify({
             'success': False, 
-            'error': f'Upload succeeded but ingestion failed: {str(e)}'
+            'error': f'Upload succeeded but ingestion could not be queued: {str(e)}'
         })
 
+@ai_agent_bp.route('/ingest-jobs/<job_id>', methods=['GET'])
+def ingest_job_status(job_id):
+    """Report the status and progress of a background ingestion job."""
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown ingestion job'}), 404
+    return jsonify(job.to_dict())
+
+def rag_prompt(docs, question):
+    """Prompt asking the LLM to answer `question` from the retrieved policy chunks.
+
+    The chunks are packed into the RAG_CONTEXT_TOKENS budget, best first.
+    """
+    context = pack_context(docs).text
+    return f"""Use the following DWP policy context to answer the question. 
+If the context doesn't contain relevant information to answer the question, 
+say so clearly and suggest what other information might be needed.
+
+POLICY CONTEXT:
+{context}
+
+QUESTION: {question}
+
+If possible, cite the specific policy or document section that contains your answer."""
+
 @ai_agent_bp.route('/rag', methods=['POST'])
 def rag():
     # Add test response to confirm the endpoint is reachable
@@ -532,35 +528,34 @@ def rag():
         
     try:
         # Check if the database has documents
-        db_data = rag_db.get()
-        if not db_data or 'documents' not in db_data or not db_data['documents']:
+        stats = ingestor.stats()
+        if stats.is_empty:
             return jsonify({
                 'response': 'The policy knowledge base contains no documents. Please upload policy documents first.',
                 'error': 'no_documents'
             })
             
-        # Get similar documents
-        docs = rag_db.similarity_search(user_input, k=3)
+        # Exact-term questions are answered from the lexical index without embedding
+        query_vector = None
+        docs = retriever.exact_term_search(user_input, k=RAG_CONTEXT_CANDIDATES)
+        if docs is None:
+            # Reuse the answer to a near-identical question if the index is unchanged
+            query_vector = query_embeddings.embed_query(user_input)
+            cached_answer = answer_cache.lookup(query_vector, stats.generation, question=user_input)
+            if cached_answer is not None:
+                logging.info("[RAG] Answer served from the semantic answer cache")
+                return jsonify({"response": cached_answer, "cached": True})
+
+            # Get similar documents
+            docs = retriever.search(user_input, k=RAG_CONTEXT_CANDIDATES, query_vector=query_vector)
         if not docs:
             return jsonify({
                 'response': 'I couldn\'t find any relevant policy information to answer your question. Try asking about a different topic or upload more relevant policy documents.',
                 'error': 'no_relevant_docs'
             })
             
-        # Create context from documents
-        context = "\n\n".join([d.page_content for d in docs])
-        
-        # Create prompt
-        prompt = f"""Use the following DWP policy context to answer the question. 
-If the context doesn't contain relevant information to answer the question, 
-say so clearly and suggest what other information might be needed.
-
-POLICY CONTEXT:
-{context}
-
-QUESTION: {user_input}
-
-If possible, cite the specific policy or document section that contains your answer."""
+        # Create prompt from the retrieved documents
+        prompt = rag_prompt(docs, user_input)
         
         # Log the prompt
         logging.info(f"[RAG] Using prompt with {len(docs)} documents, prompt length: {len(prompt)}")
@@ -575,6 +570,8 @@ If possible, cite the specific policy or document section that contains your ans
             response_content = str(response)
             
         logging.info(f"[RAG] Generated response length: {len(response_content)}")
+        if query_vector is not None:
+            answer_cache.store(query_vector, stats.generation, response_content, question=user_input)
         
         # Return response
         return jsonify({"response": response_content})
@@ -588,6 +585,92 @@ If possible, cite the specific policy or document section that contains your ans
             'error': str(e)
         }), 500
 
+# LLM calls a batch request runs at once
+RAG_BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "4"))
+# Largest number of questions accepted in one batch request
+RAG_BATCH_MAX_QUESTIONS = int(os.getenv("RAG_BATCH_MAX_QUESTIONS", "200"))
+
+@ai_agent_bp.route('/rag/batch', methods=['POST'])
+def rag_batch():
+    """Answer a list of policy questions in one request.
+
+    Questions are embedded together and retrieved with one vector search; the
+    LLM calls then run concurrently. Answers come back in input order, each
+    with its own error if that question failed.
+    """
+    questions = (request.json or {}).get('questions')
+    if not isinstance(questions, list) or not questions or \
+            not all(isinstance(q, str) and q.strip() for q in questions):
+        return jsonify({'error': 'Provide "questions" as a non-empty list of strings.'}), 400
+    if len(questions) > RAG_BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'At most {RAG_BATCH_MAX_QUESTIONS} questions are accepted per request.'}), 400
+    logging.info(f"[RAG-BATCH] Answering {len(questions)} questions")
+
+    if rag_db is None:
+        return jsonify({
+            'error': 'rag_not_loaded',
+            'response': 'The policy knowledge base is not loaded. Please upload policy documents first.'
+        })
+
+    try:
+        stats = ingestor.stats()
+        if stats.is_empty:
+            return jsonify({
+                'error': 'no_documents',
+                'response': 'The policy knowledge base contains no documents. Please upload policy documents first.'
+            })
+
+        answers = [{'question': question} for question in questions]
+        docs_for = {}
+        # Exact-term questions are answered from the lexical index without embedding
+        to_embed = []
+        for i, question in enumerate(questions):
+            docs = retriever.exact_term_search(question, k=RAG_CONTEXT_CANDIDATES)
+            if docs is None:
+                to_embed.append(i)
+            else:
+                docs_for[i] = docs
+
+        vectors = dict(zip(to_embed, query_embeddings.embed_queries([questions[i] for i in to_embed])))
+        to_search = []
+        for i in to_embed:
+            cached_answer = answer_cache.lookup(vectors[i], stats.generation, question=questions[i])
+            if cached_answer is not None:
+                answers[i].update(response=cached_answer, cached=True)
+            else:
+                to_search.append(i)
+        if to_search:
+            results = retriever.search_many([questions[i] for i in to_search], RAG_CONTEXT_CANDIDATES,
+                                            [vectors[i] for i in to_search])
+            docs_for.update(zip(to_search, results))
+    except Exception as e:
+        logging.error(f"[RAG-BATCH] Retrieval failed: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+    def answer(i):
+        docs = docs_for[i]
+        if not docs:
+            answers[i].update(error='no_relevant_docs',
+                              response='I couldn\'t find any relevant policy information to answer this question.')
+            return
+        try:
+            response = llm.invoke(rag_prompt(docs, questions[i]))
+            response_content = response.content if hasattr(response, 'content') else str(response)
+            answers[i]['response'] = response_content
+            if i in vectors:
+                answer_cache.store(vectors[i], stats.generation, response_content, question=questions[i])
+        except Exception as e:
+            logging.error(f"[RAG-BATCH] Error answering question {i}: {e}", exc_info=True)
+            answers[i].update(error=str(e),
+                              response='I encountered an error while searching the policy knowledge base.')
+
+    with ThreadPoolExecutor(max_workers=max(1, RAG_BATCH_CONCURRENCY)) as pool:
+        list(pool.map(answer, sorted(docs_for)))
+
+    logging.info(f"[RAG-BATCH] Answered {len(questions)} questions "
+                 f"({sum(1 for a in answers if a.get('cached'))} from the answer cache)")
+    return jsonify({'answers': answers})
+
 #Funny prompt
 funny_prompt =  os.environ.get('funny_prompt')
 
@@ -602,6 +685,7 @@ class ConversationState(TypedDict):
     need_search: bool = False
     search_results: str = ""
     RAG: bool 
+    route: str = None
 
 
 # 2. Initialize the LLM and search tool
@@ -630,6 +714,11 @@ need_to_search = False
 # 3. LangGraph nodes
 def decide_search(state: ConversationState) -> ConversationState:
     global need_to_search
+    if state.get('route') in (ROUTE_WEB, ROUTE_GENERAL):
+        # Already decided by the query router; no LLM call needed
+        state['need_search'] = state['route'] == ROUTE_WEB
+        need_to_search = state['need_search']
+        return state
     question = f"""
     Your task is to determine whether a question requires a web search to answer accurately and completely.
 
@@ -752,10 +841,10 @@ def chat():
         
         if rag_db is not None:
             try:
-                db_data = rag_db.get()
-                if db_data and 'documents' in db_data and len(db_data['documents']) > 0:
+                stats = ingestor.stats()
+                if not stats.is_empty:
                     rag_available = True
-                    rag_document_count = len(db_data['documents'])
+                    rag_document_count = stats.chunk_count
                     logging.info(f"[CHAT] RAG is available with {rag_document_count} chunks")
                 else:
                     logging.info("[CHAT] RAG database is empty")
@@ -764,43 +853,44 @@ def chat():
         else:
             logging.info("[CHAT] RAG database is not initialized")
         
-        # Determine if we should use RAG based on the query and availability
-        use_rag = False
-        if rag_available:
-            # Simple heuristic: if "policy" or related terms in question, use RAG
-            policy_keywords = ["policy", "dwp", "regulation", "benefit", "funeral", "payment", 
-                              "document", "documentation", "guidelines", "rules", "assistance"]
-            
-            if any(word.lower() in user_input.lower() for word in policy_keywords):
-                use_rag = True
-                logging.info("[CHAT] Using RAG based on query keywords")
-            else:
-                logging.info("[CHAT] Query doesn't match RAG keywords, using web search")
+        # Route the question: policy questions use RAG, the rest go to the web agent
+        route = None
+        try:
+            route = router.route(user_input).route
+        except Exception as e:
+            logging.error(f"[CHAT] Query routing failed: {e}", exc_info=True)
+        use_rag = rag_available and route == ROUTE_POLICY
+        if use_rag:
+            logging.info("[CHAT] Using RAG for a policy question")
+        else:
+            logging.info(f"[CHAT] Routed to '{route}', using the web agent")
         
         # Try RAG first if available and applicable
         if use_rag:
             try:
                 logging.info("[CHAT] Using RAG agent")
-                # Get relevant chunks from RAG
-                docs = rag_db.similarity_search(user_input, k=3)
+                generation = ingestor.stats().generation
+                # Exact-term questions are answered from the lexical index without embedding
+                query_vector = None
+                docs = retriever.exact_term_search(user_input, k=RAG_CONTEXT_CANDIDATES)
+                if docs is None:
+                    # Reuse the answer to a near-identical question if the index is unchanged
+                    query_vector = query_embeddings.embed_query(user_input)
+                    cached_answer = answer_cache.lookup(query_vector, generation, question=user_input)
+                    if cached_answer is not None:
+                        logging.info("[CHAT] Answer served from the semantic answer cache")
+                        user_sessions[session_id] = history + f"\nYou: {user_input}\nAssistant: {cached_answer}"
+                        return jsonify({"response": cached_answer, "source": "rag", "cached": True})
+
+                    # Get relevant chunks from RAG
+                    docs = retriever.search(user_input, k=RAG_CONTEXT_CANDIDATES, query_vector=query_vector)
                 
                 if not docs:
                     logging.info("[CHAT] No relevant documents found in RAG database, falling back to web search")
                     use_rag = False
                 else:
-                    context = "\n\n".join([d.page_content for d in docs])
-                    
                     # Create an informative prompt
-                    prompt = f"""Use the following DWP policy context to answer the question. 
-If the context doesn't contain relevant information to answer the question, 
-say so clearly and suggest what other information might be needed.
-
-POLICY CONTEXT:
-{context}
-
-QUESTION: {user_input}
-
-If possible, cite the specific policy or document section that contains your answer."""
+                    prompt = rag_prompt(docs, user_input)
                     
                     logging.info(f"[CHAT] RAG prompt created with {len(docs)} chunks")
                     
@@ -813,6 +903,8 @@ If possible, cite the specific policy or document section that contains your ans
                             response_content = str(response)
                         
                         logging.info(f"[CHAT] RAG LLM returned response of length {len(response_content)}")
+                        if query_vector is not None:
+                            answer_cache.store(query_vector, generation, response_content, question=user_input)
                         
                         # Update session history
                         user_sessions[session_id] = history + f"\nYou: {user_input}\nAssistant: {response_content}"
@@ -835,7 +927,8 @@ If possible, cite the specific policy or document section that contains your ans
                 logging.info("[CHAT] Using web search agent")
                 
                 # Initialize state for LangGraph
-                state = ConversationState(input=user_input, history=history, search_results="", need_search=False, RAG=False)
+                state = ConversationState(input=user_input, history=history, search_results="", need_search=False, RAG=False,
+                                          route=route)
                 logging.info(f"[CHAT] Web agent initial state created")
                 
                 try:
@@ -919,6 +1012,11 @@ def check_form():
     try:
         content = request.json.get('content', '')
         logging.info(f"[CHECK-FORM] Received form data length: {len(content)}")
+        # Very long forms are cut to a fixed token budget so the prompt always fits the model
+        truncated = truncate_to_tokens(content, CHECK_FORM_MAX_TOKENS)
+        if truncated != content:
+            logging.warning(f"[CHECK-FORM] Form content truncated to {CHECK_FORM_MAX_TOKENS} tokens")
+            content = truncated
         
         # Verify llm is properly initialized
         if llm is None:
@@ -932,9 +1030,9 @@ def check_form():
             "Suggest improvements or flag any issues.\n\n" + content
         )
         # Use RAG if available
-        if rag_db is not None:
-            docs = rag_db.similarity_search(content, k=3)
-            context = "\n\n".join([d.page_content for d in docs])
+        if rag_db is not None and not ingestor.stats().is_empty:
+            docs = retriever.search(content, k=RAG_CONTEXT_CANDIDATES)
+            context = pack_context(docs).text
             policy_prompt = (
                 f"Use the following DWP policy context to check the form:\n{context}\n\n" + policy_prompt
             )
@@ -970,47 +1068,39 @@ def verify_file(filename):
     logging.info(f"[VERIFY] Checking if file exists: {file_path}")
     
     if os.path.exists(file_path) and os.path.isfile(file_path):
-        file_size = os.path.getsize(file_path)
-        last_modified = os.path.getmtime(file_path)
+        stat = os.stat(file_path)
+        file_size = stat.st_size
+        last_modified = stat.st_mtime
         
-        # Check if it's in the Chroma DB by listing all documents
+        # Look the file up in the index catalogue kept by ingestion
         in_rag = False
+        rag_status = 'pending'
+        index_info = None
         if rag_db is not None:
             try:
-                # This is a simple heuristic - if the vector DB exists and has docs, 
-                # we assume the file was processed (a more accurate check would require 
-                # storing document metadata in Chroma)
-                docs_count = len(rag_db.get()['documents']) if rag_db.get() and 'documents' in rag_db.get() else 0
-                in_rag = docs_count > 0
-                logging.info(f"[VERIFY] Vector DB has {docs_count} documents")
+                stats = ingestor.stats()
+                index_info = stats.source_info(filename)
+                rag_status = stats.source_status(filename, file_size, last_modified)
+                in_rag = index_info is not None and index_info['chunk_count'] > 0
+                logging.info(f"[VERIFY] Vector DB has {stats.chunks_for(filename)} chunks from {filename}")
             except Exception as e:
                 logging.error(f"[VERIFY] Error checking RAG DB: {e}", exc_info=True)
         
-        logging.info(f"[VERIFY] File exists: {file_path}, size: {file_size} bytes, in RAG: {in_rag}")
+        logging.info(f"[VERIFY] File exists: {file_path}, size: {file_size} bytes, in RAG: {in_rag} ({rag_status})")
         
         return jsonify({
             'exists': True, 
             'size': file_size,
             'last_modified': last_modified,
             'path': file_path,
-            'in_rag': in_rag
+            'in_rag': in_rag,
+            'rag_status': rag_status,
+            'index': index_info
         })
     else:
         logging.warning(f"[VERIFY] File does not exist: {file_path}")
         return jsonify({'exists': False}), 404
 
-# Register blueprint and log routes for debugging
-app.register_blueprint(ai_agent_bp)
-logging.info("[INIT] Registered ai_agent blueprint at /ai-agent")
-
-# Print all registered routes for debugging
-logging.info("Registered routes:")
-for rule in app.url_map.iter_rules():
-    logging.info(f"Route: {rule.endpoint} - {rule.rule} - {rule.methods}")
-
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5050, debug=True)
-
 @ai_agent_bp.route('/debug-rag', methods=['GET'])
 def debug_rag():
     try:
@@ -1019,8 +1109,8 @@ def debug_rag():
             return jsonify({'status': 'not_loaded', 'error': 'RAG database is not loaded'})
             
         # Check if the database has documents
-        db_data = rag_db.get()
-        if not db_data or 'documents' not in db_data or not db_data['documents']:
+        stats = ingestor.stats()
+        if stats.is_empty:
             return jsonify({
                 'status': 'empty', 
                 'error': 'The policy knowledge base contains no documents'
@@ -1029,9 +1119,11 @@ def debug_rag():
         # Return success with document count
         return jsonify({
             'status': 'loaded',
-            'document_count': len(db_data['documents']),
-            'embedding_type': str(type(rag_db._embedding_function)),
-            'persist_dir': rag_db._persist_directory
+            'document_count': stats.chunk_count,
+            'embedding_type': str(type(rag_db.embeddings)),
+            'index_engine': rag_db.engine,
+            'persist_dir': stats.index_dir,
+            'index': stats.to_dict()
         })
         
     except Exception as e:
@@ -1042,3 +1134,13 @@ def debug_rag():
             'status': 'error',
             'error': str(e)
         }), 500
+
+# Register blueprint and log routes for debugging; after every route, since
+# a registered blueprint cannot take new ones
+app.register_blueprint(ai_agent_bp)
+logging.info("[INIT] Registered ai_agent blueprint at /ai-agent")
+
+# Print all registered routes for debugging
+logging.info("Registered routes:")
+for rule in app.url_map.iter_rules():
+    logging.info(f"Route: {rule.endpoint} - {rule.rule} - {rule.methods}")
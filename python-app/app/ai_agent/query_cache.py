@@ -0,0 +1,255 @@
+"""In-process caches for the query path.
+
+`QueryEmbeddingCache` keeps recently embedded questions in memory, keyed by
+normalised query text, so a repeated question skips the embedding call (and
+the on-disk cache lookup) entirely. Only the key is normalised: the question
+is embedded as asked, since case can carry meaning for the model.
+
+`AnswerCache` reuses a RAG answer for any later question whose embedding is
+close enough to one already answered, as long as the index generation that
+produced the answer is still the live one. Embedding similarity is blind to
+the details that change an answer: "Can I get £500?" and "Can I get £700?",
+or "Am I eligible?" and "Am I not eligible?", score well above any usable
+threshold. A hit therefore also needs the same exact terms (amounts,
+distances, quoted phrases, capitalised benefit names) and negations as the
+cached question. Differences these checks cannot see, such as a benefit
+named in lower case, can still be served a wrong answer; raise
+ANSWER_CACHE_THRESHOLD or set ANSWER_CACHE_SIZE=0 where that matters.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import embed_queries, embedding_model_name
+from hybrid_search import exact_terms
+
+# Maximum number of query vectors held in memory
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+# Seconds a cached query vector stays valid (0 = never expires)
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+
+# Maximum number of answers kept by the semantic answer cache (0 disables it)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+# Minimum cosine similarity between questions for a cached answer to be reused
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+# Seconds a cached answer stays valid even if the index does not change (0 = no limit)
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+
+_WHITESPACE = re.compile(r"\s+")
+_WORD = re.compile(r"[a-z]+(?:['’][a-z]+)?")
+_NEGATIONS = frozenset("""
+no not never neither nor none nobody nothing without cannot can't won't don't doesn't didn't
+isn't aren't wasn't weren't haven't hasn't hadn't shouldn't wouldn't couldn't
+""".split())
+
+
+def normalise_query(text):
+    """Case-fold and collapse whitespace so trivially different questions share a key."""
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def answer_terms(question):
+    """Terms two questions must share for one's answer to serve the other: exact terms and negations."""
+    if not question:
+        return frozenset()
+    negations = {word.replace('’', "'") for word in _WORD.findall(question.lower())} & _NEGATIONS
+    return frozenset(exact_terms(question)) | negations
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU mapping with an optional per-entry TTL."""
+
+    def __init__(self, max_entries, ttl_seconds=0, clock=time.monotonic):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl_seconds and self.clock() - stored_at > self.ttl_seconds:
+                    del self._entries[key]
+                    self.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class QueryEmbeddingCache(Embeddings):
+    """Embeddings wrapper that memoises `embed_query` in an in-memory LRU/TTL cache.
+
+    Document embedding passes straight through to the wrapped embeddings.
+    """
+
+    def __init__(self, embeddings, max_entries=None, ttl_seconds=None):
+        self.embeddings = embeddings
+        self.model_name = embedding_model_name(embeddings)
+        self.cache = LRUCache(max_entries or QUERY_CACHE_SIZE,
+                              QUERY_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds)
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = normalise_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+        return list(vector)
+
+    def embed_queries(self, texts):
+        """Embed several questions; every uncached one goes through one embed_queries() call."""
+        keys = [normalise_query(text) for text in texts]
+        vectors = {}
+        for key in keys:
+            vector = self.cache.get(key)
+            if vector is not None:
+                vectors[key] = vector
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            embedded = embed_queries(self.embeddings, missing.values())
+            for key, vector in zip(missing, embedded):
+                self.cache.put(key, vector)
+                vectors[key] = vector
+        return [list(vectors[key]) for key in keys]
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class AnswerCache:
+    """Semantic cache of RAG answers keyed by query embedding.
+
+    Each answer is stored with the index generation that produced it. Looking
+    up with a different generation drops every older entry, so answers never
+    outlive the documents they were drawn from.
+    """
+
+    def __init__(self, max_entries=None, threshold=None, ttl_seconds=None, clock=time.monotonic):
+        self.max_entries = ANSWER_CACHE_SIZE if max_entries is None else max_entries
+        self.threshold = ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self.ttl_seconds = ANSWER_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.clock = clock
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._vectors = []   # unit-length query vectors
+        self._entries = []   # (answer, stored_at, question, answer_terms), parallel to _vectors
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_generation(self, generation):
+        if generation != self.generation:
+            if self._entries:
+                self.invalidations += 1
+            self._vectors, self._entries = [], []
+            self.generation = generation
+
+    def lookup(self, query_vector, generation, question=None):
+        """Return the cached answer for the most similar question with the same answer terms, or None."""
+        with self._lock:
+            self._check_generation(generation)
+            if self.max_entries <= 0 or not self._vectors:
+                self.misses += 1
+                return None
+            if self.ttl_seconds:
+                cutoff = self.clock() - self.ttl_seconds
+                live = [i for i, entry in enumerate(self._entries) if entry[1] >= cutoff]
+                self._vectors = [self._vectors[i] for i in live]
+                self._entries = [self._entries[i] for i in live]
+                if not live:
+                    self.misses += 1
+                    return None
+            similarities = np.stack(self._vectors) @ self._unit(query_vector)
+            terms = answer_terms(question)
+            for best in np.argsort(-similarities):
+                if similarities[best] < self.threshold:
+                    break
+                if self._entries[best][3] == terms:
+                    self.hits += 1
+                    return self._entries[best][0]
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, generation, answer, question=None):
+        with self._lock:
+            if self.generation is not None and generation != self.generation:
+                # The index changed while this answer was being generated
+                return
+            self._check_generation(generation)
+            if self.max_entries <= 0:
+                return
+            self._vectors.append(self._unit(query_vector))
+            self._entries.append((answer, self.clock(), question, answer_terms(question)))
+            if len(self._entries) > self.max_entries:
+                # Oldest first
+                del self._vectors[0], self._entries[0]
+
+    def invalidate(self):
+        with self._lock:
+            self._check_generation(None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,221 @@
+"""Embedding-based routing of chat questions.
+
+Each route (policy, web, general) is represented by the centroid of a few
+labelled example questions. A question goes to the route whose centroid is
+most similar to its embedding. When the best route is not clearly ahead, the
+router asks a fallback (normally the LLM) instead, so most chat turns are
+routed without an extra LLM call.
+
+What counts as "clearly ahead" depends on the embedding model: OpenAI
+vectors put related questions around 0.8 cosine similarity, while a local
+MiniLM model puts them nearer 0.5. Unless set explicitly, both thresholds
+are calibrated from the examples themselves. Each example is routed against
+centroids built without it, and the thresholds are a low percentile of the
+similarity and lead of the examples routed correctly.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+
+ROUTE_POLICY = 'policy'    # answer from the policy knowledge base (RAG)
+ROUTE_WEB = 'web'          # needs current or external information (web search)
+ROUTE_GENERAL = 'general'  # chit-chat or general knowledge (LLM alone)
+ROUTES = (ROUTE_POLICY, ROUTE_WEB, ROUTE_GENERAL)
+
+# Minimum cosine similarity to the best centroid for a confident decision
+# (empty = calibrate from the examples)
+ROUTER_MIN_SIMILARITY = os.getenv("ROUTER_MIN_SIMILARITY", "")
+# Minimum lead of the best centroid over the runner-up for a confident decision
+# (empty = calibrate from the examples)
+ROUTER_MARGIN = os.getenv("ROUTER_MARGIN", "")
+# Percentile of the held-out examples' similarity and lead used as calibrated thresholds
+ROUTER_CALIBRATION_PERCENTILE = float(os.getenv("ROUTER_CALIBRATION_PERCENTILE", "10"))
+
+DEFAULT_EXAMPLES = {
+    ROUTE_POLICY: [
+        "Who is eligible for a Funeral Expenses Payment?",
+        "What does the DWP policy say about burial fees?",
+        "Which benefits do I need to be getting to qualify?",
+        "How long do I have to make a claim after the funeral?",
+        "What evidence do I need to send with my application?",
+        "Can I claim travel costs to arrange the funeral?",
+        "Is there a limit on other funeral expenses?",
+        "Does the payment have to be paid back from the estate?",
+        "Who counts as the responsible person for the funeral?",
+        "What are the rules if the deceased lived abroad?",
+    ],
+    ROUTE_WEB: [
+        "What is the weather in London today?",
+        "What are the latest news headlines?",
+        "What is the current exchange rate for the euro?",
+        "When is the next bank holiday?",
+        "Find a funeral director near me",
+        "What time does the local council office open?",
+        "Who won the football match last night?",
+        "What is the current average cost of a funeral in the UK?",
+    ],
+    ROUTE_GENERAL: [
+        "Hello",
+        "Thank you for your help",
+        "How are you?",
+        "What can you do?",
+        "Can you explain that more simply?",
+        "Tell me a joke",
+        "What does bereavement mean?",
+        "Write a short condolence message",
+    ],
+}
+
+LLM_ROUTER_PROMPT = """Classify the user's question into exactly one category and reply with that word only.
+
+policy: about DWP benefits, Funeral Expenses Payment rules, eligibility, claims or evidence
+web: needs current, location-specific or real-time information from the internet
+general: greetings, chit-chat or general knowledge that needs no documents or search
+
+Question: {question}"""
+
+
+def llm_route(llm, question):
+    """Ask the LLM for a route; returns None if the reply names none."""
+    response = llm.invoke(LLM_ROUTER_PROMPT.format(question=question))
+    reply = (response.content if hasattr(response, 'content') else str(response)).strip().lower()
+    for route in ROUTES:
+        if reply.startswith(route):
+            return route
+    return next((route for route in ROUTES if route in reply), None)
+
+
+class RouteDecision:
+    """Outcome of routing one question."""
+
+    def __init__(self, route, similarity, margin, scores, source):
+        self.route = route
+        self.similarity = similarity
+        self.margin = margin
+        self.scores = scores      # route -> cosine similarity to its centroid
+        self.source = source      # 'embedding', or 'fallback' when the router was unsure
+
+    def to_dict(self):
+        return {
+            'route': self.route,
+            'similarity': round(self.similarity, 4),
+            'margin': round(self.margin, 4),
+            'source': self.source
+        }
+
+
+class QueryRouter:
+    """Routes questions to the nearest labelled-example centroid.
+
+    Centroids are embedded on first use (the examples go through the shared
+    embedding cache, so this is one request per model, ever), and thresholds
+    not given explicitly are calibrated at the same time. `fallback` is
+    called with the question when the decision is not confident and should
+    return a route or None.
+    """
+
+    def __init__(self, embeddings, examples=None, min_similarity=None, margin=None, fallback=None,
+                 percentile=None):
+        self.embeddings = embeddings
+        self.examples = examples or DEFAULT_EXAMPLES
+        if min_similarity is None and ROUTER_MIN_SIMILARITY:
+            min_similarity = float(ROUTER_MIN_SIMILARITY)
+        if margin is None and ROUTER_MARGIN:
+            margin = float(ROUTER_MARGIN)
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self.calibrated = min_similarity is None or margin is None
+        self.percentile = ROUTER_CALIBRATION_PERCENTILE if percentile is None else percentile
+        self.fallback = fallback
+        self.decisions = {route: 0 for route in self.examples}
+        self.fallbacks = 0
+        self._routes = None
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def centroids(self):
+        with self._lock:
+            if self._centroids is None:
+                routes = list(self.examples)
+                texts = [text for route in routes for text in self.examples[route]]
+                vectors = self._unit(self.embeddings.embed_documents(texts))
+                labels = np.repeat(np.arange(len(routes)), [len(self.examples[route]) for route in routes])
+                sums = np.stack([vectors[labels == i].sum(axis=0) for i in range(len(routes))])
+                self._routes, self._centroids = routes, self._unit(sums)
+                logging.info(f"[ROUTER] Built centroids for {len(routes)} routes from {len(texts)} examples")
+                if self.calibrated:
+                    self._calibrate(vectors, labels, sums)
+            return self._routes, self._centroids
+
+    def _calibrate(self, vectors, labels, sums):
+        """Set unset thresholds from how confidently held-out examples are routed."""
+        similarities, leads = [], []
+        counts = np.bincount(labels, minlength=len(sums))
+        for vector, label in zip(vectors, labels):
+            if counts[label] < 2:
+                continue
+            held_out = sums.copy()
+            held_out[label] -= vector
+            scores = self._unit(held_out) @ vector
+            order = np.argsort(-scores)
+            if order[0] == label:
+                similarities.append(float(scores[order[0]]))
+                leads.append(float(scores[order[0]] - scores[order[1]]) if len(order) > 1 else 1.0)
+        if similarities:
+            min_similarity = float(np.percentile(similarities, self.percentile))
+            margin = float(np.percentile(leads, self.percentile))
+        else:
+            # The examples do not separate with this model: always ask the fallback
+            min_similarity, margin = 1.0, 1.0
+        if self.min_similarity is None:
+            self.min_similarity = min_similarity
+        if self.margin is None:
+            self.margin = margin
+        logging.info(f"[ROUTER] Calibrated thresholds from {len(similarities)} of {len(vectors)} examples: "
+                     f"similarity {self.min_similarity:.3f}, margin {self.margin:.3f}")
+
+    def route(self, question, query_vector=None):
+        """Return a RouteDecision for the question.
+
+        `query_vector`, if the caller already embedded the question, avoids a
+        second embedding call.
+        """
+        routes, centroids = self.centroids()
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(question)
+        similarities = centroids @ self._unit(query_vector)
+        order = np.argsort(-similarities)
+        best = float(similarities[order[0]])
+        lead = best - float(similarities[order[1]]) if len(order) > 1 else best
+        scores = {route: float(similarity) for route, similarity in zip(routes, similarities)}
+        route, source = routes[order[0]], 'embedding'
+
+        if (best < self.min_similarity or lead < self.margin) and self.fallback is not None:
+            try:
+                fallback_route = self.fallback(question)
+            except Exception as e:
+                logging.error(f"[ROUTER] Fallback routing failed: {e}", exc_info=True)
+                fallback_route = None
+            if fallback_route in scores:
+                route, source = fallback_route, 'fallback'
+            with self._lock:
+                self.fallbacks += 1
+
+        with self._lock:
+            self.decisions[route] += 1
+        logging.info(f"[ROUTER] Routed to {route} ({source}; similarity {best:.3f}, margin {lead:.3f})")
+        return RouteDecision(route, best, lead, scores, source)
+
+    def stats(self):
+        with self._lock:
+            return {'decisions': dict(self.decisions), 'fallbacks': self.fallbacks,
+                    'min_similarity': self.min_similarity, 'margin': self.margin,
+                    'calibrated': self.calibrated}
@@ -0,0 +1,22 @@
+"""Entry point for the AI agent server.
+
+    python ai_agent/server.py
+
+Parser worker processes (forkserver or spawn) re-import the `__main__`
+module of the process that started them. This module therefore does nothing
+at import time: workers re-import it for free, while main.py's setup (Flask
+app, caches, vector index, BM25 index, LLM clients) runs only in the server
+process.
+"""
+import os
+import sys
+
+
+def run():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from main import app
+    app.run(host="0.0.0.0", port=5050, debug=True)
+
+
+if __name__ == "__main__":
+    run()
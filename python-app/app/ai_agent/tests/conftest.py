@@ -68,6 +68,56 @@ def mock_chroma_client():
     
     return MockChromaClient()
 
+@pytest.fixture
+def evidence_text_reader(tmp_path, monkeypatch):
+    """Parse evidence in-process with a sidecar cache under tmp_path"""
+    import evidence_text
+    reader = evidence_text.EvidenceTextReader(str(tmp_path / "evidence_text"), workers=0)
+    monkeypatch.setattr(evidence_text, '_reader', reader)
+    return reader
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+class CountingLLM:
+    """LLM stand-in that records every prompt it answers"""
+
+    model_name = 'test-model'
+
+    def __init__(self, fail_on=None):
+        self.prompts = []
+        self.fail_on = fail_on
+
+    def invoke(self, prompt):
+        if self.fail_on and self.fail_on in prompt:
+            raise RuntimeError("LLM unavailable")
+        self.prompts.append(prompt)
+        return FakeMessage('{"call": %d}' % len(self.prompts))
+
+@pytest.fixture
+def counting_llm():
+    """Factory for LLM stand-ins that record prompts; `fail_on` makes prompts containing it raise"""
+    return CountingLLM
+
+@pytest.fixture
+def write_evidence():
+    """Write evidence files into a folder and return their paths.
+
+    Takes {file name: text}, or a list of names each holding "Evidence in <name>".
+    """
+    def write(folder, contents):
+        if not isinstance(contents, dict):
+            contents = {name: f'Evidence in {name}' for name in contents}
+        paths = []
+        for name, text in contents.items():
+            path = os.path.join(str(folder), name)
+            with open(path, 'w') as f:
+                f.write(text)
+            paths.append(path)
+        return paths
+    return write
+
 @pytest.fixture
 def test_pdf_path(tmp_path):
     """Create a sample PDF file for testing"""
@@ -0,0 +1,86 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langchain_core.documents import Document
+from context_packer import pack_context, remove_overlap, truncate_to_tokens
+
+
+class WordEncoding:
+    """One token per whitespace-separated word, so budgets are easy to reason about"""
+
+    def encode(self, text):
+        return text.split(' ') if text else []
+
+    def decode(self, tokens):
+        return ' '.join(tokens)
+
+
+ENCODING = WordEncoding()
+SHARED = 'claims must be made within six months of the funeral'
+
+
+def doc(text, source='policy.pdf'):
+    return Document(page_content=text, metadata={'source': source})
+
+
+class TestRemoveOverlap:
+    """Tests for trimming text shared with neighbouring chunks"""
+
+    def test_prefix_shared_with_previous_chunk_is_trimmed(self):
+        previous = f'The payment covers burial fees. {SHARED}'
+        assert remove_overlap(f'{SHARED}. Evidence is required.', [previous]) == '. Evidence is required.'
+
+    def test_suffix_shared_with_next_chunk_is_trimmed(self):
+        following = f'{SHARED}. Evidence is required.'
+        assert remove_overlap(f'The payment covers burial fees. {SHARED}', [following]) == \
+            'The payment covers burial fees.'
+
+    def test_contained_chunk_is_dropped(self):
+        assert remove_overlap(SHARED, [f'Note: {SHARED}.']) == ''
+
+    def test_short_coincidental_match_is_kept(self):
+        assert remove_overlap('the funeral payment', ['paid for the funeral']) == 'the funeral payment'
+
+
+class TestPackContext:
+    """Tests for packing ranked chunks into a token budget"""
+
+    def test_chunks_keep_rank_order_within_budget(self):
+        docs = [doc('first chunk text'), doc('second chunk text', 'b.pdf'), doc('third', 'c.pdf')]
+
+        packed = pack_context(docs, budget=100, encoding=ENCODING)
+
+        assert packed.text == 'first chunk text\n\nsecond chunk text\n\nthird'
+        assert packed.docs == docs
+
+    def test_overlapping_chunks_are_deduplicated(self):
+        docs = [doc(f'The payment covers burial fees. {SHARED}'), doc(f'{SHARED}. Evidence is required.')]
+
+        packed = pack_context(docs, budget=100, encoding=ENCODING)
+
+        assert packed.text.count(SHARED) == 1
+        assert packed.text.endswith('Evidence is required.')
+
+    def test_overlap_is_only_removed_within_a_document(self):
+        docs = [doc(f'Intro. {SHARED}', 'a.pdf'), doc(f'{SHARED}. Other rules.', 'b.pdf')]
+
+        assert pack_context(docs, budget=100, encoding=ENCODING).text.count(SHARED) == 2
+
+    def test_budget_skips_long_chunks_but_keeps_shorter_ones(self):
+        docs = [doc('one two three'), doc('a b c d e f g h', 'b.pdf'), doc('short one', 'c.pdf')]
+
+        packed = pack_context(docs, budget=6, encoding=ENCODING)
+
+        assert packed.text == 'one two three\n\nshort one'
+        assert packed.dropped == 1
+        assert packed.tokens <= 6
+
+    def test_best_chunk_is_truncated_rather_than_dropped(self):
+        packed = pack_context([doc('a b c d e f g h')], budget=3, encoding=ENCODING)
+
+        assert packed.text == 'a b c'
+
+    def test_truncate_to_tokens(self):
+        assert truncate_to_tokens('a b c d', 2, ENCODING) == 'a b'
+        assert truncate_to_tokens('a b', 5, ENCODING) == 'a b'
@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from document_parsing import parse_document, parse_documents, ParseTimeout
+
+
+def slow_or_broken_parse(file_path):
+    """Stand-in parser: hangs on 'hang' files, takes half a second over 'slow' ones and raises on 'corrupt' ones"""
+    name = os.path.basename(file_path)
+    if name.startswith('slow'):
+        time.sleep(0.5)
+    if name.startswith('hang'):
+        time.sleep(60)
+    if name.startswith('corrupt'):
+        raise ValueError('corrupt document')
+    return [name]
+
+
+class TestParseDocuments:
+    """Tests for parallel document parsing"""
+
+    def test_parses_and_splits_text_files(self, tmp_path):
+        """A text file is loaded, tagged with its source and split into chunks"""
+        path = os.path.join(str(tmp_path), "policy.txt")
+        with open(path, 'w') as f:
+            f.write("Eligibility rules. " * 200)
+
+        chunks = parse_document(path)
+
+        assert len(chunks) > 1
+        assert all(chunk.metadata['source'] == path for chunk in chunks)
+
+    def test_parallel_results_cover_every_file(self, tmp_path):
+        """Each file yields exactly one result when parsed across worker processes"""
+        paths = []
+        for i in range(4):
+            path = os.path.join(str(tmp_path), f"doc{i}.txt")
+            with open(path, 'w') as f:
+                f.write(f"Document {i}")
+            paths.append(path)
+
+        results = {path: (chunks, error) for path, chunks, error in parse_documents(paths, workers=2)}
+
+        assert set(results) == set(paths)
+        assert all(error is None for _, error in results.values())
+        assert results[paths[3]][0][0].page_content == "Document 3"
+
+    def test_errors_are_isolated_per_file(self):
+        """A file that fails to parse does not affect the others"""
+        results = list(parse_documents(['a.txt', 'corrupt.pdf', 'b.txt'], workers=0,
+                                       parse=slow_or_broken_parse))
+
+        assert [(path, chunks) for path, chunks, _ in results] == [
+            ('a.txt', ['a.txt']), ('corrupt.pdf', None), ('b.txt', ['b.txt'])]
+        assert isinstance(results[1][2], ValueError)
+
+    def test_hung_file_times_out_without_stalling_the_batch(self):
+        """A worker stuck on one file is abandoned after the timeout"""
+        started = time.monotonic()
+        results = {path: (chunks, error) for path, chunks, error in
+                   parse_documents(['hang.pdf', 'a.txt', 'b.txt'], workers=2, timeout=3,
+                                   parse=slow_or_broken_parse)}
+
+        assert time.monotonic() - started < 30
+        assert isinstance(results['hang.pdf'][1], ParseTimeout)
+        assert results['a.txt'] == (['a.txt'], None)
+        assert results['b.txt'] == (['b.txt'], None)
+
+    def test_slow_consumer_does_not_time_out_finished_files(self, tmp_path):
+        """Time the caller spends handling a result is not counted against files still in flight"""
+        paths = []
+        # Each slow file finishes while the caller is still busy with the quick one
+        for name in ['quick1.txt', 'slow1.txt', 'quick2.txt', 'slow2.txt']:
+            path = os.path.join(str(tmp_path), name)
+            with open(path, 'w') as f:
+                f.write(name)
+            paths.append(path)
+
+        results = {}
+        for path, chunks, error in parse_documents(paths, workers=2, timeout=2, parse=slow_or_broken_parse):
+            results[path] = error
+            time.sleep(3)
+
+        assert results == {path: None for path in paths}
+
+
+class TestWorkerEntryPoint:
+    """Parser workers re-import __main__; the server's entry module must be free to import"""
+
+    def test_server_module_does_not_import_main(self):
+        agent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        # What a forkserver or spawn worker does with the parent's __main__
+        code = ("import runpy, sys; runpy.run_path(sys.argv[1], run_name='__mp_main__'); "
+                "print('main' in sys.modules)")
+        result = subprocess.run([sys.executable, '-c', code, os.path.join(agent_dir, 'server.py')],
+                                capture_output=True, text=True, timeout=60)
+
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == 'False'
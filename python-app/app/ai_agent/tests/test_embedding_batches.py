@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_batches import BatchEmbedder, AdaptiveLimiter, is_rate_limit_error
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FlakyEmbeddings:
+    """Embeddings that rate-limit the first few calls and track concurrency"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+            if self.failures:
+                self.failures -= 1
+                raise RateLimitError('Error code: 429 - rate limit reached')
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return [[float(len(t))] for t in texts]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class TestBatchEmbedder:
+    """Tests for batched, rate-limit-aware embedding"""
+
+    def test_embeds_in_batches_preserving_order(self):
+        """Texts are split into provider-sized batches and reassembled in order"""
+        embeddings = FlakyEmbeddings()
+        embedder = BatchEmbedder(embeddings, batch_size=3, max_concurrency=2)
+        texts = ['a' * n for n in range(1, 11)]
+
+        vectors = embedder.embed(texts)
+
+        assert vectors == [[float(n)] for n in range(1, 11)]
+        assert sorted(len(batch) for batch in embeddings.calls) == [1, 3, 3, 3]
+        assert embeddings.max_in_flight <= 2
+
+    def test_rate_limited_batch_is_retried(self):
+        """A throttled batch backs off and retries instead of failing the run"""
+        delays = []
+        embeddings = FlakyEmbeddings(failures=2)
+        embedder = BatchEmbedder(embeddings, batch_size=5, max_concurrency=4, sleep=delays.append)
+
+        vectors = embedder.embed(['abc', 'de'])
+
+        assert vectors == [[3.0], [2.0]]
+        assert len(delays) == 2
+        assert embedder.limiter.limit < 4
+
+    def test_gives_up_after_max_retries(self):
+        """Persistent rate limiting eventually raises"""
+        embedder = BatchEmbedder(FlakyEmbeddings(failures=10), batch_size=5, max_retries=2, sleep=lambda s: None)
+
+        with pytest.raises(RateLimitError):
+            embedder.embed(['abc'])
+
+    def test_other_errors_are_not_retried(self):
+        """Only rate-limit errors are retried"""
+        class BrokenEmbeddings:
+            calls = 0
+
+            def embed_documents(self, texts):
+                BrokenEmbeddings.calls += 1
+                raise ValueError('bad input')
+
+        embedder = BatchEmbedder(BrokenEmbeddings(), batch_size=5, sleep=lambda s: None)
+        with pytest.raises(ValueError):
+            embedder.embed(['abc'])
+        assert BrokenEmbeddings.calls == 1
+
+
+class TestAdaptiveLimiter:
+    """Tests for the AIMD concurrency limiter"""
+
+    def test_halves_on_throttle_and_recovers(self):
+        limiter = AdaptiveLimiter(4)
+        limiter.throttle()
+        assert limiter.limit == 2
+        for _ in range(2):
+            limiter.acquire()
+            limiter.release(success=True)
+        assert limiter.limit == 3
+
+    def test_detects_rate_limit_errors(self):
+        assert is_rate_limit_error(RateLimitError('slow down'))
+        assert is_rate_limit_error(Exception('HTTP 429 Too Many Requests'))
+        assert not is_rate_limit_error(ValueError('bad input'))
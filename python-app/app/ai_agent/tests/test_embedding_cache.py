@@ -0,0 +1,94 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_cache import CachedEmbeddings, embed_queries
+
+
+class RecordingEmbeddings:
+    """Offline embeddings that record every text sent to the 'provider'"""
+
+    model = 'test-embedding-model'
+
+    def __init__(self):
+        self.documents = []
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.documents.extend(texts)
+        return [[float(len(t)), 0.5] for t in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 0.5]
+
+
+class TestCachedEmbeddings:
+    """Tests for the persistent embedding cache"""
+
+    def test_repeat_documents_are_served_from_cache(self, tmp_path):
+        """Unchanged chunk text is only embedded once, even across instances"""
+        path = str(tmp_path / "cache.sqlite3")
+        provider = RecordingEmbeddings()
+        cached = CachedEmbeddings(provider, cache_path=path)
+
+        first = cached.embed_documents(['alpha', 'beta', 'alpha'])
+        assert first == [[5.0, 0.5], [4.0, 0.5], [5.0, 0.5]]
+        assert provider.documents == ['alpha', 'beta']
+
+        # A new process (e.g. the ingestion CLI) sees the same cache
+        reopened = CachedEmbeddings(provider, cache_path=path)
+        assert reopened.embed_documents(['beta', 'alpha']) == [[4.0, 0.5], [5.0, 0.5]]
+        assert provider.documents == ['alpha', 'beta']
+        assert reopened.stats()['hits'] == 2
+        assert reopened.stats()['misses'] == 0
+
+    def test_queries_share_the_cache(self, tmp_path):
+        """A query whose text was already embedded makes no provider call"""
+        provider = RecordingEmbeddings()
+        cached = CachedEmbeddings(provider, cache_path=str(tmp_path / "cache.sqlite3"))
+
+        cached.embed_query('who is eligible?')
+        cached.embed_query('who is eligible?')
+
+        assert provider.queries == ['who is eligible?']
+        stats = cached.stats()
+        assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+
+    def test_batched_queries_use_the_query_path(self, tmp_path):
+        """Uncached questions in a batch are embedded as queries and cached like embed_query()"""
+        provider = RecordingEmbeddings()
+        cached = CachedEmbeddings(provider, cache_path=str(tmp_path / "cache.sqlite3"))
+        cached.embed_query('who is eligible?')
+
+        vectors = embed_queries(cached, ['who is eligible?', 'how much?', 'how much?'])
+
+        assert vectors == [[16.0, 0.5], [9.0, 0.5], [9.0, 0.5]]
+        assert provider.queries == ['who is eligible?', 'how much?']
+        assert provider.documents == []
+
+    def test_keys_include_model_name(self, tmp_path):
+        """Vectors from a different model are never reused"""
+        path = str(tmp_path / "cache.sqlite3")
+        provider = RecordingEmbeddings()
+        CachedEmbeddings(provider, cache_path=path).embed_documents(['alpha'])
+        CachedEmbeddings(provider, cache_path=path, model_name='other-model').embed_documents(['alpha'])
+
+        assert provider.documents == ['alpha', 'alpha']
+
+    def test_size_based_eviction(self, tmp_path):
+        """Least recently used vectors are evicted once the size limit is exceeded"""
+        provider = RecordingEmbeddings()
+        # Each two-float vector takes 8 bytes; allow three of them
+        cached = CachedEmbeddings(provider, cache_path=str(tmp_path / "cache.sqlite3"), max_bytes=24)
+
+        cached.embed_documents(['a', 'bb', 'ccc'])
+        cached.embed_query('a')
+        cached.embed_documents(['dddd'])
+
+        stats = cached.stats()
+        assert stats['bytes'] <= 24
+        assert stats['evictions'] >= 1
+        provider.documents.clear()
+        cached.embed_documents(['a'])
+        assert provider.documents == []
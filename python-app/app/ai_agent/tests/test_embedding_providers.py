@@ -0,0 +1,52 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_providers import LocalEmbeddings, create_embeddings
+from embedding_cache import embedding_model_name
+
+
+class FakeVector(list):
+    def tolist(self):
+        return list(self)
+
+
+class FakeSentenceTransformer:
+    """Stands in for a sentence-transformers model"""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size, **kwargs):
+        self.calls.append((list(texts), batch_size, kwargs))
+        return [FakeVector([float(len(t)), 1.0]) for t in texts]
+
+
+class TestLocalEmbeddings:
+    """Tests for the local sentence-transformers backend"""
+
+    def test_documents_are_encoded_in_batches(self):
+        """Documents are passed to the model with the configured batch size"""
+        client = FakeSentenceTransformer()
+        embeddings = LocalEmbeddings('all-MiniLM-L6-v2', batch_size=16, client=client)
+
+        assert embeddings.embed_documents(['ab', 'abc']) == [[2.0, 1.0], [3.0, 1.0]]
+        texts, batch_size, kwargs = client.calls[0]
+        assert batch_size == 16
+        assert kwargs['normalize_embeddings'] is True
+
+    def test_query_embedding(self):
+        embeddings = LocalEmbeddings('all-MiniLM-L6-v2', client=FakeSentenceTransformer())
+        assert embeddings.embed_query('abcd') == [4.0, 1.0]
+        assert embeddings.embed_queries(['ab', 'abcd']) == [[2.0, 1.0], [4.0, 1.0]]
+
+    def test_model_name_identifies_the_backend(self):
+        """The model name is what the cache and the index manifest record"""
+        embeddings = create_embeddings(provider='local', model='all-MiniLM-L6-v2')
+        assert isinstance(embeddings, LocalEmbeddings)
+        assert embedding_model_name(embeddings) == 'all-MiniLM-L6-v2'
+
+    def test_unknown_provider_is_rejected(self):
+        with pytest.raises(ValueError):
+            create_embeddings(provider='nope')
@@ -0,0 +1,210 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import evidence_extraction
+from evidence_extraction import extraction_records, forget_claim_files, iter_claim_extractions
+from evidence_manifest import CACHED, EXTRACTED, FAILED, PARSED, PENDING, EvidenceManifest
+from extraction_cache import ExtractionCache
+
+pytestmark = pytest.mark.usefixtures('evidence_text_reader')
+
+
+def claim_extractions(*args, **kwargs):
+    """{file name: {'result', 'reprocessed'}} from iter_claim_extractions, in file-name order"""
+    return {fname: {'result': result, 'reprocessed': reprocessed}
+            for fname, result, reprocessed in sorted(iter_claim_extractions(*args, **kwargs))}
+
+
+class TestEvidenceManifest:
+    """Tests for claim-scoped evidence extraction"""
+
+    def test_only_the_claims_new_files_are_extracted(self, tmp_path, write_evidence, counting_llm):
+        """Other claims' files are ignored and extracted files are not redone, but still returned"""
+        write_evidence(tmp_path, {'a.txt': 'Claim one death certificate', 'b.txt': 'Claim one invoice',
+                                  'c.txt': 'Claim two letter'})
+        manifest = EvidenceManifest(str(tmp_path / "manifest.sqlite3"))
+        llm = counting_llm()
+
+        first = claim_extractions(llm, manifest, 'claim-1', str(tmp_path), ['a.txt', 'b.txt'])
+        assert list(first) == ['a.txt', 'b.txt']
+        assert all(r['reprocessed'] for r in first.values())
+        assert len(llm.prompts) == 2
+
+        write_evidence(tmp_path, {'d.txt': 'Claim one benefit letter'})
+        second = claim_extractions(llm, manifest, 'claim-1', str(tmp_path), ['a.txt', 'b.txt', 'd.txt'])
+        assert {name: r['reprocessed'] for name, r in second.items()} == {'a.txt': False, 'b.txt': False,
+                                                                          'd.txt': True}
+        assert second['a.txt']['result'] == first['a.txt']['result']
+        assert len(llm.prompts) == 3
+
+        third = claim_extractions(llm, manifest, 'claim-1', str(tmp_path))
+        assert list(third) == ['a.txt', 'b.txt', 'd.txt']
+        assert not any(r['reprocessed'] for r in third.values())
+        assert len(llm.prompts) == 3
+        assert [row['file_name'] for row in manifest.files('claim-2')] == []
+        statuses = {row['file_name']: (row['parse_status'], row['extraction_status'])
+                    for row in manifest.files('claim-1')}
+        assert statuses == {name: (PARSED, EXTRACTED) for name in ['a.txt', 'b.txt', 'd.txt']}
+
+    def test_changed_file_is_extracted_again(self, tmp_path, write_evidence, counting_llm):
+        """New bytes under the same name reset the file to pending"""
+        write_evidence(tmp_path, {'a.txt': 'First version'})
+        manifest = EvidenceManifest(str(tmp_path / "manifest.sqlite3"))
+        llm = counting_llm()
+        claim_extractions(llm, manifest, 'claim-1', str(tmp_path), ['a.txt'])
+
+        write_evidence(tmp_path, {'a.txt': 'Second, longer version'})
+        result = claim_extractions(llm, manifest, 'claim-1', str(tmp_path), ['a.txt'])
+
+        assert result == {'a.txt': {'result': '{"call": 2}', 'reprocessed': True}}
+        assert len(llm.prompts) == 2
+
+    def test_failures_are_recorded_and_retried(self, tmp_path, write_evidence, counting_llm):
+        """A failed extraction stays pending for the next request"""
+        write_evidence(tmp_path, {'a.txt': 'Good evidence', 'b.txt': 'Troublesome evidence'})
+        manifest = EvidenceManifest(str(tmp_path / "manifest.sqlite3"))
+
+        result = claim_extractions(counting_llm(fail_on='Troublesome'), manifest, 'claim-1', str(tmp_path),
+                                   ['a.txt', 'b.txt'])
+        assert result['b.txt']['result'].startswith('Error')
+        row = manifest.get('claim-1', 'b.txt')
+        assert (row['parse_status'], row['extraction_status']) == (PARSED, FAILED)
+        assert 'LLM unavailable' in row['error']
+        assert [row['file_name'] for row in manifest.pending('claim-1')] == ['b.txt']
+
+        llm = counting_llm()
+        retried = claim_extractions(llm, manifest, 'claim-1', str(tmp_path))
+        assert {name: r['reprocessed'] for name, r in retried.items()} == {'a.txt': False, 'b.txt': True}
+        assert len(llm.prompts) == 1
+        assert manifest.pending('claim-1') == []
+
+    def test_cached_extractions_are_shared_between_claims(self, tmp_path, write_evidence, counting_llm):
+        """The same document in a second claim comes from the extraction cache"""
+        write_evidence(tmp_path, {'a.txt': 'Shared document'})
+        manifest = EvidenceManifest(str(tmp_path / "manifest.sqlite3"))
+        cache = ExtractionCache(str(tmp_path / "extractions.sqlite3"))
+        llm = counting_llm()
+
+        first = claim_extractions(llm, manifest, 'claim-1', str(tmp_path), ['a.txt'], cache=cache)
+        second = claim_extractions(llm, manifest, 'claim-2', str(tmp_path), ['a.txt'], cache=cache)
+
+        assert second == first
+        assert len(llm.prompts) == 1
+        row = manifest.get('claim-2', 'a.txt')
+        assert (row['parse_status'], row['extraction_status']) == (CACHED, EXTRACTED)
+
+    def test_stored_results_need_no_extraction_cache(self, tmp_path, write_evidence, counting_llm):
+        """Results kept in the manifest are returned by a new instance without an LLM call"""
+        write_evidence(tmp_path, {'a.txt': 'Death certificate'})
+        manifest_path = str(tmp_path / "manifest.sqlite3")
+        first = claim_extractions(counting_llm(), EvidenceManifest(manifest_path), 'claim-1', str(tmp_path),
+                                  ['a.txt'])
+        llm = counting_llm()
+
+        result = claim_extractions(llm, EvidenceManifest(manifest_path), 'claim-1', str(tmp_path))
+
+        assert result == {'a.txt': {'result': first['a.txt']['result'], 'reprocessed': False}}
+        assert llm.prompts == []
+
+    def test_invalidated_extractions_are_redone(self, tmp_path, write_evidence, counting_llm):
+        """Invalidating a file's cached extraction resets it to pending in every claim"""
+        write_evidence(tmp_path, {'a.txt': 'Death certificate', 'b.txt': 'Funeral invoice'})
+        manifest = EvidenceManifest(str(tmp_path / "manifest.sqlite3"))
+        cache = ExtractionCache(str(tmp_path / "extractions.sqlite3"))
+        llm = counting_llm()
+        claim_extractions(llm, manifest, 'claim-1', str(tmp_path), ['a.txt', 'b.txt'], cache=cache)
+        claim_extractions(llm, manifest, 'claim-2', str(tmp_path), ['a.txt'], cache=cache)
+
+        file_hash = manifest.get('claim-1', 'a.txt')['file_sha256']
+        assert cache.invalidate([file_hash]) == 1
+        assert manifest.reset([file_hash]) == 2
+        result = claim_extractions(llm, manifest, 'claim-1', str(tmp_path), cache=cache)
+
+        assert {name: r['reprocessed'] for name, r in result.items()} == {'a.txt': True, 'b.txt': False}
+        assert len(llm.prompts) == 3
+        assert manifest.get('claim-2', 'a.txt')['extraction_status'] == PENDING
+        assert manifest.reset() == 2
+
+    def test_new_extraction_version_is_redone(self, tmp_path, write_evidence, counting_llm, monkeypatch):
+        """A stored result from another schema, prompt or model is not returned"""
+        write_evidence(tmp_path, {'a.txt': 'Death certificate'})
+        manifest = EvidenceManifest(str(tmp_path / "manifest.sqlite3"))
+        llm = counting_llm()
+        claim_extractions(llm, manifest, 'claim-1', str(tmp_path), ['a.txt'])
+
+        monkeypatch.setattr(evidence_extraction, 'EXTRACTION_SCHEMA', evidence_extraction.EXTRACTION_SCHEMA + 'x: y\n')
+        result = claim_extractions(llm, manifest, 'claim-1', str(tmp_path))
+
+        assert result == {'a.txt': {'result': '{"call": 2}', 'reprocessed': True}}
+        assert 'x: y' in llm.prompts[-1]
+
+    def test_streamed_records_flag_reprocessed_files(self, tmp_path, write_evidence, counting_llm):
+        write_evidence(tmp_path, {'a.txt': 'Death certificate', 'b.txt': 'Funeral invoice'})
+        manifest = EvidenceManifest(str(tmp_path / "manifest.sqlite3"))
+        llm = counting_llm()
+        claim_extractions(llm, manifest, 'claim-1', str(tmp_path), ['a.txt'])
+
+        records = list(extraction_records(iter_claim_extractions(llm, manifest, 'claim-1', str(tmp_path),
+                                                                 ['a.txt', 'b.txt'])))
+
+        assert [(r['file'], r['reprocessed']) for r in records[:-1]] == [('a.txt', False), ('b.txt', True)]
+        assert (records[-1]['files'], records[-1]['reprocessed']) == (2, 1)
+
+    def test_manifest_without_results_is_upgraded(self, tmp_path, write_evidence, counting_llm):
+        """A manifest written before results were kept gains the column; its extracted files are redone once"""
+        import sqlite3
+        write_evidence(tmp_path, {'a.txt': 'Evidence'})
+        manifest_path = str(tmp_path / "manifest.sqlite3")
+        conn = sqlite3.connect(manifest_path)
+        conn.execute("CREATE TABLE evidence (claim_id TEXT NOT NULL, file_name TEXT NOT NULL,"
+                     " file_sha256 TEXT NOT NULL, size INTEGER, mtime REAL, parse_status TEXT NOT NULL,"
+                     " extraction_status TEXT NOT NULL, error TEXT, updated_at REAL NOT NULL,"
+                     " PRIMARY KEY (claim_id, file_name))")
+        conn.execute("INSERT INTO evidence VALUES ('claim-1', 'a.txt', 'old', NULL, NULL, ?, ?, NULL, 0)",
+                     (PARSED, EXTRACTED))
+        conn.commit()
+        conn.close()
+        llm = counting_llm()
+
+        result = claim_extractions(llm, EvidenceManifest(manifest_path), 'claim-1', str(tmp_path), ['a.txt'])
+
+        assert result == {'a.txt': {'result': '{"call": 1}', 'reprocessed': True}}
+
+    def test_deleted_evidence_is_forgotten_with_its_text(self, tmp_path, write_evidence, counting_llm,
+                                                         evidence_text_reader):
+        """Cached text goes with the last claim holding the file, or when the file is deleted"""
+        paths = write_evidence(tmp_path, {'a.txt': 'Shared certificate', 'b.txt': 'Invoice'})
+        manifest = EvidenceManifest(str(tmp_path / "manifest.sqlite3"))
+        llm = counting_llm()
+        claim_extractions(llm, manifest, 'claim-1', str(tmp_path), ['a.txt', 'b.txt'])
+        claim_extractions(llm, manifest, 'claim-2', str(tmp_path), ['a.txt'])
+        sidecars = lambda: len(os.listdir(evidence_text_reader.cache_dir))
+        assert sidecars() == 2
+
+        os.remove(paths[1])
+        assert list(claim_extractions(llm, manifest, 'claim-1', str(tmp_path))) == ['a.txt']
+        assert manifest.get('claim-1', 'b.txt') is None
+        assert sidecars() == 1
+
+        assert forget_claim_files(manifest, 'claim-1') == 1
+        assert sidecars() == 1
+        assert forget_claim_files(manifest, 'claim-2') == 1
+        assert sidecars() == 0
+
+    def test_missing_files_and_removal(self, tmp_path, write_evidence):
+        """Unknown names are skipped and a claim can be forgotten"""
+        write_evidence(tmp_path, {'a.txt': 'Evidence'})
+        manifest = EvidenceManifest(str(tmp_path / "manifest.sqlite3"))
+
+        assert list(claim_extractions(None, manifest, 'claim-1', str(tmp_path), ['a.txt', 'gone.txt'])) == ['a.txt']
+        assert manifest.get('claim-1', 'gone.txt') is None
+        assert manifest.get('claim-1', 'a.txt')['extraction_status'] == FAILED
+        assert manifest.stats()['files'] == 1
+
+        assert manifest.remove('claim-1') == 1
+        assert manifest.files('claim-1') == []
+        assert manifest.register('claim-1', 'a.txt', 'abc') is True
+        assert manifest.get('claim-1', 'a.txt')['extraction_status'] == PENDING
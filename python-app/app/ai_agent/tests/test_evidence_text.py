@@ -0,0 +1,166 @@
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import evidence_text
+from document_parsing import ParseTimeout
+from evidence_text import EvidenceTextReader, ParserDied, normalise_text, parse_evidence_text
+
+
+def write_file(folder, name, text):
+    path = os.path.join(str(folder), name)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def slow_parse(file_path):
+    """Parser for the process tests: files name how long to take ("sleep 0.5", "hang" or "crash")"""
+    text = parse_evidence_text(file_path)
+    if text == 'hang':
+        time.sleep(60)
+    elif text == 'crash':
+        os._exit(1)
+    elif text.startswith('sleep'):
+        time.sleep(float(text.split()[1]))
+    return text
+
+
+def read_concurrently(reader, paths, stagger=0.05):
+    """Read paths on threads started `stagger` seconds apart; returns {path: text or exception}"""
+    results = {}
+
+    def read(path):
+        try:
+            results[path] = reader.read(path)
+        except Exception as e:
+            results[path] = e
+
+    threads = [threading.Thread(target=read, args=(path,)) for path in paths]
+    for thread in threads:
+        thread.start()
+        time.sleep(stagger)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestEvidenceText:
+    """Tests for evidence text parsing and the sidecar text cache"""
+
+    def test_normalise_text(self):
+        assert normalise_text("  Name: Jane  \r\n\n\n\nDate\x00: 1 May \n") == "Name: Jane\n\nDate: 1 May"
+
+    def test_pdf_pages_are_joined(self, tmp_path, monkeypatch):
+        """Page texts are collected and joined once, separated by newlines"""
+        pages = [types.SimpleNamespace(extract_text=lambda text=text: text)
+                 for text in ['Page one', None, 'Page three']]
+        fake_pypdf2 = types.SimpleNamespace(PdfReader=lambda f: types.SimpleNamespace(pages=pages))
+        monkeypatch.setitem(sys.modules, 'PyPDF2', fake_pypdf2)
+        path = write_file(tmp_path, 'letter.pdf', '%PDF')
+
+        assert parse_evidence_text(path) == "Page one\n\nPage three"
+
+    def test_repeat_reads_skip_parsing(self, tmp_path, monkeypatch):
+        """A file is parsed once; later reads, even by a new reader, come from the sidecar"""
+        calls = []
+        parse = evidence_text.parse_evidence_text
+        monkeypatch.setattr(evidence_text, 'parse_evidence_text', lambda p: calls.append(p) or parse(p))
+        path = write_file(tmp_path, 'a.txt', 'Death certificate\n')
+        cache_dir = str(tmp_path / "sidecars")
+
+        assert EvidenceTextReader(cache_dir, workers=0).read(path) == 'Death certificate'
+        reader = EvidenceTextReader(cache_dir, workers=0)
+        assert reader.read(path) == 'Death certificate'
+        assert calls == [path]
+        assert reader.stats()['hits'] == 1
+
+        write_file(tmp_path, 'a.txt', 'Amended certificate')
+        assert reader.read(path) == 'Amended certificate'
+        assert len(calls) == 2
+        assert reader.clear() == 2
+
+    def test_parsing_runs_in_a_process_pool(self, tmp_path):
+        path = write_file(tmp_path, 'a.txt', 'Funeral invoice')
+        reader = EvidenceTextReader(str(tmp_path / "sidecars"), workers=1)
+        try:
+            assert reader.read(path) == 'Funeral invoice'
+            assert reader.stats()['processes'] == 1
+        finally:
+            reader.close()
+
+    def test_queue_wait_does_not_count_towards_the_timeout(self, tmp_path):
+        """A file waiting for a busy parser is timed from when a parser picks it up"""
+        paths = [write_file(tmp_path, f'{name}.txt', 'sleep 1.0') for name in ('a', 'b')]
+        reader = EvidenceTextReader(str(tmp_path / "sidecars"), workers=1, timeout=1.5, parse=slow_parse)
+        try:
+            reader.read(write_file(tmp_path, 'warm.txt', 'warm'))
+            results = read_concurrently(reader, paths)
+        finally:
+            reader.close()
+
+        assert list(results.values()) == ['sleep 1.0', 'sleep 1.0']
+
+    def test_timeout_fails_only_that_file(self, tmp_path):
+        """A hung file's parser is killed; files parsing beside it finish in their own processes"""
+        hung = write_file(tmp_path, 'hung.txt', 'hang')
+        slow = write_file(tmp_path, 'slow.txt', 'sleep 1.2')
+        reader = EvidenceTextReader(str(tmp_path / "sidecars"), workers=2, timeout=1.5, parse=slow_parse)
+        try:
+            read_concurrently(reader, [write_file(tmp_path, f'warm{i}.txt', 'sleep 0.2') for i in range(2)])
+            # The hung file is killed at 1.5s, while the slow one is still being parsed
+            results = read_concurrently(reader, [hung, slow], stagger=0.6)
+            assert isinstance(results[hung], ParseTimeout)
+            assert results[slow] == 'sleep 1.2'
+
+            stats = reader.stats()
+            assert (stats['timeouts'], stats['processes']) == (1, 1)
+            assert reader.read(write_file(tmp_path, 'next.txt', 'next')) == 'next'
+        finally:
+            reader.close()
+
+    def test_crashed_parser_is_replaced(self, tmp_path):
+        reader = EvidenceTextReader(str(tmp_path / "sidecars"), workers=1, timeout=5, parse=slow_parse)
+        try:
+            with pytest.raises(ParserDied):
+                reader.read(write_file(tmp_path, 'bad.txt', 'crash'))
+            assert reader.read(write_file(tmp_path, 'good.txt', 'fine')) == 'fine'
+        finally:
+            reader.close()
+
+    def test_sidecars_are_bounded_by_age_and_size(self, tmp_path):
+        """Sidecars unread for too long go, then the least recently read until the cache fits"""
+        paths = [write_file(tmp_path, f'{name}.txt', name * 100) for name in 'abcd']
+        reader = EvidenceTextReader(str(tmp_path / "sidecars"), workers=0, max_bytes=250, max_age_seconds=3600)
+        for path, age in zip(paths[:3], [7200, 30, 20]):
+            reader.read(path)
+            sidecar = reader._sidecar(evidence_text.file_sha256(path))
+            os.utime(sidecar, (time.time() - age, time.time() - age))
+
+        reader.read(paths[3])
+
+        assert sorted(os.listdir(reader.cache_dir)) == sorted(
+            os.path.basename(reader._sidecar(evidence_text.file_sha256(path))) for path in paths[2:])
+        assert reader.stats()['evictions'] == 2
+
+    def test_discard_deletes_only_the_given_files(self, tmp_path):
+        paths = [write_file(tmp_path, f'{name}.txt', name) for name in 'ab']
+        reader = EvidenceTextReader(str(tmp_path / "sidecars"), workers=0)
+        for path in paths:
+            reader.read(path)
+
+        assert reader.discard([evidence_text.file_sha256(paths[0]), 'unknown']) == 1
+        assert os.listdir(reader.cache_dir) == [os.path.basename(reader._sidecar(evidence_text.file_sha256(paths[1])))]
+
+    def test_unsupported_file_raises(self, tmp_path):
+        path = write_file(tmp_path, 'photo.jpg', 'not text')
+        reader = EvidenceTextReader(str(tmp_path / "sidecars"), workers=0)
+
+        with pytest.raises(ValueError, match='Unsupported'):
+            reader.read(path)
+        assert os.listdir(str(tmp_path / "sidecars")) == []
@@ -0,0 +1,93 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import evidence_extraction
+from evidence_extraction import check_evidence_names, extraction_version, iter_extractions
+from extraction_cache import ExtractionCache
+from ingest_docs import file_sha256
+
+pytestmark = pytest.mark.usefixtures('evidence_text_reader')
+
+
+class TestExtractionCache:
+    """Tests for the persistent evidence extraction cache"""
+
+    def test_repeat_extraction_skips_the_llm(self, tmp_path, write_evidence, counting_llm):
+        """Unchanged files are answered from the cache, even by a new instance"""
+        paths = write_evidence(tmp_path, {'a.txt': 'Death certificate', 'b.txt': 'Funeral invoice'})
+        cache_path = str(tmp_path / "extractions.sqlite3")
+        llm = counting_llm()
+
+        first = dict(iter_extractions(llm, paths, cache=ExtractionCache(cache_path)))
+        assert len(llm.prompts) == 2
+
+        reopened = ExtractionCache(cache_path)
+        second = dict(iter_extractions(llm, paths, cache=reopened))
+        assert second == first
+        assert len(llm.prompts) == 2
+        stats = reopened.stats()
+        assert stats['hits'] == 2 and stats['misses'] == 0 and stats['entries'] == 2
+
+    def test_changed_content_is_extracted_again(self, tmp_path, write_evidence, counting_llm):
+        """The key is the file's bytes, not its name"""
+        paths = write_evidence(tmp_path, {'a.txt': 'Version one'})
+        cache = ExtractionCache(str(tmp_path / "extractions.sqlite3"))
+        llm = counting_llm()
+
+        dict(iter_extractions(llm, paths, cache=cache))
+        write_evidence(tmp_path, {'a.txt': 'Version two'})
+        result = dict(iter_extractions(llm, paths, cache=cache))
+
+        assert len(llm.prompts) == 2
+        assert result['a.txt'] == '{"call": 2}'
+
+    def test_schema_or_prompt_change_misses(self, tmp_path, monkeypatch, counting_llm):
+        """Editing the schema or prompt template changes the version"""
+        llm = counting_llm()
+        before = extraction_version(llm)
+        monkeypatch.setattr(evidence_extraction, 'EXTRACTION_SCHEMA', evidence_extraction.EXTRACTION_SCHEMA + 'x: y\n')
+        assert extraction_version(llm) != before
+        monkeypatch.undo()
+        monkeypatch.setattr(evidence_extraction, 'EXTRACTION_PROMPT', evidence_extraction.EXTRACTION_PROMPT + ' ')
+        assert extraction_version(llm) != before
+
+    def test_errors_are_not_cached(self, tmp_path, write_evidence, counting_llm):
+        """A failed extraction is retried on the next request"""
+        paths = write_evidence(tmp_path, {'a.txt': 'Evidence'})
+        cache = ExtractionCache(str(tmp_path / "extractions.sqlite3"))
+
+        def failing(llm, file_path):
+            raise RuntimeError("rate limited")
+
+        failed = dict(iter_extractions(counting_llm(), paths, extract=failing, cache=cache))
+        assert failed['a.txt'].startswith('Error')
+        assert dict(iter_extractions(None, paths, cache=cache))['a.txt'].startswith('Error')
+        assert cache.stats()['entries'] == 0
+
+    def test_invalidation(self, tmp_path, write_evidence, counting_llm):
+        """Entries can be dropped per file or all at once"""
+        paths = write_evidence(tmp_path, {'a.txt': 'One', 'b.txt': 'Two'})
+        cache = ExtractionCache(str(tmp_path / "extractions.sqlite3"))
+        llm = counting_llm()
+        dict(iter_extractions(llm, paths, cache=cache))
+
+        assert cache.invalidate([file_sha256(paths[0])]) == 1
+        dict(iter_extractions(llm, paths, cache=cache))
+        assert len(llm.prompts) == 3
+
+        assert cache.clear() == 2
+        assert cache.stats()['entries'] == 0
+        assert cache.stats()['invalidations'] == 3
+
+    def test_requested_names_are_checked_not_rewritten(self, tmp_path, write_evidence):
+        """Real file names are used as given; paths and unknown names are reported"""
+        write_evidence(tmp_path, {'Death certificate (1).txt': 'Certificate'})
+
+        assert check_evidence_names(str(tmp_path), ['Death certificate (1).txt']) == ([], [])
+        invalid, missing = check_evidence_names(str(tmp_path), ['../secret.txt', 'sub/a.txt', '..', 'a\\b.txt',
+                                                                'Death_certificate_1.txt'])
+        assert invalid == ['../secret.txt', 'sub/a.txt', '..', 'a\\b.txt']
+        assert missing == ['Death_certificate_1.txt']
@@ -0,0 +1,120 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from evidence_extraction import extract_file, extraction_records, find_evidence, iter_extractions
+
+pytestmark = pytest.mark.usefixtures('evidence_text_reader')
+
+
+class SlowLLM:
+    """LLM stand-in that sleeps per call and records peak concurrency"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return AIMessage(content='{"evidence": {"value": "%d chars", "reasoning": "test"}}' % len(prompt))
+
+
+class TestIterExtractions:
+    """Tests for concurrent per-file evidence extraction"""
+
+    def test_files_run_concurrently(self, tmp_path, write_evidence):
+        paths = write_evidence(tmp_path, ['e.txt', 'b.txt', 'd.txt', 'a.txt', 'c.txt'])
+        llm = SlowLLM(delay=0.3)
+
+        started = time.monotonic()
+        results = dict(iter_extractions(llm, paths, workers=5))
+        elapsed = time.monotonic() - started
+
+        assert sorted(results) == ['a.txt', 'b.txt', 'c.txt', 'd.txt', 'e.txt']
+        assert llm.peak == 5
+        assert elapsed < 1.0
+
+    def test_worker_limit_is_respected(self, tmp_path, write_evidence):
+        paths = write_evidence(tmp_path, [f'{i}.txt' for i in range(6)])
+        llm = SlowLLM(delay=0.05)
+
+        dict(iter_extractions(llm, paths, workers=2))
+
+        assert llm.peak == 2
+
+    def test_failing_file_does_not_affect_others(self, tmp_path, write_evidence):
+        paths = write_evidence(tmp_path, ['good.txt', 'bad.txt'])
+
+        def extract(llm, path):
+            if path.endswith('bad.txt'):
+                raise ValueError('corrupt file')
+            return extract_file(llm, path)
+
+        results = dict(iter_extractions(SlowLLM(delay=0), paths, extract=extract))
+
+        assert results['bad.txt'] == 'Error extracting: corrupt file'
+        assert 'evidence' in results['good.txt']
+
+    def test_slow_file_times_out(self, tmp_path, write_evidence):
+        paths = write_evidence(tmp_path, ['slow.txt', 'fast.txt'])
+
+        def extract(llm, path):
+            time.sleep(2 if path.endswith('slow.txt') else 0)
+            return 'ok'
+
+        started = time.monotonic()
+        results = dict(iter_extractions(None, paths, timeout=0.3, extract=extract))
+
+        assert time.monotonic() - started < 1.5
+        assert results['fast.txt'] == 'ok'
+        assert 'timed out' in results['slow.txt']
+
+    def test_missing_llm_is_reported_per_file(self, tmp_path, write_evidence):
+        paths = write_evidence(tmp_path, ['a.txt'])
+
+        assert dict(iter_extractions(None, paths))['a.txt'].startswith('Error: AI model not available')
+
+    def test_find_evidence_lists_supported_files(self, tmp_path, write_evidence):
+        write_evidence(tmp_path, ['b.pdf', 'a.txt', 'notes.md'])
+
+        assert find_evidence(str(tmp_path)) == ['a.txt', 'b.pdf']
+
+
+class TestExtractionRecords:
+    """Tests for the per-file records streamed by /extract-form-data/stream"""
+
+    def test_records_arrive_as_files_finish(self, tmp_path, write_evidence):
+        paths = write_evidence(tmp_path, ['slow.txt', 'fast.txt'])
+
+        def extract(llm, path):
+            time.sleep(0.6 if path.endswith('slow.txt') else 0)
+            return 'ok'
+
+        records = extraction_records(iter_extractions(None, paths, extract=extract))
+        first = next(records)
+        assert first['type'] == 'file' and first['file'] == 'fast.txt'
+        assert first['elapsed_ms'] < 500
+
+        rest = list(records)
+        assert [r['file'] for r in rest if r['type'] == 'file'] == ['slow.txt']
+        assert rest[-1] == {'type': 'summary', 'files': 2, 'errors': 0, 'elapsed_ms': rest[-1]['elapsed_ms']}
+
+    def test_errors_are_flagged_and_counted(self, tmp_path, write_evidence):
+        paths = write_evidence(tmp_path, ['a.txt'])
+
+        records = list(extraction_records(iter_extractions(None, paths)))
+
+        assert records[0]['error'] is True
+        assert records[-1]['errors'] == 1
@@ -0,0 +1,243 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from index_benchmark import DEFAULT_CONFIGS, format_table, recall_at_k, run_benchmark
+from ingest_docs import Ingestor
+from vector_stores import FLAT_VECTORS_NAME, FlatIndex, detect_engine, open_index
+
+
+class KeywordEmbeddings:
+    """Offline embeddings that score a few keywords"""
+
+    model = 'flat-test-model'
+
+    def _vector(self, text):
+        text = text.lower()
+        return [float(text.count(word)) + 0.1 for word in ('funeral', 'pension', 'burial', 'travel')]
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+TEXTS = ['funeral payment rules', 'pension credit rules', 'burial fees', 'travel costs over 50 miles']
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = FlatIndex(str(tmp_path / "flat"), KeywordEmbeddings())
+    index.add_texts(TEXTS, metadatas=[{'source': f'doc{i}.txt'} for i in range(len(TEXTS))],
+                    ids=[f'id{i}' for i in range(len(TEXTS))])
+    return index
+
+
+class TestFlatIndex:
+    """Tests for the memory-mapped flat vector index"""
+
+    def test_similarity_search_ranks_best_match_first(self, index):
+        docs = index.similarity_search('burial', k=2)
+
+        assert docs[0].page_content == 'burial fees'
+        assert docs[0].id == 'id2'
+        assert len(docs) == 2
+
+    def test_query_by_vectors_matches_single_queries(self, index):
+        embeddings = KeywordEmbeddings()
+        vectors = [embeddings.embed_query(q) for q in ('funeral', 'travel', 'pension')]
+
+        batched = index.query_by_vectors(vectors, 2)
+
+        for hits, vector in zip(batched, vectors):
+            single = index.query_by_vector(vector, 2)
+            assert hits[0][0].id == single[0][0].id
+            assert [score for _, score in hits] == pytest.approx([score for _, score in single])
+        assert batched[1][0][0].id == 'id3'
+
+    def test_reopen_maps_vectors_from_disk(self, index):
+        """A fresh instance reads the written files without re-embedding"""
+        reopened = open_index(index.index_dir, KeywordEmbeddings(), 'flat')
+
+        assert reopened.count() == len(TEXTS)
+        assert reopened.similarity_search('travel', k=1)[0].metadata == {'source': 'doc3.txt'}
+        assert os.path.exists(os.path.join(index.index_dir, FLAT_VECTORS_NAME))
+        assert detect_engine(index.index_dir) == 'flat'
+
+    def test_upsert_replaces_existing_chunk(self, index):
+        index.upsert(['id0'], [[0.0, 0.0, 0.0, 1.0]], ['travel grant'], [{'source': 'doc0.txt'}])
+        index.flush()
+
+        assert index.count() == len(TEXTS)
+        assert index.get(ids=['id0'])['documents'] == ['travel grant']
+
+    def test_delete_by_source(self, index):
+        ids = index.get(where={'source': 'doc1.txt'}, include=[])['ids']
+        index.delete(ids=ids)
+
+        assert ids == ['id1']
+        assert index.count() == len(TEXTS) - 1
+        assert all(doc.id != 'id1' for doc in index.similarity_search('pension', k=4))
+
+    def test_streamed_windows_are_joined_once(self, tmp_path, monkeypatch):
+        """Upserting window by window does not copy the matrix per window"""
+        joins = []
+        concatenate = np.concatenate
+        index = FlatIndex(str(tmp_path / "flat"), None)
+        vectors = clustered_vectors(100)
+        monkeypatch.setattr(np, 'concatenate', lambda arrays, *a, **kw: joins.append(len(arrays)) or
+                            concatenate(arrays, *a, **kw))
+        for start in range(0, 100, 10):
+            ids = [str(i) for i in range(start, start + 10)]
+            index.upsert(ids, vectors[start:start + 10], [''] * 10, [{} for _ in ids])
+        assert joins == []
+        index.count()
+        monkeypatch.undo()
+
+        assert joins == [11]
+        assert index.count() == 100
+        assert index.query_by_vector(vectors[42], 1)[0][0].id == '42'
+
+    def test_changes_by_another_process_are_picked_up(self, index):
+        """An open index maps the files again once another writer flushes"""
+        reader = FlatIndex(index.index_dir, KeywordEmbeddings())
+        assert reader.count() == len(TEXTS)
+
+        writer = FlatIndex(index.index_dir, KeywordEmbeddings())
+        writer.add_texts(['bereavement support payment'], metadatas=[{'source': 'doc4.txt'}], ids=['id4'])
+        writer.delete(ids=['id2'])
+
+        assert reader.count() == len(TEXTS)
+        assert reader.get(ids=['id4'])['documents'] == ['bereavement support payment']
+        assert all(doc.id != 'id2' for doc in reader.similarity_search('burial', k=4))
+
+    def test_unknown_engine_is_rejected(self, tmp_path):
+        with pytest.raises(ValueError):
+            open_index(str(tmp_path), KeywordEmbeddings(), 'faiss')
+
+
+class TestIngestorWithFlatEngine:
+    """Tests for ingestion into the flat engine"""
+
+    def _write(self, docs_dir, name, text):
+        with open(os.path.join(str(docs_dir), name), 'w') as f:
+            f.write(text)
+
+    def test_sync_and_remove(self, tmp_path):
+        docs_dir = tmp_path / "docs"
+        docs_dir.mkdir()
+        self._write(docs_dir, 'a.txt', 'funeral payment rules')
+        self._write(docs_dir, 'b.txt', 'pension credit rules')
+        ingestor = Ingestor(str(docs_dir), str(tmp_path / "db"), KeywordEmbeddings(),
+                            parse_workers=0, engine='flat')
+
+        ingestor.sync()
+        assert ingestor.stats().chunk_count == 2
+        assert detect_engine(ingestor.index_dir()) == 'flat'
+
+        ingestor.remove(['b.txt'])
+        assert ingestor.stats().chunk_count == 1
+        assert ingestor.vectorstore().similarity_search('pension', k=2)[0].page_content == 'funeral payment rules'
+
+    def test_engine_change_triggers_rebuild(self, tmp_path):
+        """An index built by another engine is rebuilt on the next sync"""
+        docs_dir = tmp_path / "docs"
+        docs_dir.mkdir()
+        self._write(docs_dir, 'a.txt', 'funeral payment rules')
+        Ingestor(str(docs_dir), str(tmp_path / "db"), KeywordEmbeddings(), parse_workers=0, engine='chroma').sync()
+
+        ingestor = Ingestor(str(docs_dir), str(tmp_path / "db"), KeywordEmbeddings(),
+                            parse_workers=0, engine='flat')
+        summary = ingestor.sync()
+
+        assert summary['files_ingested'] == 1
+        assert detect_engine(ingestor.index_dir()) == 'flat'
+
+
+def clustered_vectors(count, dims=64, seed=0):
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((8, dims))
+    return (rng.standard_normal((count, 8)) @ basis + 0.1 * rng.standard_normal((count, dims))).astype(np.float32)
+
+
+def build(tmp_path, vectors, **options):
+    index = FlatIndex(str(tmp_path / "compact"), None, **options)
+    ids = [str(i) for i in range(len(vectors))]
+    index.upsert(ids, vectors, [''] * len(ids), [{} for _ in ids])
+    index.flush()
+    return index
+
+
+class TestCompactFormats:
+    """Tests for int8 quantisation, dimension reduction and float re-ranking"""
+
+    def test_int8_index_is_smaller_and_keeps_recall(self, tmp_path):
+        vectors = clustered_vectors(500)
+        exact = build(tmp_path / "exact", vectors)
+        quantised = build(tmp_path / "int8", vectors, dtype='int8')
+
+        expected = [[d.id for d, _ in hits] for hits in exact.query_by_vectors(vectors[:20], 5)]
+        found = [[d.id for d, _ in hits] for hits in quantised.query_by_vectors(vectors[:20], 5)]
+
+        assert quantised.memory_bytes() < exact.memory_bytes() / 3
+        assert recall_at_k(expected, found) >= 0.9
+
+    def test_rerank_restores_exact_scores(self, tmp_path):
+        vectors = clustered_vectors(300)
+        index = build(tmp_path, vectors, dtype='int8', dimensions=16, reduction='project', rerank=50)
+
+        hits = index.query_by_vector(vectors[7], 3)
+
+        assert hits[0][0].id == '7'
+        assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    def test_format_survives_reopening(self, tmp_path):
+        vectors = clustered_vectors(50)
+        index = build(tmp_path, vectors, dtype='int8', dimensions=16, reduction='project')
+        before = [d.id for d, _ in index.query_by_vector(vectors[3], 5)]
+
+        reopened = FlatIndex(index.index_dir, None)
+        reopened.upsert(['new'], vectors[:1], [''], [{}])
+
+        assert reopened.format['dtype'] == 'int8'
+        assert reopened.format['dimensions'] == 16
+        assert [d.id for d, _ in reopened.query_by_vector(vectors[3], 5)] == before
+
+    def test_truncation_keeps_leading_dimensions(self, tmp_path):
+        index = build(tmp_path, clustered_vectors(20), dimensions=8)
+
+        assert index.format['dimensions'] == 8
+        assert index.memory_bytes() == 20 * 8 * 4
+
+    def test_unknown_dtype_is_rejected(self, tmp_path):
+        with pytest.raises(ValueError):
+            FlatIndex(str(tmp_path), None, dtype='float16')
+
+
+class TestIndexBenchmark:
+    """Tests for the compact-format benchmark"""
+
+    def test_reports_every_format_against_the_baseline(self):
+        vectors = clustered_vectors(200)
+
+        results = run_benchmark(vectors, vectors[:5], k=3, rounds=1)
+
+        assert [row['name'] for row in results] == [name for name, _ in DEFAULT_CONFIGS]
+        assert results[0]['recall_at_k'] == 1.0
+        assert all(0.0 <= row['recall_at_k'] <= 1.0 for row in results)
+        assert results[1]['memory_bytes'] < results[0]['memory_bytes']
+
+    def test_rerank_vectors_are_counted(self):
+        """Formats that re-rank report the full vectors they keep, and the table charges them"""
+        vectors = clustered_vectors(200)
+        configs = [('float32', {}), ('int8 + rerank', {'dtype': 'int8', 'rerank': 20})]
+
+        results = run_benchmark(vectors, vectors[:5], k=3, configs=configs, rounds=1)
+
+        assert results[0]['rerank_bytes'] == 0
+        assert results[1]['rerank_bytes'] == vectors.nbytes
+        # int8 rows plus full float32 vectors take more than the float32 baseline alone
+        assert format_table(results, 3).splitlines()[2].split()[-4].startswith('-')
@@ -0,0 +1,105 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hybrid_search import BM25Index, HybridRetriever, exact_terms, reciprocal_rank_fusion, tokenize
+from ingest_docs import Ingestor
+
+
+class QueryCountingEmbeddings:
+    """Offline embeddings that count query embedding calls"""
+
+    model = 'hybrid-test-model'
+
+    def __init__(self):
+        self.queries = 0
+
+    def _vector(self, text):
+        text = text.lower()
+        return [float(text.count(word)) + 0.1 for word in ('funeral', 'pension', 'burial', 'cremation')]
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self._vector(text)
+
+
+CHUNKS = {
+    'travel.txt': 'Travel costs are covered when the journey is more than 50 miles.',
+    'limit.txt': 'Other funeral expenses are paid up to £1,000 in total.',
+    'pension.txt': 'You may qualify if you get Pension Credit or Universal Credit.',
+    'burial.txt': 'Burial and cremation fees are paid in full by the funeral payment.',
+}
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    for name, text in CHUNKS.items():
+        with open(os.path.join(str(docs_dir), name), 'w') as f:
+            f.write(text)
+    embeddings = QueryCountingEmbeddings()
+    ingestor = Ingestor(str(docs_dir), str(tmp_path / "db"), embeddings, parse_workers=0)
+    ingestor.sync()
+    return HybridRetriever(ingestor, embeddings)
+
+
+class TestLexicalIndex:
+    """Tests for tokenisation and BM25 ranking"""
+
+    def test_tokenize_keeps_amounts(self):
+        assert tokenize('Up to £1,000 for 50 miles') == ['up', '£1000', '1000', '50', 'miles']
+
+    def test_exact_terms(self):
+        assert exact_terms('Is it more than 50 miles?') == {'50'}
+        assert exact_terms('Do I qualify with Pension Credit?') == {'pension', 'credit'}
+        assert exact_terms('who is eligible') == set()
+
+    def test_bm25_ranks_matching_chunk_first(self):
+        index = BM25Index(['a', 'b'], ['funeral payment rules', 'pension credit rules'])
+        assert index.search('pension credit', 2)[0][0] == 1
+        assert index.document(index.positions['b']).page_content == 'pension credit rules'
+
+    def test_reciprocal_rank_fusion(self):
+        assert reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'c', 'a']])[0] == 'b'
+
+
+class TestHybridRetriever:
+    """Tests for fused lexical and vector retrieval"""
+
+    def test_exact_term_query_needs_no_embedding(self, retriever):
+        """A question about an exact amount is answered from the lexical index alone"""
+        docs = retriever.search('Is there a £1,000 limit?', k=2)
+
+        assert retriever.embeddings.queries == 0
+        assert docs[0].page_content == CHUNKS['limit.txt']
+
+    def test_general_query_fuses_both_rankings(self, retriever):
+        """Questions without exact terms embed the query and fuse both rankings"""
+        docs = retriever.search('are cremation fees paid', k=2)
+
+        assert retriever.embeddings.queries == 1
+        assert docs[0].page_content == CHUNKS['burial.txt']
+        assert len(docs) == 2
+
+    def test_unsatisfied_exact_terms_fall_back_to_vectors(self, retriever):
+        """If no chunk contains the exact terms, vector search still runs"""
+        docs = retriever.search('Is there a £5,000 limit for a funeral?', k=1)
+
+        assert retriever.embeddings.queries == 1
+        assert len(docs) == 1
+
+    def test_search_many_matches_single_searches(self, retriever):
+        """A batch of queries gets the same results as searching one at a time"""
+        queries = ['are cremation fees paid', 'pension credit', 'travel journey']
+        vectors = [retriever.embeddings.embed_query(q) for q in queries]
+
+        batched = retriever.search_many(queries, 2, vectors)
+
+        for query, vector, docs in zip(queries, vectors, batched):
+            single = retriever.search(query, k=2, query_vector=vector)
+            assert [d.id for d in docs] == [d.id for d in single]
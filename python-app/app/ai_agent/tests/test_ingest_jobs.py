@@ -0,0 +1,154 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingest_docs import Ingestor
+from ingest_jobs import IngestJob, IngestionQueue, run_ingestion_job
+
+
+class CountingEmbeddings:
+    """Offline embeddings that count the texts embedded"""
+
+    model = 'counting-model'
+
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def wait_for(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.status in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+class TestIngestionQueue:
+    """Tests for the background ingestion job queue"""
+
+    def test_burst_of_submissions_coalesces_into_one_run(self):
+        """Submissions made while a job is pending are merged into that job"""
+        runs = []
+        queue = IngestionQueue(lambda job: runs.append(list(job.files)), debounce_seconds=0.2)
+
+        first = queue.submit(['a.pdf'], reason='upload')
+        second = queue.submit(['b.pdf'], reason='upload')
+        third = queue.submit(['a.pdf'], reason='delete')
+
+        assert first is second is third
+        wait_for(first)
+        assert first.status == 'succeeded'
+        assert runs == [['a.pdf', 'b.pdf']]
+        assert first.to_dict()['reasons'] == ['upload', 'delete']
+
+    def test_submission_during_running_job_starts_new_job(self):
+        """A job that has already started is not extended by later submissions"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def runner(job):
+            started.set()
+            release.wait(5)
+
+        queue = IngestionQueue(runner, debounce_seconds=0)
+        first = queue.submit(['a.pdf'])
+        assert started.wait(5)
+        second = queue.submit(['b.pdf'])
+        release.set()
+
+        assert first is not second
+        assert wait_for(first).status == 'succeeded'
+        assert wait_for(second).status == 'succeeded'
+        assert second.files == ['b.pdf']
+
+    def test_failed_runner_marks_job_failed(self):
+        """Runner exceptions are recorded on the job rather than killing the worker"""
+        def runner(job):
+            raise RuntimeError('embedding service unavailable')
+
+        queue = IngestionQueue(runner, debounce_seconds=0)
+        job = wait_for(queue.submit(['a.pdf']))
+
+        assert job.status == 'failed'
+        assert 'embedding service unavailable' in job.error
+        # The worker keeps serving later jobs
+        assert wait_for(queue.submit(['b.pdf'])).status == 'failed'
+
+    def test_progress_and_lookup(self):
+        """Progress reported by the runner is exposed through the job status"""
+        def runner(job):
+            job.update_progress(files_total='2', files_parsed='2', chunks_total=10, chunks_embedded=10)
+
+        queue = IngestionQueue(runner, debounce_seconds=0)
+        job = wait_for(queue.submit(['a.pdf']))
+        status = queue.get(job.id).to_dict()
+
+        assert status['progress'] == {
+            'files_total': 2, 'files_parsed': 2, 'chunks_total': 10, 'chunks_embedded': 10
+        }
+        assert status['eta_seconds'] is None
+        assert queue.get('missing') is None
+
+
+class TestRunIngestionJob:
+    """Tests for how a queued job drives the Ingestor"""
+
+    def make_ingestor(self, tmp_path):
+        docs_dir = tmp_path / "policy_docs"
+        docs_dir.mkdir()
+        for name in ['a.txt', 'b.txt']:
+            (docs_dir / name).write_text('funeral payment ' * 200)
+        ingestor = Ingestor(str(docs_dir), str(tmp_path / "db"), CountingEmbeddings(), parse_workers=0)
+        ingestor.sync()
+        return ingestor
+
+    def test_reingest_re_embeds_an_unchanged_file(self, tmp_path):
+        ingestor = self.make_ingestor(tmp_path)
+        before = ingestor.embeddings.embedded
+        job = IngestJob('reingest')
+        job.add_files(['a.txt'], 'reingest', force=True)
+
+        summary = run_ingestion_job(ingestor, job)
+
+        assert summary['files_ingested'] == 1
+        assert ingestor.embeddings.embedded - before == summary['chunks_added'] > 0
+        assert not job.scan_folder
+
+    def test_upload_runs_an_incremental_sync(self, tmp_path):
+        ingestor = self.make_ingestor(tmp_path)
+        before = ingestor.embeddings.embedded
+        job = IngestJob('upload')
+        job.add_files(['a.txt'], 'upload')
+
+        summary = run_ingestion_job(ingestor, job)
+
+        assert summary['files_ingested'] == 0
+        assert ingestor.embeddings.embedded == before
+
+    def test_coalesced_job_forces_only_reingested_files(self, tmp_path):
+        ingestor = self.make_ingestor(tmp_path)
+        (tmp_path / "policy_docs" / "c.txt").write_text('pension credit ' * 100)
+        before = ingestor.embeddings.embedded
+        ingested_at = ingestor.load_manifest()['files']['a.txt']['ingested_at']
+        queue = IngestionQueue(lambda job: run_ingestion_job(ingestor, job), debounce_seconds=0.1)
+
+        job = queue.submit(['a.txt'], reason='reingest', force=True)
+        queue.submit(['c.txt'], reason='upload')
+        wait_for(job)
+
+        assert job.status == 'succeeded'
+        assert job.to_dict()['forced_files'] == ['a.txt']
+        files = ingestor.load_manifest()['files']
+        assert sorted(files) == ['a.txt', 'b.txt', 'c.txt']
+        # The forced file was re-embedded alongside the upload; the untouched one was not
+        assert files['a.txt']['ingested_at'] > ingested_at
+        assert ingestor.embeddings.embedded - before == \
+            len(files['a.txt']['chunk_ids']) + len(files['c.txt']['chunk_ids'])
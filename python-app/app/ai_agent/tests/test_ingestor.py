@@ -0,0 +1,342 @@
+import os
+import sys
+import threading
+import time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ingest_docs import Ingestor, IngestionError, EmbeddingModelMismatch, file_sha256
+
+
+class CountingEmbeddings:
+    """Deterministic offline embeddings that record how many texts were embedded"""
+
+    def __init__(self, model='counting-model'):
+        self.model = model
+        self.embedded = 0
+
+    def _vector(self, text):
+        return [float(len(text) % 7), float(text.count('a')), float(text.count('e')), 1.0]
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def write_doc(folder, name, words):
+    path = os.path.join(folder, name)
+    with open(path, 'w') as f:
+        f.write(' '.join(words))
+    return path
+
+
+@pytest.fixture
+def ingestor(tmp_path):
+    docs_dir = tmp_path / "policy_docs"
+    docs_dir.mkdir()
+    return Ingestor(str(docs_dir), str(tmp_path / "chroma_db"), CountingEmbeddings(), batch_size=4)
+
+
+class TestIngestor:
+    """Tests for the in-process ingestion engine"""
+
+    def test_sync_only_embeds_changed_files(self, ingestor):
+        """Unchanged files are skipped and changed or removed files are replaced"""
+        docs_dir = ingestor.docs_dir
+        write_doc(docs_dir, 'a.txt', ['funeral payment'] * 300)
+        write_doc(docs_dir, 'b.txt', ['pension credit'] * 200)
+
+        first = ingestor.sync()
+        total = len(ingestor.vectorstore().get(include=[])['ids'])
+        assert first['files_ingested'] == 2
+        assert total == first['chunks_added'] == ingestor.embeddings.embedded
+
+        embedded_before = ingestor.embeddings.embedded
+        second = ingestor.sync()
+        assert second['files_ingested'] == 0
+        assert ingestor.embeddings.embedded == embedded_before
+
+        write_doc(docs_dir, 'b.txt', ['pension credit changed'] * 10)
+        os.remove(os.path.join(docs_dir, 'a.txt'))
+        third = ingestor.sync()
+        assert third['files_ingested'] == 1
+        assert third['files_removed'] == 1
+        manifest = ingestor.load_manifest()
+        assert list(manifest['files']) == ['b.txt']
+        ids = ingestor.vectorstore().get(include=[])['ids']
+        assert sorted(ids) == sorted(manifest['files']['b.txt']['chunk_ids'])
+
+    def test_progress_is_reported(self, ingestor):
+        """Progress counters reach their totals"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 300)
+        seen = {}
+        ingestor.sync(progress=lambda **counts: seen.update(counts))
+
+        assert seen['files_total'] == seen['files_parsed'] == 1
+        assert seen['chunks_total'] == seen['chunks_embedded'] > 0
+
+    def test_rebuild_prunes_unknown_chunks(self, ingestor):
+        """A full rebuild removes chunks that were not produced by the documents folder"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 50)
+        ingestor.vectorstore().add_texts(['orphaned text'], ids=['orphan'])
+
+        summary = ingestor.sync(full=True)
+
+        ids = ingestor.vectorstore().get(include=[])['ids']
+        assert 'orphan' not in ids
+        assert summary['chunks_removed'] == 1
+
+    def test_empty_folder_clears_index(self, ingestor):
+        """Removing every document empties the index"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 50)
+        ingestor.sync()
+        os.remove(os.path.join(ingestor.docs_dir, 'a.txt'))
+
+        ingestor.sync()
+
+        assert ingestor.vectorstore().get(include=[])['ids'] == []
+        assert ingestor.load_manifest()['files'] == {}
+
+    def test_remove_deletes_only_that_files_chunks(self, ingestor):
+        """Removing a file deletes its chunks by source without re-embedding anything"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 300)
+        write_doc(ingestor.docs_dir, 'b.txt', ['pension credit'] * 200)
+        ingestor.sync()
+        b_ids = ingestor.load_manifest()['files']['b.txt']['chunk_ids']
+        embedded = ingestor.embeddings.embedded
+
+        summary = ingestor.remove(['a.txt'])
+
+        assert summary['files_removed'] == 1
+        assert sorted(ingestor.vectorstore().get(include=[])['ids']) == sorted(b_ids)
+        assert ingestor.embeddings.embedded == embedded
+        assert list(ingestor.load_manifest()['files']) == ['b.txt']
+
+    @pytest.mark.parametrize('engine', ['chroma', 'flat'])
+    def test_identical_files_keep_their_own_chunks(self, tmp_path, engine):
+        """Two files with the same bytes are stored, counted and removed independently"""
+        docs_dir = tmp_path / "policy_docs"
+        docs_dir.mkdir()
+        ingestor = Ingestor(str(docs_dir), str(tmp_path / "db"), CountingEmbeddings(), batch_size=4,
+                            parse_workers=0, engine=engine)
+        write_doc(str(docs_dir), 'a.txt', ['funeral payment'] * 300)
+        write_doc(str(docs_dir), 'copy_of_a.txt', ['funeral payment'] * 300)
+
+        summary = ingestor.sync()
+        files = ingestor.load_manifest()['files']
+        copy_ids = files['copy_of_a.txt']['chunk_ids']
+        assert not set(files['a.txt']['chunk_ids']) & set(copy_ids)
+        assert ingestor.vectorstore().count() == summary['chunks_added']
+
+        ingestor.remove(['a.txt'])
+
+        assert sorted(ingestor.vectorstore().get(include=[])['ids']) == sorted(copy_ids)
+        assert ingestor.stats().chunks_for('copy_of_a.txt') == len(copy_ids)
+
+    def test_relative_docs_dir(self, tmp_path, monkeypatch):
+        """A documents folder given relative to the cwd is resolved once"""
+        monkeypatch.chdir(tmp_path)
+        os.mkdir('docs')
+        write_doc('docs', 'a.txt', ['funeral payment'] * 300)
+        ingestor = Ingestor('docs', 'db', CountingEmbeddings(), batch_size=4, parse_workers=0)
+
+        assert ingestor.sync()['files_ingested'] == 1
+        assert list(ingestor.load_manifest()['files']) == ['a.txt']
+        assert ingestor.remove(['a.txt'])['files_removed'] == 1
+
+    def test_remove_finds_chunks_missing_from_the_manifest(self, ingestor):
+        """Chunks from an index without a manifest are matched on their source metadata"""
+        source = os.path.join(ingestor.docs_dir, 'old.txt')
+        db = ingestor.vectorstore()
+        db.add_texts(['old one', 'old two'], metadatas=[{'source': source}] * 2, ids=['x1', 'x2'])
+        db.add_texts(['other'], metadatas=[{'source': 'elsewhere.txt'}], ids=['y1'])
+
+        summary = ingestor.remove(['old.txt'])
+
+        assert summary == {'files_removed': 1, 'chunks_removed': 2}
+        assert db.get(include=[])['ids'] == ['y1']
+
+    def test_rebuild_with_no_loadable_documents_fails(self, ingestor):
+        """A rebuild that loads nothing raises instead of producing an empty index"""
+        with pytest.raises(IngestionError):
+            ingestor.rebuild([])
+
+    def test_vectors_are_written_before_the_last_file_is_parsed(self, tmp_path):
+        """Ingestion streams chunks through a bounded window instead of buffering the corpus"""
+        docs_dir = tmp_path / "docs"
+        docs_dir.mkdir()
+        for i in range(5):
+            write_doc(str(docs_dir), f'doc{i}.txt', [f'funeral payment {i}'] * 150)
+        ingestor = Ingestor(str(docs_dir), str(tmp_path / "db"), CountingEmbeddings(),
+                            batch_size=2, parse_workers=0, window=4)
+        events = []
+        ingestor.sync(progress=lambda **counts: events.append(dict(counts)))
+
+        files_parsed = 0
+        embedded_early = False
+        for counts in events:
+            files_parsed = counts.get('files_parsed', files_parsed)
+            if counts.get('chunks_embedded') and files_parsed < 5:
+                embedded_early = True
+        assert embedded_early
+        assert len(ingestor.vectorstore().get(include=[])['ids']) == ingestor.embeddings.embedded
+
+
+class TestIndexGenerations:
+    """Tests for generation-swapped index publishing"""
+
+    def test_full_rebuild_publishes_a_new_generation(self, ingestor):
+        """A rebuild is built beside the live index and published by a pointer swap"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 50)
+        ingestor.sync()
+        first = ingestor.index_dir()
+
+        ingestor.sync(full=True)
+
+        assert ingestor.index_dir() != first
+        assert os.path.basename(ingestor.index_dir()) == 'gen-2'
+        assert ingestor.vectorstore()._persist_directory == ingestor.index_dir()
+        assert len(ingestor.vectorstore().get(include=[])['ids']) > 0
+
+    def test_old_generations_are_garbage_collected(self, tmp_path):
+        """Only the configured number of generations is kept on disk"""
+        docs_dir = tmp_path / "docs"
+        docs_dir.mkdir()
+        write_doc(str(docs_dir), 'a.txt', ['funeral payment'] * 50)
+        ingestor = Ingestor(str(docs_dir), str(tmp_path / "db"), CountingEmbeddings(), retention=2)
+
+        for _ in range(4):
+            ingestor.rebuild()
+
+        assert [os.path.basename(p) for p in ingestor.generations()] == ['gen-3', 'gen-4']
+
+    def test_failed_rebuild_keeps_the_live_index(self, ingestor):
+        """Readers keep the published generation when a rebuild fails"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 50)
+        ingestor.sync()
+        live = ingestor.index_dir()
+        ids = ingestor.vectorstore().get(include=[])['ids']
+
+        with pytest.raises(IngestionError):
+            ingestor.rebuild([])
+
+        assert ingestor.index_dir() == live
+        assert ingestor.generations() == [live]
+        assert ingestor.vectorstore().get(include=[])['ids'] == ids
+
+    def test_legacy_index_is_replaced(self, ingestor):
+        """An index written straight into persist_dir is served until a generation replaces it"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 50)
+        ingestor.vectorstore().add_texts(['legacy text'], ids=['legacy'])
+        assert ingestor.index_dir() == ingestor.persist_dir
+
+        ingestor.rebuild()
+        assert os.path.exists(os.path.join(ingestor.persist_dir, 'chroma.sqlite3'))
+        ingestor.rebuild()
+
+        assert not os.path.exists(os.path.join(ingestor.persist_dir, 'chroma.sqlite3'))
+        assert 'legacy' not in ingestor.vectorstore().get(include=[])['ids']
+
+
+class TestEmbeddingModelRecording:
+    """Tests for recording and enforcing the model that built the index"""
+
+    def test_mismatched_embedder_is_refused(self, ingestor):
+        """An index built by one model cannot be queried with another"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 50)
+        ingestor.sync()
+        assert ingestor.load_manifest()['embedding_model'] == 'counting-model'
+
+        other = Ingestor(ingestor.docs_dir, ingestor.persist_dir, CountingEmbeddings('other-model'))
+        with pytest.raises(EmbeddingModelMismatch):
+            other.vectorstore()
+
+    def test_sync_rebuilds_for_a_new_model(self, ingestor):
+        """Switching models re-embeds the corpus into a new generation"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 50)
+        ingestor.sync()
+
+        other = Ingestor(ingestor.docs_dir, ingestor.persist_dir, CountingEmbeddings('other-model'))
+        other.sync()
+
+        assert other.load_manifest()['embedding_model'] == 'other-model'
+        assert other.embeddings.embedded > 0
+        assert len(other.vectorstore().get(include=[])['ids']) == other.embeddings.embedded
+
+
+class TestIndexStats:
+    """Tests for the cached index statistics"""
+
+    def test_stats_track_ingestion_and_removal(self, ingestor):
+        """Chunk counts per source are refreshed when the index changes"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 300)
+        write_doc(ingestor.docs_dir, 'b.txt', ['pension credit'] * 200)
+        assert ingestor.stats().is_empty
+
+        ingestor.sync()
+        stats = ingestor.stats()
+        assert stats.chunk_count == len(ingestor.vectorstore().get(include=[])['ids'])
+        assert stats.chunks_for('a.txt') + stats.chunks_for('b.txt') == stats.chunk_count
+        assert stats.embedding_model == 'counting-model'
+        assert ingestor.stats() is stats
+
+        ingestor.remove(['a.txt'])
+        assert ingestor.stats().chunks_for('a.txt') == 0
+        assert ingestor.stats().chunk_count == stats.chunks_for('b.txt')
+
+    def test_stats_for_an_index_without_manifest(self, ingestor):
+        """Per-source counts fall back to chunk metadata when there is no manifest"""
+        source = os.path.join(ingestor.docs_dir, 'old.txt')
+        ingestor.vectorstore().add_texts(['one', 'two'], metadatas=[{'source': source}] * 2)
+
+        stats = ingestor.stats()
+
+        assert stats.chunk_count == 2
+        assert stats.sources == {'old.txt': 2}
+
+    def test_catalogue_records_each_source(self, ingestor):
+        """The catalogue tells indexed, changed and new files apart without reading the index"""
+        path = write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 50)
+        ingestor.sync()
+        stat = os.stat(path)
+
+        stats = ingestor.stats()
+        info = stats.source_info('a.txt')
+        assert info['sha256'] == file_sha256(path)
+        assert info['chunk_count'] == stats.chunks_for('a.txt')
+        assert info['generation'] == stats.generation
+        assert stats.source_status('a.txt', stat.st_size, stat.st_mtime) == 'indexed'
+        assert stats.source_status('a.txt', stat.st_size + 1, stat.st_mtime) == 'stale'
+        assert stats.source_status('b.txt', 10, 0) == 'pending'
+        assert stats.source_info('b.txt') is None
+
+    def test_readers_do_not_wait_for_a_running_ingestion(self, ingestor):
+        """Queries read the last committed snapshot while a sync is embedding"""
+        write_doc(ingestor.docs_dir, 'a.txt', ['funeral payment'] * 50)
+        ingestor.sync()
+        stats, store, lexical = ingestor.stats(), ingestor.vectorstore(), ingestor.lexical_index()
+
+        release = threading.Event()
+        embed_documents = ingestor.embeddings.embed_documents
+        ingestor.embeddings.embed_documents = lambda texts: release.wait(30) and embed_documents(texts)
+        write_doc(ingestor.docs_dir, 'b.txt', ['pension credit'] * 50)
+        # Holds the ingestor's lock until the embedding is released
+        syncing = threading.Thread(target=ingestor.sync)
+        syncing.start()
+        try:
+            time.sleep(0.5)
+            started = time.monotonic()
+            during = ingestor.stats()
+            assert ingestor.vectorstore() is store
+            assert ingestor.lexical_index() is lexical
+            assert time.monotonic() - started < 0.5
+        finally:
+            release.set()
+            syncing.join(30)
+
+        assert during.chunk_count == stats.chunk_count and during.chunks_for('b.txt') == 0
+        assert ingestor.stats().chunks_for('b.txt') > 0
+        assert ingestor.lexical_index() is not lexical
@@ -0,0 +1,191 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from query_cache import AnswerCache, LRUCache, QueryEmbeddingCache, answer_terms, normalise_query
+
+
+class CountingQueryEmbeddings:
+    """Embeds documents and queries differently, as instruction-tuned models do"""
+
+    model = 'query-model'
+
+    def __init__(self):
+        self.queries = []
+        self.document_calls = []
+
+    def embed_documents(self, texts):
+        self.document_calls.append(list(texts))
+        return [[-float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text))]
+
+
+class BatchQueryEmbeddings(CountingQueryEmbeddings):
+    """Also embeds several queries in one request"""
+
+    def __init__(self):
+        super().__init__()
+        self.query_calls = []
+
+    def embed_queries(self, texts):
+        self.query_calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestQueryEmbeddingCache:
+    """Tests for the in-memory query embedding cache"""
+
+    def test_repeated_questions_are_embedded_once(self):
+        """Questions differing only in case and spacing share one embedding"""
+        provider = CountingQueryEmbeddings()
+        cached = QueryEmbeddingCache(provider)
+
+        first = cached.embed_query('Who is eligible?')
+        second = cached.embed_query('  who   is ELIGIBLE? ')
+
+        assert first == second
+        assert provider.queries == ['Who is eligible?']
+        stats = cached.stats()
+        assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+
+    def test_documents_pass_through(self):
+        provider = CountingQueryEmbeddings()
+        assert QueryEmbeddingCache(provider).embed_documents(['a', 'b']) == [[-1.0], [-1.0]]
+        assert provider.queries == []
+
+    def test_embed_queries_batches_uncached_questions(self):
+        """Only uncached, distinct questions are embedded, in a single request"""
+        provider = BatchQueryEmbeddings()
+        cached = QueryEmbeddingCache(provider)
+        cached.embed_query('Who is eligible?')
+
+        vectors = cached.embed_queries(['who is eligible?', 'How much?', 'how much?', 'When?'])
+
+        assert provider.query_calls == [['How much?', 'When?']]
+        assert provider.document_calls == []
+        assert vectors == [[16.0], [9.0], [9.0], [5.0]]
+
+    def test_batched_questions_get_query_vectors(self):
+        """Without a batch query path each question is embedded as a query, never as a document"""
+        provider = CountingQueryEmbeddings()
+        cached = QueryEmbeddingCache(provider)
+
+        vectors = cached.embed_queries(['How much?', 'When?'])
+
+        assert vectors == [provider.embed_query('How much?'), provider.embed_query('When?')]
+        assert provider.document_calls == []
+        assert cached.embed_query('when?') == [5.0]
+
+    def test_original_text_is_embedded(self):
+        """Only the cache key is normalised; the provider sees the question as asked"""
+        provider = CountingQueryEmbeddings()
+        cached = QueryEmbeddingCache(provider)
+
+        cached.embed_query('Can I claim for a  Funeral Payment?')
+        cached.embed_queries(['What is UC?'])
+
+        assert provider.queries == ['Can I claim for a  Funeral Payment?', 'What is UC?']
+
+    def test_normalise_query(self):
+        assert normalise_query('What  documents\tdo I NEED') == 'what documents do i need'
+
+
+class TestLRUCache:
+    """Tests for the size- and time-bounded LRU cache"""
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.stats()['evictions'] == 1
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = LRUCache(10, ttl_seconds=60, clock=clock)
+        cache.put('a', 1)
+
+        clock.now = 59
+        assert cache.get('a') == 1
+        clock.now = 121
+        assert cache.get('a') is None
+        assert cache.stats()['expirations'] == 1
+
+
+class TestAnswerCache:
+    """Tests for the semantic answer cache"""
+
+    def test_similar_question_reuses_answer(self):
+        """A question above the similarity threshold gets the cached answer"""
+        cache = AnswerCache(max_entries=10, threshold=0.95, ttl_seconds=0)
+        cache.store([1.0, 0.0, 0.1], 'gen-1@1', 'You need a death certificate.')
+
+        assert cache.lookup([1.0, 0.01, 0.1], 'gen-1@1') == 'You need a death certificate.'
+        assert cache.lookup([0.0, 1.0, 0.0], 'gen-1@1') is None
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses']) == (1, 1)
+
+    def test_new_index_generation_drops_answers(self):
+        """Answers are never served from a superseded index"""
+        cache = AnswerCache(max_entries=10, threshold=0.9, ttl_seconds=0)
+        cache.store([1.0, 0.0], 'gen-1@1', 'old answer')
+
+        assert cache.lookup([1.0, 0.0], 'gen-2@5') is None
+        assert cache.stats()['entries'] == 0
+        assert cache.stats()['invalidations'] == 1
+
+    def test_answer_from_a_superseded_index_is_not_stored(self):
+        """An answer generated while ingestion published a new index is discarded"""
+        cache = AnswerCache(max_entries=10, threshold=0.9, ttl_seconds=0)
+        cache.lookup([1.0, 0.0], 'gen-2@5')
+        cache.store([1.0, 0.0], 'gen-1@1', 'stale answer')
+
+        assert cache.lookup([1.0, 0.0], 'gen-2@5') is None
+
+    def test_answers_expire(self):
+        clock = FakeClock()
+        cache = AnswerCache(max_entries=10, threshold=0.9, ttl_seconds=60, clock=clock)
+        cache.store([1.0, 0.0], 'gen-1@1', 'answer')
+        clock.now = 61
+
+        assert cache.lookup([1.0, 0.0], 'gen-1@1') is None
+
+    def test_oldest_answer_is_dropped_when_full(self):
+        cache = AnswerCache(max_entries=1, threshold=0.9, ttl_seconds=0)
+        cache.store([1.0, 0.0], 'g', 'first')
+        cache.store([0.0, 1.0], 'g', 'second')
+
+        assert cache.lookup([1.0, 0.0], 'g') is None
+        assert cache.lookup([0.0, 1.0], 'g') == 'second'
+
+    def test_different_amounts_or_negation_miss(self):
+        """Near-identical embeddings are not enough when the exact terms differ"""
+        cache = AnswerCache(max_entries=10, threshold=0.9, ttl_seconds=0)
+        cache.store([1.0, 0.0], 'g', 'Yes, up to £500.', question='Can I get £500 for the funeral?')
+        cache.store([1.0, 0.01], 'g', 'You are eligible.', question='Am I eligible for Pension Credit?')
+
+        assert cache.lookup([1.0, 0.0], 'g', question='Can I get £700 for the funeral?') is None
+        assert cache.lookup([1.0, 0.01], 'g', question='Am I not eligible for Pension Credit?') is None
+        assert cache.lookup([1.0, 0.01], 'g', question='Am I eligible for Universal Credit?') is None
+        assert cache.lookup([1.0, 0.0], 'g', question='can i get £500 for a funeral') == 'Yes, up to £500.'
+        assert cache.lookup([1.0, 0.0], 'g', question='Am I eligible for Pension Credit?') == 'You are eligible.'
+
+    def test_answer_terms(self):
+        assert answer_terms("I don't live within 50 miles") == {"don't", '50'}
+        assert answer_terms('Who is eligible?') == set()
+        assert answer_terms(None) == set()
@@ -0,0 +1,170 @@
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from query_router import DEFAULT_EXAMPLES, ROUTE_GENERAL, ROUTE_POLICY, ROUTE_WEB, QueryRouter, llm_route
+
+
+class TopicEmbeddings:
+    """Offline embeddings with one dimension per topic word"""
+
+    model = 'router-test-model'
+    TOPICS = ('funeral', 'weather', 'hello')
+
+    def __init__(self):
+        self.document_calls = 0
+        self.queries = 0
+
+    def _vector(self, text):
+        text = text.lower()
+        return [float(text.count(topic)) for topic in self.TOPICS] + [0.01]
+
+    def embed_documents(self, texts):
+        self.document_calls += 1
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self._vector(text)
+
+
+class CompressedEmbeddings(TopicEmbeddings):
+    """Topic embeddings with a shared direction and noise, so related texts score
+    well below 0.75 as with a small local model"""
+
+    model = 'compressed-test-model'
+
+    def _vector(self, text):
+        noise = np.random.default_rng(zlib.crc32(text.encode())).standard_normal(8) * 0.25
+        topics = [float(topic in text.lower()) for topic in self.TOPICS]
+        return [0.7 * value for value in topics + [1.0]] + list(noise)
+
+
+EXAMPLES = {
+    ROUTE_POLICY: ['funeral payment rules', 'who gets a funeral payment'],
+    ROUTE_WEB: ['weather today', 'weather tomorrow'],
+    ROUTE_GENERAL: ['hello there', 'hello'],
+}
+
+MORE_EXAMPLES = {
+    ROUTE_POLICY: ['funeral payment rules', 'who gets a funeral payment', 'funeral costs help', 'claim for a funeral'],
+    ROUTE_WEB: ['weather today', 'weather tomorrow', 'weather in leeds', 'is the weather nice'],
+    ROUTE_GENERAL: ['hello there', 'hello', 'hello again', 'well hello'],
+}
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return FakeMessage(self.reply)
+
+
+class TestQueryRouter:
+    """Tests for routing chat questions by embedding similarity"""
+
+    def test_routes_to_nearest_centroid_without_fallback(self):
+        calls = []
+        router = QueryRouter(TopicEmbeddings(), EXAMPLES, min_similarity=0.75, margin=0.02,
+                             fallback=lambda q: calls.append(q) or ROUTE_WEB)
+
+        assert router.route('Can I get a funeral payment?').route == ROUTE_POLICY
+        assert router.route('Will the weather be dry?').route == ROUTE_WEB
+        assert router.route('hello!').route == ROUTE_GENERAL
+        assert calls == []
+
+    def test_centroids_are_embedded_once(self):
+        embeddings = TopicEmbeddings()
+        router = QueryRouter(embeddings, EXAMPLES)
+
+        router.route('funeral')
+        router.route('weather')
+
+        assert embeddings.document_calls == 1
+
+    def test_precomputed_query_vector_is_reused(self):
+        embeddings = TopicEmbeddings()
+        router = QueryRouter(embeddings, EXAMPLES)
+
+        router.route('funeral costs', query_vector=embeddings._vector('funeral costs'))
+
+        assert embeddings.queries == 0
+
+    def test_unsure_decision_asks_fallback(self):
+        """A question equally close to two routes is settled by the fallback"""
+        router = QueryRouter(TopicEmbeddings(), EXAMPLES, fallback=lambda q: ROUTE_WEB)
+
+        decision = router.route('funeral in this weather')
+
+        assert (decision.route, decision.source) == (ROUTE_WEB, 'fallback')
+        assert router.stats()['fallbacks'] == 1
+
+    def test_unusable_fallback_keeps_embedding_route(self):
+        router = QueryRouter(TopicEmbeddings(), EXAMPLES, min_similarity=1.1, fallback=lambda q: None)
+
+        decision = router.route('funeral')
+
+        assert (decision.route, decision.source) == (ROUTE_POLICY, 'embedding')
+
+    def test_thresholds_are_calibrated_to_the_model(self):
+        """With a model that scores related texts lower, fixed OpenAI-scale
+        thresholds send clear questions to the fallback; calibrated ones do not"""
+        questions = ['Can I get a funeral payment?', 'Will the weather be dry?', 'hello!']
+        fixed_calls, calls = [], []
+        fixed = QueryRouter(CompressedEmbeddings(), MORE_EXAMPLES, min_similarity=0.75, margin=0.02,
+                            fallback=lambda q: fixed_calls.append(q))
+        router = QueryRouter(CompressedEmbeddings(), MORE_EXAMPLES, fallback=lambda q: calls.append(q))
+
+        assert [fixed.route(q).route for q in questions] == [ROUTE_POLICY, ROUTE_WEB, ROUTE_GENERAL]
+        assert [router.route(q).route for q in questions] == [ROUTE_POLICY, ROUTE_WEB, ROUTE_GENERAL]
+        assert len(fixed_calls) == 2
+        assert calls == []
+        assert router.stats()['calibrated'] is True
+        assert router.min_similarity < 0.75
+
+        router.route('funeral in this weather')
+        assert calls == ['funeral in this weather']
+
+    def test_explicit_thresholds_are_not_calibrated(self):
+        router = QueryRouter(CompressedEmbeddings(), MORE_EXAMPLES, min_similarity=0.5, margin=0.1)
+        router.route('hello')
+
+        assert (router.min_similarity, router.margin, router.stats()['calibrated']) == (0.5, 0.1, False)
+
+    def test_calibration_with_the_local_model(self):
+        """The default examples with the local MiniLM model route clear questions without the LLM"""
+        pytest.importorskip('sentence_transformers')
+        from embedding_providers import LocalEmbeddings
+
+        calls = []
+        router = QueryRouter(LocalEmbeddings(), DEFAULT_EXAMPLES, fallback=lambda q: calls.append(q))
+        decisions = [router.route(q).route for q in ('Am I eligible for a Funeral Expenses Payment?',
+                                                     'What is the weather in Manchester today?',
+                                                     'Hello there')]
+
+        assert decisions == [ROUTE_POLICY, ROUTE_WEB, ROUTE_GENERAL]
+        assert router.min_similarity < 0.75
+        assert len(calls) <= 1
+
+
+class TestLLMRoute:
+    """Tests for parsing the LLM's routing reply"""
+
+    def test_reply_is_parsed(self):
+        assert llm_route(FakeLLM('Policy'), 'q') == ROUTE_POLICY
+        assert llm_route(FakeLLM('Category: web.'), 'q') == ROUTE_WEB
+
+    def test_unrecognised_reply_gives_none(self):
+        assert llm_route(FakeLLM('not sure'), 'q') is None
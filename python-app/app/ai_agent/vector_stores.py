@@ -0,0 +1,465 @@
+"""Vector index engines behind a common interface.
+
+INDEX_ENGINE selects how a generation's vectors are stored:
+
+    chroma   a Chroma collection (HNSW + SQLite), the default
+    flat     a vector matrix in a memory-mapped .npy file plus a JSON sidecar
+             holding chunk IDs, text and metadata; search is a dot product
+
+Both engines are LangChain vector stores and add the operations ingestion and
+retrieval need: upsert(), count(), query_by_vector(), query_by_vectors() and
+flush(). For a corpus of a few thousand chunks the flat engine is exact,
+opens with a zero-copy mmap and needs no SQLite.
+
+The flat engine can also store compact vectors: scalar-quantised int8 rows
+(FLAT_INDEX_DTYPE), fewer dimensions (FLAT_INDEX_DIMENSIONS, by truncation or
+random projection) and an optional re-rank of the top candidates against the
+full float32 vectors (FLAT_INDEX_RERANK). These settings apply when a
+generation is created; an existing generation keeps the format it was built
+with. `python index_benchmark.py` measures their recall, size and latency.
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+INDEX_ENGINE = os.getenv("INDEX_ENGINE", "chroma").lower()
+ENGINES = ('chroma', 'flat')
+
+# Storage of new flat indexes: "float32", or "int8" for scalar quantisation (4x smaller)
+FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "float32").lower()
+# Dimensions stored per vector (0 = all of them)
+FLAT_INDEX_DIMENSIONS = int(os.getenv("FLAT_INDEX_DIMENSIONS", "0"))
+# "truncate" keeps the leading dimensions (suits Matryoshka models such as
+# text-embedding-3-*); "project" applies a fixed random projection
+FLAT_INDEX_REDUCTION = os.getenv("FLAT_INDEX_REDUCTION", "truncate").lower()
+# Top candidates re-scored with full float32 vectors (0 = none; full vectors are then not kept)
+FLAT_INDEX_RERANK = int(os.getenv("FLAT_INDEX_RERANK", "0"))
+
+FLAT_DTYPES = ('float32', 'int8')
+FLAT_REDUCTIONS = ('truncate', 'project')
+FLAT_VECTORS_NAME = "flat_vectors.npy"
+FLAT_SCALES_NAME = "flat_scales.npy"
+FLAT_FULL_VECTORS_NAME = "flat_vectors_full.npy"
+FLAT_PROJECTION_NAME = "flat_projection.npy"
+FLAT_CHUNKS_NAME = "flat_chunks.json"
+# Seed of the random projection, so every generation projects identically
+PROJECTION_SEED = 0
+# Rows dequantised at a time when scoring an int8 index
+SCORE_BLOCK_ROWS = 8192
+
+
+def detect_engine(index_dir):
+    """Engine of the index stored in index_dir, or None if there is none."""
+    if os.path.exists(os.path.join(index_dir, FLAT_CHUNKS_NAME)):
+        return 'flat'
+    if os.path.exists(os.path.join(index_dir, "chroma.sqlite3")):
+        return 'chroma'
+    return None
+
+def open_index(index_dir, embeddings, engine=None):
+    """Open (or create) the index in index_dir with the given engine."""
+    engine = engine or INDEX_ENGINE
+    if engine == 'flat':
+        return FlatIndex(index_dir, embeddings)
+    if engine == 'chroma':
+        return ChromaIndex(persist_directory=index_dir, embedding_function=embeddings)
+    raise ValueError(f"Unknown INDEX_ENGINE '{engine}'; expected one of {', '.join(ENGINES)}")
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def _top_k(scores, k):
+    """Indices of the k highest scores, best first; ties go to the lower index."""
+    k = min(k, len(scores))
+    threshold = -np.partition(-scores, k - 1)[k - 1]
+    better = np.flatnonzero(scores > threshold)
+    tied = np.flatnonzero(scores == threshold)[:k - len(better)]
+    candidates = np.concatenate([better, tied])
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+def _writable(array):
+    # Mapped files are read-only; take a private copy on the first write
+    return np.array(array) if isinstance(array, np.memmap) else array
+
+
+class ChromaIndex(Chroma):
+    """Chroma vector store with the engine-neutral operations used by ingestion."""
+
+    engine = 'chroma'
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def count(self):
+        return self._collection.count()
+
+    def query_by_vector(self, vector, k):
+        """Return up to k (Document, score) pairs, best first; higher scores are better."""
+        n_results = min(k, self.count())
+        if n_results == 0:
+            return []
+        result = self._collection.query(query_embeddings=[vector], n_results=n_results,
+                                        include=['documents', 'metadatas', 'distances'])
+        return [(Document(page_content=text, metadata=metadata or {}, id=doc_id), -distance)
+                for doc_id, text, metadata, distance in zip(result['ids'][0], result['documents'][0],
+                                                            result['metadatas'][0], result['distances'][0])]
+
+    def query_by_vectors(self, vectors, k):
+        """query_by_vector for several vectors in one collection query."""
+        n_results = min(k, self.count())
+        if n_results == 0 or not vectors:
+            return [[] for _ in vectors]
+        result = self._collection.query(query_embeddings=list(vectors), n_results=n_results,
+                                        include=['documents', 'metadatas', 'distances'])
+        return [[(Document(page_content=text, metadata=metadata or {}, id=doc_id), -distance)
+                 for doc_id, text, metadata, distance in zip(*columns)]
+                for columns in zip(result['ids'], result['documents'], result['metadatas'], result['distances'])]
+
+    def flush(self):
+        """Chroma persists every write itself."""
+
+
+class FlatIndex(VectorStore):
+    """Cosine-similarity index over a memory-mapped vector matrix.
+
+    Vectors are stored normalised, so a query is one matrix product followed
+    by `argpartition` for the top k. With the default float32 format the
+    search is exact. An int8 index stores each row scaled to [-127, 127] plus
+    one float scale per row. The query stays float32, so only the stored side
+    is approximated.
+
+    Changes are kept in memory and written by flush(). New rows are staged
+    per upsert and joined into the matrix once, at the next flush or query,
+    so streaming a rebuild in windows does not copy the matrix per window.
+    Each file is replaced atomically, and readers that already mapped the
+    old file keep a consistent view. An instance with no pending changes
+    maps the files again when another process rewrites them.
+    """
+
+    engine = 'flat'
+
+    def __init__(self, index_dir, embeddings, dtype=None, dimensions=None, reduction=None, rerank=None):
+        self.index_dir = index_dir
+        self._embeddings = embeddings
+        self.rerank = FLAT_INDEX_RERANK if rerank is None else rerank
+        self._requested = {
+            'dtype': (dtype or FLAT_INDEX_DTYPE).lower(),
+            'dimensions': FLAT_INDEX_DIMENSIONS if dimensions is None else dimensions,
+            'reduction': (reduction or FLAT_INDEX_REDUCTION).lower(),
+            'full_vectors': self.rerank > 0
+        }
+        if self._requested['dtype'] not in FLAT_DTYPES:
+            raise ValueError(f"Unknown FLAT_INDEX_DTYPE '{self._requested['dtype']}'; "
+                             f"expected one of {', '.join(FLAT_DTYPES)}")
+        if self._requested['reduction'] not in FLAT_REDUCTIONS:
+            raise ValueError(f"Unknown FLAT_INDEX_REDUCTION '{self._requested['reduction']}'; "
+                             f"expected one of {', '.join(FLAT_REDUCTIONS)}")
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._staged = []  # (rows, scales, full vectors) appended since the matrix was last joined
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    @property
+    def format(self):
+        """Storage format of this index, or None before the first vector is added."""
+        return dict(self._format) if self._format else None
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _chunks_signature(self):
+        """Identity of the chunks file on disk; it changes whenever flush() replaces it."""
+        try:
+            stat = os.stat(self._path(FLAT_CHUNKS_NAME))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        self._matrix = self._scales = self._full = self._projection = None
+        self._format = None
+        self._staged = []
+        self._signature = self._chunks_signature()
+        if self._signature is None:
+            self._ids, self._documents, self._metadatas = [], [], []
+        else:
+            with open(self._path(FLAT_CHUNKS_NAME), 'r', encoding='utf-8') as f:
+                chunks = json.load(f)
+            self._ids = chunks['ids']
+            self._documents = chunks['documents']
+            self._metadatas = chunks['metadatas']
+            self._format = chunks.get('format')
+            if self._ids:
+                self._matrix = np.load(self._path(FLAT_VECTORS_NAME), mmap_mode='r')
+                if self._format is None:
+                    # Written before formats were recorded: plain float32 rows
+                    dims = self._matrix.shape[1]
+                    self._format = {'dtype': 'float32', 'dimensions': dims, 'input_dimensions': dims,
+                                    'reduction': 'truncate', 'full_vectors': False}
+                if self._format['dtype'] == 'int8':
+                    self._scales = np.load(self._path(FLAT_SCALES_NAME), mmap_mode='r')
+                if self._format['full_vectors']:
+                    self._full = np.load(self._path(FLAT_FULL_VECTORS_NAME), mmap_mode='r')
+                if self._matrix.shape[0] != len(self._ids):
+                    raise ValueError(f"Flat index at {self.index_dir} is inconsistent: "
+                                     f"{self._matrix.shape[0]} vectors for {len(self._ids)} chunks")
+            if self._format is not None and self._reduces_by_projection():
+                self._projection = np.load(self._path(FLAT_PROJECTION_NAME))
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+
+    def _refresh(self):
+        """Join staged rows into the matrix, or re-map the files if another process rewrote them.
+
+        Call with the lock held.
+        """
+        if self._staged:
+            parts = list(zip(*self._staged))
+            self._matrix = np.concatenate([self._matrix, *parts[0]])
+            if self._scales is not None:
+                self._scales = np.concatenate([self._scales, *parts[1]])
+            if self._full is not None:
+                self._full = np.concatenate([self._full, *parts[2]])
+            self._staged = []
+        elif not self._dirty and self._chunks_signature() != self._signature:
+            self._load()
+            logging.info(f"[FLAT-INDEX] Reloaded {len(self._ids)} vectors written by another process to {self.index_dir}")
+
+    def _reduces_by_projection(self):
+        return self._format['reduction'] == 'project' and self._format['dimensions'] < self._format['input_dimensions']
+
+    def _new_format(self, input_dimensions):
+        requested = self._requested['dimensions']
+        dimensions = requested if 0 < requested < input_dimensions else input_dimensions
+        self._format = dict(self._requested, dimensions=dimensions, input_dimensions=input_dimensions)
+        if self._reduces_by_projection():
+            rng = np.random.default_rng(PROJECTION_SEED)
+            self._projection = (rng.standard_normal((input_dimensions, dimensions)) /
+                                np.sqrt(dimensions)).astype(np.float32)
+
+    def _reduce(self, vectors):
+        """Unit vectors in the stored dimensionality."""
+        dimensions = self._format['dimensions']
+        if dimensions == self._format['input_dimensions']:
+            return vectors
+        if self._projection is not None:
+            return _unit(vectors @ self._projection)
+        return _unit(vectors[:, :dimensions])
+
+    def _encode(self, vectors):
+        """(stored rows, per-row scales or None) for unit vectors."""
+        reduced = self._reduce(vectors)
+        if self._format['dtype'] != 'int8':
+            return reduced, None
+        scales = np.abs(reduced).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(reduced / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _scores(self, queries, matrix, scales):
+        """Approximate cosine similarity of each unit query to each stored row."""
+        reduced = self._reduce(queries)
+        if scales is None:
+            return reduced @ matrix.T
+        scores = np.empty((len(reduced), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = reduced @ block.T
+        return scores * scales
+
+    def memory_bytes(self):
+        """Bytes scanned by every query (stored rows and scales; full vectors are read only to re-rank)."""
+        with self._lock:
+            self._refresh()
+            return sum(array.nbytes for array in (self._matrix, self._scales) if array is not None)
+
+    def rerank_bytes(self):
+        """Bytes of the full float32 vectors kept for re-ranking (0 without rerank)."""
+        with self._lock:
+            self._refresh()
+            return self._full.nbytes if self._full is not None else 0
+
+    # --- Engine-neutral operations ---
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        vectors = _unit(embeddings)
+        with self._lock:
+            if not self._dirty:
+                self._refresh()
+            if self._format is None:
+                self._new_format(vectors.shape[1])
+            if vectors.shape[1] != self._format['input_dimensions']:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension "
+                                 f"{self._format['input_dimensions']}")
+            rows, scales = self._encode(vectors)
+            if self._matrix is None:
+                self._matrix = rows[:0]
+                self._scales = scales[:0] if scales is not None else None
+                self._full = vectors[:0] if self._format['full_vectors'] else None
+            positions = [self._positions.get(doc_id) for doc_id in ids]
+            updated = [row for row, position in enumerate(positions) if position is not None]
+            if updated:
+                if any(positions[row] >= len(self._matrix) for row in updated):
+                    # Replacing a row that is still staged
+                    self._refresh()
+                self._matrix = _writable(self._matrix)
+                self._scales = _writable(self._scales) if self._scales is not None else None
+                self._full = _writable(self._full) if self._full is not None else None
+            appended = []
+            for row, (doc_id, text, metadata) in enumerate(zip(ids, documents, metadatas)):
+                position = positions[row]
+                if position is None:
+                    self._positions[doc_id] = len(self._ids)
+                    self._ids.append(doc_id)
+                    self._documents.append(text)
+                    self._metadatas.append(metadata or {})
+                    appended.append(row)
+                else:
+                    self._matrix[position] = rows[row]
+                    if self._scales is not None:
+                        self._scales[position] = scales[row]
+                    if self._full is not None:
+                        self._full[position] = vectors[row]
+                    self._documents[position] = text
+                    self._metadatas[position] = metadata or {}
+            if appended:
+                self._staged.append((rows[appended], scales[appended] if scales is not None else None,
+                                     vectors[appended] if self._full is not None else None))
+            self._dirty = True
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._ids)
+
+    def query_by_vector(self, vector, k):
+        """Return up to k (Document, score) pairs, best first; scores are cosine similarities."""
+        return self.query_by_vectors([vector], k)[0]
+
+    def query_by_vectors(self, vectors, k):
+        """query_by_vector for several vectors with one matrix product.
+
+        With re-ranking, the best `rerank` candidates by stored-vector score
+        are re-scored exactly against the full float32 vectors.
+        """
+        with self._lock:
+            self._refresh()
+            matrix, scales, full = self._matrix, self._scales, self._full
+            ids, documents, metadatas = self._ids, self._documents, self._metadatas
+        if matrix is None or not len(ids) or k <= 0 or not len(vectors):
+            return [[] for _ in vectors]
+        queries = _unit(vectors)
+        scores = self._scores(queries, matrix, scales)
+        rerank = full is not None and self.rerank > 0
+        results = []
+        for query, row in zip(queries, scores):
+            candidates = _top_k(row, max(k, self.rerank) if rerank else k)
+            candidate_scores = row[candidates]
+            if rerank:
+                candidate_scores = np.asarray(full[np.sort(candidates)], dtype=np.float32) @ query
+                candidates = np.sort(candidates)
+                order = _top_k(candidate_scores, k)
+                candidates, candidate_scores = candidates[order], candidate_scores[order]
+            results.append([(Document(page_content=documents[i], metadata=dict(metadatas[i]), id=ids[i]),
+                             float(score)) for i, score in zip(candidates, candidate_scores)])
+        return results
+
+    def flush(self):
+        """Write pending changes; the vector files are mapped again afterwards."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._refresh()
+            os.makedirs(self.index_dir, exist_ok=True)
+            arrays = {FLAT_VECTORS_NAME: self._matrix, FLAT_SCALES_NAME: self._scales,
+                      FLAT_FULL_VECTORS_NAME: self._full, FLAT_PROJECTION_NAME: self._projection}
+            for name, array in arrays.items():
+                if array is not None:
+                    with open(self._path(name) + ".tmp", 'wb') as f:
+                        np.save(f, np.ascontiguousarray(array))
+                    os.replace(self._path(name) + ".tmp", self._path(name))
+            chunks_path = self._path(FLAT_CHUNKS_NAME)
+            with open(chunks_path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump({'ids': self._ids, 'documents': self._documents, 'metadatas': self._metadatas,
+                           'format': self._format}, f)
+            os.replace(chunks_path + ".tmp", chunks_path)
+            self._dirty = False
+            self._load()
+            logging.info(f"[FLAT-INDEX] Wrote {len(self._ids)} vectors to {self.index_dir}")
+
+    # --- LangChain VectorStore interface ---
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in texts]
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        self.upsert(ids, self._embeddings.embed_documents(texts), texts, metadatas)
+        self.flush()
+        return ids
+
+    def get(self, ids=None, where=None, include=None, **kwargs):
+        """Chroma-style get: filter by ids and/or metadata equality (`where`)."""
+        include = ['documents', 'metadatas'] if include is None else include
+        with self._lock:
+            if not self._dirty:
+                self._refresh()
+            positions = range(len(self._ids)) if ids is None else \
+                [self._positions[i] for i in ids if i in self._positions]
+            if where:
+                positions = [p for p in positions
+                             if all(self._metadatas[p].get(key) == value for key, value in where.items())]
+            positions = list(positions)
+            return {
+                'ids': [self._ids[p] for p in positions],
+                'documents': [self._documents[p] for p in positions] if 'documents' in include else None,
+                'metadatas': [self._metadatas[p] for p in positions] if 'metadatas' in include else None
+            }
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return
+        with self._lock:
+            drop = {self._positions[i] for i in ids if i in self._positions}
+            if not drop:
+                return
+            self._refresh()
+            keep = [p for p in range(len(self._ids)) if p not in drop]
+            self._matrix = np.array(self._matrix[keep])
+            if self._scales is not None:
+                self._scales = np.array(self._scales[keep])
+            if self._full is not None:
+                self._full = np.array(self._full[keep])
+            self._ids = [self._ids[p] for p in keep]
+            self._documents = [self._documents[p] for p in keep]
+            self._metadatas = [self._metadatas[p] for p in keep]
+            self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+            self._dirty = True
+        self.flush()
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.query_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.query_by_vector(self._embeddings.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self._embeddings.embed_query(query), k)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, index_dir=None, ids=None, **kwargs):
+        if index_dir is None:
+            raise ValueError("FlatIndex.from_texts requires index_dir")
+        index = cls(index_dir, embedding)
+        index.add_texts(texts, metadatas=metadatas, ids=ids)
+        return index